@@ -0,0 +1,88 @@
+"""
+Compare the inference latency of a YOLO model across the CPU backends on recorded frames.
+
+Usage (from the dashboard-app directory):
+    python -m benchmarks.backends --model yolov8n --video ../smartcam-demo.mp4 --frames 100
+"""
+import argparse
+import json
+import time
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from logic.model_backends import ModelBackend, load_model
+
+
+def read_frames(video_path: str, frame_count: int, width: int, height: int) -> list[np.ndarray]:
+    video_capture = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < frame_count:
+        ret, frame = video_capture.read()
+        if ret is False or frame is None:
+            break
+        frames.append(cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA))
+    video_capture.release()
+    return frames
+
+
+def benchmark_backend(model_name: str, backend: ModelBackend, frames: list[np.ndarray], imgsz: int,
+                      warmup: int) -> dict:
+    load_start = time.perf_counter()
+    model = load_model(model_name=model_name, backend=backend, imgsz=imgsz)
+    load_time = time.perf_counter() - load_start
+    for frame in frames[:warmup]:
+        model.predict(source=frame, imgsz=imgsz, verbose=False)
+    latencies = []
+    for frame in frames:
+        start_time = time.perf_counter()
+        model.predict(source=frame, imgsz=imgsz, verbose=False)
+        latencies.append(time.perf_counter() - start_time)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "backend": backend.name,
+        "load_seconds": round(load_time, 3),
+        "frames": len(latencies),
+        "mean_ms": round(float(latencies_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        "fps": round(float(1000 / latencies_ms.mean()), 2),
+    }
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Compare YOLO inference latency across CPU backends")
+    parser.add_argument("--model", required=True, help="model name in the models directory (e.g. yolov8n)")
+    parser.add_argument("--video", default="../smartcam-demo.mp4", help="recorded video to take the frames from")
+    parser.add_argument("--frames", type=int, default=100, help="number of frames to run through each backend")
+    parser.add_argument("--warmup", type=int, default=5, help="untimed frames before measuring")
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--imgsz", type=int, default=640, help="YOLO input size")
+    parser.add_argument("--backends", nargs="+", default=[backend.name for backend in ModelBackend],
+                        choices=[backend.name for backend in ModelBackend])
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args(arguments)
+
+    frames = read_frames(args.video, frame_count=args.frames, width=args.width, height=args.height)
+    if len(frames) == 0:
+        parser.error(f"couldn't read any frames from {args.video}")
+
+    results = []
+    for backend_name in args.backends:
+        try:
+            result = benchmark_backend(args.model, ModelBackend[backend_name], frames, imgsz=args.imgsz,
+                                       warmup=args.warmup)
+        except Exception as e:  # a missing export dependency (e.g. openvino) shouldn't stop the other backends
+            result = {"backend": backend_name, "error": f"{type(e).__name__}: {e}"}
+        results.append(result)
+        print(result)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump({"model": args.model, "imgsz": args.imgsz, "results": results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
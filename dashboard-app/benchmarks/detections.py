@@ -0,0 +1,158 @@
+"""
+Compare the per-frame cost of picking the target with the old row-by-row dataclass code and with the array-backed
+`Detection` view used by CamController, at 1, 10 and 100 detections.
+
+For each size it reports the time per frame, the number of Python objects created per frame (counted with a profile
+hook, so the counting pass is not timed) and the peak memory allocated while handling one frame.
+
+Usage (from the dashboard-app directory):
+    python -m benchmarks.detections --frames 2000 --output detections.json
+"""
+import argparse
+import json
+import math
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+from supervision import Detections
+
+from core import Esp32Bridge
+from core.cam_controller import CamController
+
+FRAME_WIDTH, FRAME_HEIGHT = 800, 600
+
+
+@dataclass(frozen=True)
+class LegacyCoordinate:
+    x: int
+    y: int
+
+    def distance_to(self, other_coordinate: "LegacyCoordinate") -> int:
+        distance = math.sqrt((other_coordinate.x - self.x) ** 2 + (other_coordinate.y - self.y) ** 2)
+        return abs(int(distance))
+
+    @staticmethod
+    def of_center(bounding_box: np.ndarray) -> "LegacyCoordinate":
+        return LegacyCoordinate(int((bounding_box[0] + bounding_box[2]) / 2), int((bounding_box[1] + bounding_box[3]) / 2))
+
+
+@dataclass(frozen=True)
+class LegacyDetection:
+    org_detections: Detections
+    xyxy: np.ndarray
+    center: LegacyCoordinate
+    mask: Optional[np.ndarray] = None
+    confidence: Optional[np.ndarray] = None
+    class_id: Optional[np.ndarray] = None
+    tracker_id: Optional[np.ndarray] = None
+
+
+def legacy_closest_detection(detections: Detections, center: LegacyCoordinate) -> Optional[LegacyDetection]:
+    """ The target selection as CamController did it before, one row (and one dataclass) at a time """
+    detection = None
+    shortest_distance = None
+    for row in detections:
+        xyxy, mask, confidence, class_id, tracker_id = row[:5]  # newer supervision versions also yield `data`
+        detection_center = LegacyCoordinate.of_center(xyxy)
+        distance = center.distance_to(detection_center)
+        if shortest_distance is None or distance < shortest_distance:
+            detection = LegacyDetection(org_detections=detections, xyxy=xyxy, center=detection_center, mask=mask,
+                                        confidence=confidence, class_id=class_id, tracker_id=tracker_id)
+            shortest_distance = distance
+    return detection
+
+
+def make_detections(count: int, generator: np.random.Generator) -> Detections:
+    top_left = generator.uniform(0, (FRAME_WIDTH - 100, FRAME_HEIGHT - 200), size=(count, 2))
+    size = generator.uniform((30, 80), (100, 200), size=(count, 2))
+    return Detections(
+        xyxy=np.hstack([top_left, top_left + size]).astype(np.float32),
+        confidence=generator.uniform(0.3, 1.0, size=count).astype(np.float32),
+        class_id=np.zeros(count, dtype=int),
+        tracker_id=np.arange(1, count + 1),
+    )
+
+
+def count_objects(function: Callable, frames: list[Detections]) -> float:
+    """ Average number of objects constructed (`__init__`/`__new__` calls of Python classes) per frame """
+    calls = 0
+
+    def profile(frame, event, argument):
+        nonlocal calls
+        if event == "call" and frame.f_code.co_name in ("__init__", "__new__"):
+            calls += 1
+
+    sys.setprofile(profile)
+    try:
+        for detections in frames:
+            function(detections)
+    finally:
+        sys.setprofile(None)
+    return calls / len(frames)
+
+
+def peak_bytes(function: Callable, frames: list[Detections]) -> float:
+    """ Average peak of the memory allocated while handling a single frame """
+    peaks = []
+    tracemalloc.start()
+    try:
+        for detections in frames:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            function(detections)
+            peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+    return float(np.mean(peaks))
+
+
+def time_per_frame(function: Callable, frames: list[Detections]) -> float:
+    start_time = time.perf_counter()
+    for detections in frames:
+        function(detections)
+    return (time.perf_counter() - start_time) / len(frames)
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Microbenchmark of the target selection per frame")
+    parser.add_argument("--frames", type=int, default=2000, help="number of frames per detection count")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1, 10, 100], help="detections per frame")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args(arguments)
+
+    esp32_bridge = Esp32Bridge()
+    esp32_bridge.connect(ip_address="0")  # test mode, servo commands are mocked
+    cam_controller = CamController(width=FRAME_WIDTH, height=FRAME_HEIGHT, esp32_bridge=esp32_bridge)
+    legacy_center = LegacyCoordinate(x=cam_controller.center_x, y=cam_controller.center_y)
+
+    def legacy(detections: Detections):
+        return legacy_closest_detection(detections, legacy_center).center
+
+    def current(detections: Detections):
+        return cam_controller._get_closest_detection(detections).center
+
+    generator = np.random.default_rng(0)
+    results = []
+    for count in args.counts:
+        frames = [make_detections(count, generator) for _ in range(args.frames)]
+        for name, function in (("legacy", legacy), ("current", current)):
+            function(frames[0])  # warm up
+            results.append({
+                "detections": count,
+                "implementation": name,
+                "us_per_frame": round(time_per_frame(function, frames) * 1e6, 2),
+                "objects_per_frame": round(count_objects(function, frames), 2),
+                "peak_bytes_per_frame": round(peak_bytes(function, frames[:200]), 1),
+            })
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
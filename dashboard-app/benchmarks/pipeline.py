@@ -0,0 +1,176 @@
+"""
+Replay a recorded video through VideoHandler and CamController (with the Esp32Bridge in test mode) and measure the
+latency of every stage, the end-to-end FPS and the peak memory.
+
+Usage (from the dashboard-app directory):
+    python -m benchmarks.pipeline --video ../smartcam-demo.mp4 --model yolov8n --output results.json
+    python -m benchmarks.pipeline --video recording.mjpeg --frame-size UXGA --encoder PNG
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Iterator, Optional
+
+import cv2
+import numpy as np
+
+from common import FramePacket, FrameSize, MjpegFrame
+from core import Esp32Bridge
+from logic import VideoHandler
+from logic.frame_encoder import ImageFormat
+from logic.model_backends import ModelBackend
+
+STAGES = ("decode", "inference", "tracking", "control", "annotate", "encode")
+
+
+def read_mjpeg_frames(path: str) -> Iterator[MjpegFrame]:
+    """ Split a recorded MJPEG file (raw concatenated JPEGs or a multipart dump) into its JPEG frames """
+    # a JPEG ends at the first EOI marker, which holds for the ESP32 camera (it doesn't embed thumbnails)
+    with open(path, "rb") as file:
+        data = file.read()
+    start = data.find(b"\xff\xd8")
+    while start != -1:
+        end = data.find(b"\xff\xd9", start)
+        if end == -1:
+            break
+        yield MjpegFrame(jpeg=data[start:end + 2], arrival_time=time.monotonic())
+        start = data.find(b"\xff\xd8", end + 2)
+
+
+def read_video_frames(path: str, frame_size: FrameSize) -> Iterator[np.ndarray]:
+    video_capture = cv2.VideoCapture(path)
+    while True:
+        ret, frame = video_capture.read()
+        if ret is False or frame is None:
+            break
+        if (frame.shape[1], frame.shape[0]) != (frame_size.width, frame_size.height):
+            frame = cv2.resize(frame, (frame_size.width, frame_size.height), interpolation=cv2.INTER_AREA)
+        yield frame
+    video_capture.release()
+
+
+def percentiles(samples: list[float]) -> Optional[dict]:
+    if len(samples) == 0:
+        return None
+    samples_ms = np.array(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean_ms": round(float(samples_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 3),
+        "p90_ms": round(float(np.percentile(samples_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 3),
+        "max_ms": round(float(samples_ms.max()), 3),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    """ Peak resident memory of this process, None where the `resource` module doesn't exist (Windows) """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)  # bytes on macOS, KB on Linux
+
+
+def inference_seconds(video_handler: VideoHandler) -> Optional[float]:
+    """ Time YOLO itself spent on the last frame (pre-process + inference + post-process), without the tracker """
+    results = getattr(getattr(video_handler.model, "predictor", None), "results", None)
+    if not results:
+        return None
+    return sum(results[0].speed.values()) / 1000
+
+
+def run(video_handler: VideoHandler, frames: Iterator, max_frames: int, decode_scale: int) -> dict:
+    timings = {stage: [] for stage in STAGES}
+    frames = iter(frames)
+    frame_count = 0
+    start_time = time.perf_counter()
+    for frame_id in range(max_frames):
+        stage_start = time.perf_counter()
+        source = next(frames, None)  # video files are decoded by cv2.VideoCapture while reading
+        if source is None:
+            break
+        if isinstance(source, MjpegFrame):
+            packet = FramePacket(frame_id=frame_id, capture_time=time.monotonic(), jpeg=source,
+                                 decode_scale=decode_scale)
+            packet.decoded()
+        else:
+            packet = FramePacket(frame_id=frame_id, capture_time=time.monotonic(), frame=source)
+        timings["decode"].append(time.perf_counter() - stage_start)
+
+        stage_start = time.perf_counter()
+        packet = video_handler.detect(packet)
+        detect_time = time.perf_counter() - stage_start
+        model_time = inference_seconds(video_handler) if packet.detections is not None else None
+        if model_time is not None and model_time <= detect_time:
+            timings["inference"].append(model_time)
+            timings["tracking"].append(detect_time - model_time)
+        else:
+            timings["inference"].append(detect_time)
+
+        for stage, handler in (("control", video_handler.control), ("annotate", video_handler.annotate),
+                               ("encode", video_handler.encode)):
+            stage_start = time.perf_counter()
+            packet = handler(packet)
+            timings[stage].append(time.perf_counter() - stage_start)
+            if packet is None:
+                break
+        frame_count += 1
+    total_time = time.perf_counter() - start_time
+    return {
+        "frames": frame_count,
+        "seconds": round(total_time, 3),
+        "fps": round(frame_count / total_time, 2) if total_time > 0 else None,
+        "stages": {stage: percentiles(samples) for stage, samples in timings.items()},
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the frame pipeline")
+    parser.add_argument("--video", default="../smartcam-demo.mp4", help="recorded video or MJPEG (.mjpeg/.mjpg) file")
+    parser.add_argument("--model", help="model name in the models directory (no inference when omitted)")
+    parser.add_argument("--backend", default=ModelBackend.PYTORCH.name, choices=[b.name for b in ModelBackend])
+    parser.add_argument("--frames", type=int, default=300, help="maximum number of frames to replay")
+    parser.add_argument("--frame-size", default=FrameSize.SVGA.name, choices=[size.name for size in FrameSize],
+                        help="resize video frames to this resolution (MJPEG frames keep their resolution)")
+    parser.add_argument("--decode-scale", type=int, default=1, choices=(1, 2, 4), help="MJPEG reduced-scale decode")
+    parser.add_argument("--encoder", default=ImageFormat.JPEG.name, choices=[f.name for f in ImageFormat])
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality of the GUI encoder")
+    parser.add_argument("--display-scale", type=float, default=1.0)
+    parser.add_argument("--adaptive-inference", action="store_true", help="enable the adaptive inference cadence")
+    parser.add_argument("--roi-inference", action="store_true", help="enable target ROI inference")
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args(arguments)
+
+    esp32_bridge = Esp32Bridge()
+    esp32_bridge.connect(ip_address="0")  # test mode, servo commands are mocked
+    esp32_bridge.auto_pan = esp32_bridge.auto_tilt = True
+    video_handler = VideoHandler(esp32_bridge=esp32_bridge)
+    video_handler.cam_controller.tracking_enabled = True
+    video_handler.decode_scale = args.decode_scale
+    video_handler.frame_encoder.image_format = ImageFormat[args.encoder]
+    video_handler.frame_encoder.quality = args.quality
+    video_handler.frame_encoder.display_scale = args.display_scale
+    video_handler.inference_cadence.enabled = args.adaptive_inference
+    video_handler.roi_inference.enabled = args.roi_inference
+    if args.model is not None:
+        video_handler.set_model(model_name=args.model, backend=ModelBackend[args.backend]).result()
+
+    frame_size = FrameSize[args.frame_size]
+    if args.video.lower().endswith((".mjpeg", ".mjpg")):
+        frames = read_mjpeg_frames(args.video)
+    else:
+        frames = read_video_frames(args.video, frame_size=frame_size)
+    results = run(video_handler, frames=frames, max_frames=args.frames, decode_scale=args.decode_scale)
+    results["config"] = {key: value for key, value in vars(args).items() if key != "output"}
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
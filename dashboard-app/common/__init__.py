@@ -1,5 +1,9 @@
+from common.clock import Clock, SimulatedClock
 from common.coordinate import Coordinate
 from common.detection import Detection
+from common.mjpeg_frame import MjpegFrame
+from common.frame_packet import FramePacket
 from common.frame_size import FrameSize
 from common.logger_interface import LoggerInterface
+from common.metrics import METRICS, MetricsRegistry
 from common.timer import Timer
@@ -0,0 +1,40 @@
+import time
+from typing import Callable, Optional
+
+
+class Clock:
+    """
+    The monotonic time source (seconds) used by the control loop: `Timer`, `Esp32Bridge` and the pan/tilt controller.
+
+    It reads `time.monotonic()` unless another source is installed with `Clock.use(...)`, which is how the tracking
+    simulator runs the control loop on simulated time.
+    """
+
+    source: Callable[[], float] = time.monotonic
+
+    @classmethod
+    def now(cls) -> float:
+        return cls.source()
+
+    @classmethod
+    def use(cls, source: Optional[Callable[[], float]]) -> None:
+        """ Install a time source, `None` restores `time.monotonic` """
+        cls.source = source if source is not None else time.monotonic
+
+
+class SimulatedClock:
+    """ A manually advanced clock, install it with `Clock.use(simulated_clock)` """
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+
+    def __call__(self) -> float:
+        return self.time
+
+    def advance(self, seconds: float) -> float:
+        self.time += max(seconds, 0.0)
+        return self.time
+
+    def advance_to(self, timestamp: float) -> float:
+        self.time = max(self.time, timestamp)
+        return self.time
@@ -1,19 +1,19 @@
 import math
-from dataclasses import dataclass
+from typing import NamedTuple
 
 import numpy as np
 
 
-@dataclass(frozen=True)
-class Coordinate:
+class Coordinate(NamedTuple):
+    """ An (x, y) pixel coordinate, a plain tuple so it is small and can be passed to OpenCV as is """
     x: int
     y: int
 
     def as_tuple(self) -> tuple[int, int]:
-        return self.x, self.y
+        return self
 
     def distance_to(self, other_coordinate: "Coordinate") -> int:  # euclidean distance
-        distance = math.sqrt((other_coordinate.x - self.x) ** 2 + (other_coordinate.y - self.y) ** 2)
+        distance = math.hypot(other_coordinate.x - self.x, other_coordinate.y - self.y)
         return abs(int(distance))
 
     @staticmethod
@@ -1,4 +1,3 @@
-from dataclasses import dataclass
 from typing import Optional
 
 import numpy as np
@@ -7,12 +6,54 @@ from supervision import Detections
 from common.coordinate import Coordinate
 
 
-@dataclass(frozen=True)
 class Detection:
-    org_detections: Detections
-    xyxy: np.ndarray
-    center: Coordinate
-    mask: Optional[np.ndarray] = None
-    confidence: Optional[np.ndarray] = None
-    class_id: Optional[np.ndarray] = None
-    tracker_id: Optional[np.ndarray] = None
+    """
+    A single detection, as a light view into one row of a supervision `Detections`.
+
+    Nothing is copied when it's created, the fields are read from the `Detections` arrays when they are accessed, and
+    the center is computed once on first use.
+    """
+
+    __slots__ = ("org_detections", "index", "_center")
+
+    def __init__(self, org_detections: Detections, index: int = 0):
+        self.org_detections = org_detections  # the detections this detection is a row of
+        self.index = int(index)  # row of this detection in `org_detections`
+        self._center: Optional[Coordinate] = None
+
+    def __repr__(self) -> str:
+        return f"Detection(index={self.index}, xyxy={self.xyxy}, tracker_id={self.tracker_id})"
+
+    @property
+    def xyxy(self) -> np.ndarray:
+        return self.org_detections.xyxy[self.index]
+
+    @property
+    def center(self) -> Coordinate:
+        if self._center is None:
+            self._center = Coordinate.of_center(self.org_detections.xyxy[self.index])
+        return self._center
+
+    @property
+    def mask(self) -> Optional[np.ndarray]:
+        mask = self.org_detections.mask
+        return mask[self.index] if mask is not None else None
+
+    @property
+    def confidence(self) -> Optional[float]:
+        confidence = self.org_detections.confidence
+        return confidence[self.index] if confidence is not None else None
+
+    @property
+    def class_id(self) -> Optional[int]:
+        class_id = self.org_detections.class_id
+        return class_id[self.index] if class_id is not None else None
+
+    @property
+    def tracker_id(self) -> Optional[int]:
+        tracker_id = self.org_detections.tracker_id
+        return tracker_id[self.index] if tracker_id is not None else None
+
+    def as_detections(self) -> Detections:
+        """ This detection alone, as a `Detections` of length 1 (e.g. for the annotators) """
+        return self.org_detections[self.index:self.index + 1]
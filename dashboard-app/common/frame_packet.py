@@ -0,0 +1,36 @@
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from supervision import Detections
+
+from common.detection import Detection
+from common.mjpeg_frame import MjpegFrame
+
+
+@dataclass
+class FramePacket:
+    """ A single camera frame travelling through the frame pipeline, each stage fills in its own part """
+    frame_id: int
+    capture_time: float  # time.monotonic() when the frame was read from the video source
+    frame: Optional[np.ndarray] = None  # decoded BGR frame (decoded from `jpeg` on demand, see `decoded()`)
+    jpeg: Optional[MjpegFrame] = None  # raw JPEG frame when the video source is an MJPEG stream
+    decode_scale: int = 1  # decode the JPEG at 1/decode_scale of its resolution
+    detections: Optional[Detections] = None  # YOLO detections (filled by the inference stage)
+    class_names: dict[int, str] = field(default_factory=dict)  # class ID -> name of the model that detected it
+    target: Optional[Detection] = None  # the detection the CamController decided on (filled by the control stage)
+    drawn: bool = False  # whether any stage has drawn on the frame (an untouched camera JPEG can be passed through)
+    encoded: Optional[str] = None  # base64 encoded frame for the Flet GUI (filled by the encode stage)
+
+    def decoded(self) -> Optional[np.ndarray]:
+        """ Return the BGR frame, decoding the JPEG the first time it is needed """
+        if self.frame is None and self.jpeg is not None:
+            self.frame = self.jpeg.decode(scale=self.decode_scale)
+        return self.frame
+
+    def shape(self) -> Optional[tuple[int, int]]:
+        """ Return (height, width) of the frame without decoding it """
+        if self.frame is not None:
+            return self.frame.shape[:2]
+        if self.jpeg is not None:
+            return self.jpeg.shape(scale=self.decode_scale)
@@ -0,0 +1,153 @@
+import collections
+import functools
+import http.server
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class Histogram:
+    """ Rolling window of the latest observations, plus the all-time count and sum """
+
+    def __init__(self, window: int = 500):
+        self.samples = collections.deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self, quantiles: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict[float, float]:
+        if len(self.samples) == 0:
+            return {}
+        values = np.percentile(np.fromiter(self.samples, dtype=float), [q * 100 for q in quantiles])
+        return dict(zip(quantiles, (float(value) for value in values)))
+
+
+class MetricsRegistry:
+    """
+    A lightweight registry of monotonic timers, counters and gauges for the hot path.
+
+    Timers are recorded with the `timed(...)` decorator, which checks `enabled` before anything else, so a disabled
+    registry only costs one attribute lookup per call. The metrics can be exported in the Prometheus text format, to a
+    file (`write_prometheus`) or through a local HTTP endpoint (`serve`).
+    """
+
+    def __init__(self, enabled: bool = False, window: int = 500):
+        self.enabled = enabled
+        self.window = window
+        self.timers: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def reset(self) -> None:
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def observe(self, name: str, seconds: float) -> None:
+        if self.enabled is False:
+            return
+        with self._lock:
+            histogram = self.timers.get(name)
+            if histogram is None:
+                histogram = self.timers[name] = Histogram(window=self.window)
+            histogram.observe(seconds)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        if self.enabled is False:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        if self.enabled is False:
+            return
+        self.gauges[name] = value
+
+    def timed(self, name: str) -> Callable:
+        """ Decorator that records how long every call of the decorated function takes """
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if self.enabled is False:
+                    return function(*args, **kwargs)
+                start_time = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start_time)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "timers": {name: {"count": histogram.count, "sum": histogram.total,
+                                  "quantiles": histogram.quantiles()}
+                           for name, histogram in self.timers.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def to_prometheus(self, prefix: str = "smartcam_") -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, timer in sorted(snapshot["timers"].items()):
+            metric = f"{prefix}{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for quantile, value in timer["quantiles"].items():
+                lines.append(f'{metric}{{quantile="{quantile}"}} {value:.9f}')
+            lines.append(f"{metric}_sum {timer['sum']:.9f}")
+            lines.append(f"{metric}_count {timer['count']}")
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}{name}_total counter")
+            lines.append(f"{prefix}{name}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        with open(path, "w") as file:
+            file.write(self.to_prometheus())
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1") -> None:
+        """ Expose the metrics on http://host:port/metrics """
+        if self._server is not None:
+            return
+        registry = self
+
+        class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # don't print every scrape
+
+        self._server = http.server.ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+
+    def stop_serving(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+METRICS = MetricsRegistry(enabled=False)  # the application wide registry
@@ -0,0 +1,43 @@
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+# cv2.imdecode flag for each supported reduced-scale decoding (libjpeg decodes directly at 1/2, 1/4 or 1/8 size)
+DECODE_SCALE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# JPEG start-of-frame markers (baseline, extended, progressive, ...) that carry the image dimensions
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass(frozen=True)
+class MjpegFrame:
+    jpeg: bytes  # the raw JPEG bytes exactly as the camera sent them
+    arrival_time: float  # time.monotonic() when the last byte of the frame was received
+
+    def decode(self, scale: int = 1) -> Optional[np.ndarray]:
+        """ Decode the JPEG into a BGR frame, optionally at a reduced scale (1/2, 1/4, 1/8) """
+        return cv2.imdecode(np.frombuffer(self.jpeg, dtype=np.uint8), DECODE_SCALE_FLAGS[scale])
+
+    def shape(self, scale: int = 1) -> Optional[tuple[int, int]]:
+        """ Return (height, width) of the frame decoded at `scale` by reading the JPEG header (no decoding) """
+        jpeg = self.jpeg
+        index = 2  # skip the SOI marker
+        while index + 9 < len(jpeg):
+            if jpeg[index] != 0xFF:
+                return None
+            marker = jpeg[index + 1]
+            if marker in SOF_MARKERS:
+                height, width = struct.unpack_from(">HH", jpeg, index + 5)
+                return -(-height // scale), -(-width // scale)  # libjpeg rounds reduced sizes up
+            segment_length, = struct.unpack_from(">H", jpeg, index + 2)
+            index += 2 + segment_length
+        return None
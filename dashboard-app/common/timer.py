@@ -1,15 +1,15 @@
-import datetime
 from dataclasses import dataclass
 
+from common.clock import Clock
+
 
 @dataclass(frozen=True)
 class Timer:
-    expiration: datetime.datetime
+    expiration: float  # Clock.now() timestamp
 
     def is_expired(self) -> bool:
-        return self.expiration < datetime.datetime.now()
+        return self.expiration < Clock.now()
 
     @staticmethod
-    def set_to_expire_in(seconds: int) -> "Timer":
-        expiration = datetime.datetime.now() + datetime.timedelta(seconds=seconds)
-        return Timer(expiration=expiration)
+    def set_to_expire_in(seconds: float) -> "Timer":
+        return Timer(expiration=Clock.now() + seconds)
@@ -1,3 +1,6 @@
 from core.cam_controller import CamController
+from core.device_client import AsyncDeviceClient, DeviceClient
 from core.esp32_bridge import Esp32Bridge
-from core.socket_handler import SocketHandler
+from core.pan_tilt_controller import ControllerType, PanTiltController
+from core.pending_commands import PendingCommands
+from core.servo_scheduler import ServoScheduler
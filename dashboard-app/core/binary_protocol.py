@@ -0,0 +1,77 @@
+"""
+Compact binary command set of the device websocket (opcode 2), mirrored in `esp32-camera/main.py`.
+
+Every request is 7 bytes, `>BHHH`: command code, sequence ID, two arguments. Every reply is 4 bytes, `>BHB`: command
+code with the high bit set, sequence ID, status. MOVE angles travel as centidegrees (0 - 18000), VEL speeds as signed
+16 bit decidegrees per second, QUALITY and FPS as integers. MOTION and POS only exist as text commands.
+
+The dashboard asks for it with the text command `PROTOCOL binary` at connect time; firmware that doesn't know it
+replies with an error and the text commands stay in use.
+"""
+import struct
+from typing import Optional
+
+
+REQUEST = struct.Struct(">BHHH")  # command, sequence ID, argument 1, argument 2
+REPLY = struct.Struct(">BHB")  # command | REPLY_FLAG, sequence ID, status
+
+CMD_PING = 0x01
+CMD_FLASH = 0x02
+CMD_FRAMESIZE = 0x03
+CMD_MOVE = 0x04
+CMD_QUALITY = 0x05
+CMD_FPS = 0x06
+CMD_VEL = 0x07
+REPLY_FLAG = 0x80
+
+STATUS_OK = 0
+STATUS_UNKNOWN_COMMAND = 1
+STATUS_INVALID_ARGUMENT = 2
+
+SEQUENCE_MASK = 0xFFFF
+
+NEGOTIATION_COMMAND = "PROTOCOL binary"
+
+
+def encode_command(sequence_id: int, command: str) -> Optional[bytes]:
+    """ Pack a text command (`MOVE 92.35 88.0`, `FLASH on`, ...), None if it has no binary form """
+    parsed = command.split()
+    name, args = parsed[0].upper(), parsed[1:]
+    sequence_id &= SEQUENCE_MASK
+    try:
+        if name == "PING" and len(args) == 0:
+            return REQUEST.pack(CMD_PING, sequence_id, 0, 0)
+        if name == "FLASH" and len(args) == 1 and args[0].lower() in ("on", "off"):
+            return REQUEST.pack(CMD_FLASH, sequence_id, int(args[0].lower() == "on"), 0)
+        if name == "FRAMESIZE" and len(args) == 1:
+            return REQUEST.pack(CMD_FRAMESIZE, sequence_id, int(args[0]), 0)
+        if name == "MOVE" and len(args) == 2:
+            return REQUEST.pack(CMD_MOVE, sequence_id, round(float(args[0]) * 100), round(float(args[1]) * 100))
+        if name == "QUALITY" and len(args) == 1:
+            return REQUEST.pack(CMD_QUALITY, sequence_id, int(args[0]), 0)
+        if name == "FPS" and len(args) == 1:
+            return REQUEST.pack(CMD_FPS, sequence_id, int(args[0]), 0)
+        if name == "VEL" and len(args) == 2:
+            pan, tilt = (round(float(arg) * 10) for arg in args)
+            if -0x8000 <= pan < 0x8000 and -0x8000 <= tilt < 0x8000:
+                return REQUEST.pack(CMD_VEL, sequence_id, pan & 0xFFFF, tilt & 0xFFFF)
+    except (ValueError, struct.error):
+        pass
+    return None
+
+
+def to_signed(value: int) -> int:
+    """ A 16 bit argument as two's complement (VEL speeds) """
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def decode_reply(payload: bytes) -> Optional[tuple[int, str]]:
+    """ Unpack a reply into its sequence ID and the equivalent text reply, None if it isn't a valid reply """
+    if len(payload) != REPLY.size:
+        return None
+    command, sequence_id, status = REPLY.unpack(payload)
+    if command & REPLY_FLAG == 0:
+        return None
+    if status != STATUS_OK:
+        return sequence_id, f"ERROR: binary command {command & ~REPLY_FLAG} failed with status {status}"
+    return sequence_id, "PONG" if command & ~REPLY_FLAG == CMD_PING else "success"
@@ -4,7 +4,7 @@ import cv2
 import numpy as np
 from supervision import Detections
 
-from common import Coordinate, Detection, Timer, LoggerInterface
+from common import Coordinate, Detection, Timer, LoggerInterface, METRICS
 from core.esp32_bridge import Esp32Bridge
 
 
@@ -93,27 +93,21 @@ class CamController:
 
         cv2.arrowedLine(frame, start_point, end_point, arrow_color, arrow_thickness)
 
+    @staticmethod
+    def _centers(detections: Detections) -> np.ndarray:
+        """ Centers of all bounding boxes as an (N, 2) array of pixels, truncated like `Coordinate.of_center(...)` """
+        return ((detections.xyxy[:, :2] + detections.xyxy[:, 2:4]) / 2).astype(int)
+
     def _get_closest_detection(self, detections: Detections, tracker_id_override: Optional[int] = None) -> Optional[Detection]:
         """ Return the closest detection to the center of the screen (or detection with the provided tracker id) """
-        detection = None
-        shortest_distance = None
-        for xyxy, mask, confidence, class_id, tracker_id in detections:
-            detection_center = Coordinate.of_center(xyxy)
-            distance = self.center.distance_to(detection_center)
-            if shortest_distance is None or distance < shortest_distance or tracker_id_override == tracker_id:
-                detection = Detection(
-                    org_detections=detections,
-                    xyxy=xyxy,
-                    center=detection_center,
-                    mask=mask,
-                    confidence=confidence,
-                    class_id=class_id,
-                    tracker_id=tracker_id
-                )
-                shortest_distance = distance
-                if tracker_id_override == tracker_id:
-                    return detection
-        return detection
+        if len(detections) == 0:
+            return None
+        if tracker_id_override is not None and detections.tracker_id is not None:
+            matches = np.flatnonzero(detections.tracker_id == tracker_id_override)
+            if len(matches) > 0:
+                return Detection(org_detections=detections, index=matches[0])
+        squared_distances = np.square(self._centers(detections) - (self.center_x, self.center_y)).sum(axis=1)
+        return Detection(org_detections=detections, index=np.argmin(squared_distances))
 
     def _select_target(self, detections: Detections) -> Optional[Detection]:
         """ Choose a new target that is closest to the center of the screen """
@@ -121,27 +115,22 @@ class CamController:
         if target_detection is not None and target_detection.tracker_id is not None:
             self.target_tracker_id = target_detection.tracker_id
             self.coyote_timer = None
+            self.esp32_bridge.pan_tilt_controller.reset()  # the motion of the previous target is meaningless now
             self.log(f"Selected a new target ID {self.target_tracker_id}")
         return target_detection
 
     def _get_target(self, detections: Detections) -> Optional[Detection]:
         """ Get detection from all detections based on tracker ID """
-        try:
-            detections = detections[detections.tracker_id == self.target_tracker_id]
-        except IndexError as e:
-            return
-        if len(detections) > 0:
-            return Detection(
-                org_detections=detections,
-                xyxy=detections.xyxy[0],
-                center=Coordinate.of_center(detections.xyxy[0]),
-                mask=detections.mask,
-                confidence=detections.confidence,
-                class_id=detections.class_id,
-                tracker_id=detections.tracker_id
-            )
-
-    def handle(self, frame: np.ndarray, detections: Detections) -> Optional[Detection]:
+        if detections.tracker_id is None or self.target_tracker_id is None:
+            return None
+        matches = np.flatnonzero(detections.tracker_id == self.target_tracker_id)
+        if len(matches) == 0:
+            return None
+        return Detection(org_detections=detections[matches], index=0)
+
+    @METRICS.timed("cam_controller_handle")
+    def handle(self, frame: np.ndarray, detections: Detections,
+               capture_time: Optional[float] = None) -> Optional[Detection]:
         if len(detections) == 0:
             return
         if self.tracking_enabled is False:
@@ -181,6 +170,8 @@ class CamController:
         if target_detection is not None:
             x_vector = target_detection.center.x - self.center_x
             y_vector = target_detection.center.y - self.center_y
+            self.esp32_bridge.move_by_pixel(x_vector, y_vector, frame_width=self.width, frame_height=self.height,
+                                            capture_time=capture_time, deadband=self.boundary_offset)
             if abs(x_vector) <= self.boundary_offset:
                 x_vector = 0
             if abs(y_vector) <= self.boundary_offset:
@@ -197,7 +188,6 @@ class CamController:
                     self.draw_arrow(frame, "up")
                 elif y_vector > 0:
                     self.draw_arrow(frame, "down")
-            self.esp32_bridge.move_by_pixel(x_vector, y_vector)
             if self.show_center is True:
                 cv2.circle(frame, target_detection.center.as_tuple(), radius=5, color=(0, 255, 0))
         return target_detection
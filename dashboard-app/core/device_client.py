@@ -0,0 +1,276 @@
+import asyncio
+import base64
+import hashlib
+import os
+import struct
+import threading
+from typing import Optional
+
+from common import FrameSize, LoggerInterface, METRICS
+from core import binary_protocol
+from core.pending_commands import PendingCommands
+
+
+WEBSOCKET_MAGIC = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def mask_payload(mask: bytes, payload: bytes) -> bytes:
+    """ XOR the payload with the repeated 4-byte mask, as one big integer operation instead of byte by byte """
+    if len(payload) == 0:
+        return payload
+    repeated_mask = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated_mask, "big")).to_bytes(len(payload), "big")
+
+
+class AsyncDeviceClient:
+    """
+    asyncio client for the ESP32 command websocket: sequence-tagged commands matched to their replies by
+    `PendingCommands`, on top of plain asyncio streams.
+
+    No thread is needed per connection, so one event loop can drive any number of cameras, and `connect()` returns as
+    soon as the websocket handshake is done.
+
+    With `prefer_binary`, the compact binary command set (`core.binary_protocol`) is negotiated at connect time and used
+    for every command that has a binary form, the text commands stay the fallback.
+    """
+
+    def __init__(self, logger_class: Optional[LoggerInterface] = None, timeout: float = 5, port: int = 80,
+                 prefer_binary: bool = True):
+        self.logger_class = logger_class
+        self.timeout = timeout
+        self.port = port
+        self.prefer_binary = prefer_binary
+        self.url: Optional[str] = None
+        self.tagged = True  # whether the firmware supports sequence IDs
+        self.binary = False  # whether the binary command set is in use
+        self.pending = PendingCommands()  # the commands in flight
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._receive_task: Optional[asyncio.Task] = None
+
+    @property
+    def connection_established(self) -> bool:
+        return self._writer is not None
+
+    def _log(self, msg: str, fg_color: Optional[str] = None) -> None:
+        print(msg)
+        if self.logger_class is not None:
+            self.logger_class.log(message=msg, fg_color=fg_color)
+
+    async def connect(self, ip_address: str) -> bool:
+        await self.close()
+        host, _, port = ip_address.partition(":")
+        port = int(port) if port else self.port
+        self.url = f"ws://{host}:{port}/"
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError) as exception:
+            self._log(f"Failed to connect to {self.url}: {exception}", fg_color="red")
+            return False
+        try:
+            await asyncio.wait_for(self._handshake(reader, writer, host), timeout=self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError) as exception:
+            writer.close()
+            self._log(f"Websocket handshake with {self.url} failed: {exception}", fg_color="red")
+            return False
+        self._reader, self._writer = reader, writer
+        self._receive_task = asyncio.get_running_loop().create_task(self._receive_loop())
+        self._log(f"Established connection to {self.url} successfully!", fg_color="green")
+        await self._negotiate()
+        return self.connection_established
+
+    async def _handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, host: str) -> None:
+        key = base64.b64encode(os.urandom(16))
+        writer.write(b"GET / HTTP/1.1\r\nHost: " + host.encode() + b"\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: " + key + b"\r\nSec-WebSocket-Version: 13\r\n\r\n")
+        await writer.drain()
+        headers = (await reader.readuntil(b"\r\n\r\n")).decode("utf-8", errors="replace").split("\r\n")
+        if " 101 " not in headers[0]:
+            raise ConnectionError(f"unexpected response {headers[0]!r}")
+        expected_accept = base64.b64encode(hashlib.sha1(key + WEBSOCKET_MAGIC).digest()).decode()
+        for line in headers[1:]:
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "sec-websocket-accept" and value.strip() == expected_accept:
+                return
+        raise ConnectionError("missing or invalid Sec-WebSocket-Accept")
+
+    async def _negotiate(self) -> None:
+        """
+        Send a tagged PING, and fall back to untagged commands if the firmware doesn't understand it. Then ask for the
+        binary command set, which needs sequence IDs
+        """
+        self.tagged = True
+        self.binary = False
+        response = await self.send_command("PING")
+        if response is not None and response != "PONG":
+            self.tagged = False
+            self._log("The device firmware doesn't support command sequence IDs, sending one command at a time",
+                      fg_color="orange")
+        elif response is not None and self.prefer_binary is True:
+            self.binary = await self.send_command(binary_protocol.NEGOTIATION_COMMAND) == "success"
+            if self.binary is True:
+                self._log("Using the binary command protocol")
+
+    async def close(self) -> None:
+        if self._receive_task is not None:
+            self._receive_task.cancel()
+            self._receive_task = None
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        self.pending.fail_all()
+
+    def _send_frame(self, opcode: int, payload: bytes) -> None:
+        """ Write one masked frame (clients must mask what they send) """
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, 0x80 | length)
+        elif length < (1 << 16):
+            header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, length)
+        mask = os.urandom(4)
+        self._writer.write(header + mask + mask_payload(mask, payload))
+
+    async def _read_frame(self) -> tuple[int, bytes]:
+        first, second = await self._reader.readexactly(2)
+        opcode = first & 0x0F
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await self._reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await self._reader.readexactly(8))[0]
+        mask = await self._reader.readexactly(4) if second & 0x80 else None
+        payload = await self._reader.readexactly(length)
+        return opcode, payload if mask is None else mask_payload(mask, payload)
+
+    async def _receive_loop(self) -> None:
+        try:
+            while True:
+                opcode, payload = await self._read_frame()
+                if opcode == OPCODE_TEXT:
+                    if self.pending.resolve(payload.decode("utf-8", errors="replace")) is False:
+                        METRICS.increment("socket_late_replies")
+                elif opcode == OPCODE_BINARY:
+                    reply = binary_protocol.decode_reply(payload)
+                    if reply is not None and self.pending.resolve_id(*reply) is False:
+                        METRICS.increment("socket_late_replies")
+                elif opcode == OPCODE_PING:
+                    self._send_frame(OPCODE_PONG, payload)
+                elif opcode == OPCODE_CLOSE:
+                    break
+        except (OSError, asyncio.IncompleteReadError) as exception:
+            self._log(f"Websocket Error ({type(exception)}): {exception}", fg_color="red")
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = self._receive_task = None
+        self.pending.fail_all()
+        self._log(f"Connection to {self.url} has been closed", fg_color="orange")
+
+    async def send_command(self, command: str) -> Optional[str]:
+        """ Send a command and wait for its reply, other commands can be sent while this one is in flight """
+        if self._writer is None:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        sequence_id = self.pending.add(future)
+        message = binary_protocol.encode_command(sequence_id, command) if self.binary is True else None
+        try:
+            if message is not None:
+                self._send_frame(OPCODE_BINARY, message)
+            else:
+                message = self.pending.tag(sequence_id, command) if self.tagged is True else command
+                self._send_frame(OPCODE_TEXT, message.encode("utf-8"))
+            await self._writer.drain()
+            return await asyncio.wait_for(future, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            METRICS.increment("socket_command_timeouts")
+            self._log(f"Timeout ({self.timeout}s) waiting for response to the following command: {command}",
+                      fg_color="red")
+        except OSError:
+            pass  # the receive loop reports the broken connection
+        self.pending.forget(sequence_id)
+        return None
+
+    async def ping(self) -> bool:
+        return await self.send_command("PING") == "PONG"
+
+    async def set_flash(self, state: bool) -> bool:
+        return await self.send_command(f"FLASH {'on' if state is True else 'off'}") == "success"
+
+    async def set_frame_size(self, frame_size: FrameSize) -> bool:
+        return await self.send_command(f"FRAMESIZE {frame_size.key}") == "success"
+
+    async def set_jpeg_quality(self, quality: int) -> bool:
+        return await self.send_command(f"QUALITY {quality}") == "success"
+
+    async def set_target_fps(self, fps: int) -> bool:
+        return await self.send_command(f"FPS {fps}") == "success"
+
+    async def move_servo(self, pan_degree: float, tilt_degree: float) -> bool:
+        return await self.send_command(f"MOVE {pan_degree} {tilt_degree}") == "success"
+
+    async def set_servo_velocity(self, pan_velocity: float, tilt_velocity: float) -> bool:
+        return await self.send_command(f"VEL {pan_velocity} {tilt_velocity}") == "success"
+
+
+class _EventLoopThread:
+    """ The event loop shared by every `DeviceClient`, running on one daemon thread """
+
+    _loop: Optional[asyncio.AbstractEventLoop] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls) -> asyncio.AbstractEventLoop:
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="device-client-loop", daemon=True).start()
+            return cls._loop
+
+
+class DeviceClient:
+    """
+    Synchronous facade of `AsyncDeviceClient` (connect, send_command, close), for the GUI and `Esp32Bridge`.
+
+    Every facade runs its client on one shared event loop thread, so the calling thread blocks only for its own
+    command while any number of cameras and commands are in flight.
+    """
+
+    def __init__(self, logger_class: Optional[LoggerInterface] = None, timeout: float = 5, prefer_binary: bool = True):
+        self.client = AsyncDeviceClient(logger_class=logger_class, timeout=timeout, prefer_binary=prefer_binary)
+        self._loop = _EventLoopThread.get()
+
+    @property
+    def logger_class(self) -> Optional[LoggerInterface]:
+        return self.client.logger_class
+
+    @logger_class.setter
+    def logger_class(self, logger_class: Optional[LoggerInterface]) -> None:
+        self.client.logger_class = logger_class
+
+    @property
+    def connection_established(self) -> bool:
+        return self.client.connection_established
+
+    @property
+    def binary(self) -> bool:
+        return self.client.binary
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def connect(self, ip_address: str) -> bool:
+        return self._run(self.client.connect(ip_address))
+
+    @METRICS.timed("socket_send_command")
+    def send_command(self, command: str) -> Optional[str]:
+        return self._run(self.client.send_command(command))
+
+    def close(self) -> None:
+        self._run(self.client.close())
@@ -1,31 +1,47 @@
+import collections
 import threading
 from typing import Optional, Callable
 
-from common import FrameSize, LoggerInterface
-from core.socket_handler import SocketHandler
+from common import Clock, FrameSize, LoggerInterface, METRICS
+from core.device_client import DeviceClient
+from core.pan_tilt_controller import PanTiltController
+from core.servo_scheduler import ServoScheduler
 
 
 class Esp32Bridge:
 
-    FOV = 60
+    RTT_SMOOTHING = 0.2  # weight of the newest sample in the round-trip time moving average
+    VELOCITY_TIMEOUT = 0.5  # seconds the device keeps following a VEL command
 
-    def __init__(self, logger_class: Optional[LoggerInterface] = None):
-        self.socket_handler = SocketHandler(logger_class=logger_class)
+    def __init__(self, logger_class: Optional[LoggerInterface] = None, prefer_binary_protocol: bool = True):
+        # asyncio device client behind a blocking facade, it negotiates the binary command set if preferred
+        self.socket_handler = DeviceClient(logger_class=logger_class, prefer_binary=prefer_binary_protocol)
         self.logger_class = logger_class
         self.log_servo_commands = False
         self.test_mode = False
+        self.ip_address: Optional[str] = None  # address of the connected device (used to reconnect)
         self.auto_pan = False
         self.auto_tilt = False
         self.move_servo_callback: Optional[Callable[[], None]] = None
-        self.servo_lock = threading.Lock()  # indicates that we are currently moving the servo
-        self.queued_servo_duty: Optional[tuple[int, int]] = None
         self.frame_size = FrameSize.SVGA  # current frame size
+        self.jpeg_quality = 12  # JPEG quality of the sensor, 10 (best) - 63 (smallest frames)
+        self.target_fps = 0  # frame rate cap of the MJPEG stream, 0 for none
         self.servo_degree = (90.0, 90.0)  # current servo position
+        # (sent, "MOVE"/"VEL"/"POS", pan, tilt) of the servo commands, a target, a velocity or a reported position
+        self.servo_history = collections.deque([(float("-inf"), "MOVE", *self.servo_degree)], maxlen=64)
+        self.servo_lock = threading.Lock()  # guards servo_history, appended by the servo scheduler thread
+        self.round_trip_time = 0.0  # moving average of the command round-trip time (seconds)
+        self.servo_speed = 300.0  # rough turning speed of the loaded servos (degrees per second)
+        self.servo_acceleration = 2000.0  # acceleration limit of the device's motion planner (degrees per second^2)
+        self.servo_velocity = (0.0, 0.0)  # last velocity command (degrees per second)
+        self.pan_tilt_controller = PanTiltController()  # turns pixel offsets into servo corrections
+        self.servo_scheduler = ServoScheduler(send_move=self._send_move)  # sends MOVE commands off the caller's thread
 
     def connect(self, ip_address: str) -> bool:
         if ip_address == "0":
             self.test_mode = True
             return True
+        self.ip_address = ip_address
         response = self.socket_handler.connect(ip_address=ip_address)
         if response is True:
             response = self.ping()
@@ -34,14 +50,22 @@ class Esp32Bridge:
     def _mock_interaction(self, command: str) -> str:
         if command == "PING":
             return "PONG"
+        if command == "POS":
+            return f"{self.servo_degree[0]:.2f} {self.servo_degree[1]:.2f}"
         return "success"
 
+    @METRICS.timed("esp32_send_command")
     def _send_command(self, command: str, is_servo_command: bool = False) -> Optional[str]:
         should_log = self.logger_class is not None and (is_servo_command is False or self.log_servo_commands is True)
         if should_log is True:
             self.logger_class.log(message=f"Send Command: {command}")
+        METRICS.increment("esp32_commands")
         if self.test_mode is False:
+            start_time = Clock.now()
             response = self.socket_handler.send_command(command=command)
+            if response is not None:
+                round_trip_time = Clock.now() - start_time
+                self.round_trip_time += self.RTT_SMOOTHING * (round_trip_time - self.round_trip_time)
         else:
             response = self._mock_interaction(command=command)
         if should_log is True:
@@ -60,29 +84,88 @@ class Esp32Bridge:
     def set_frame_size(self, frame_size: FrameSize) -> bool:
         cmd_arg = frame_size.key
         response = self._send_command(f"FRAMESIZE {cmd_arg}")
-        return response == "success"
+        if response != "success":
+            return False
+        self.frame_size = frame_size
+        return True
 
-    @staticmethod
-    def _slow_panning(delta_degree: float) -> float:
-        abs_degree = abs(delta_degree)
-        if abs_degree > 10:
-            abs_degree = 3
-        elif abs_degree > 3:
-            abs_degree = 1
-        return abs_degree if delta_degree > 0 else abs_degree * -1
-
-    def move_by_pixel(self, x: int, y: int) -> bool:
+    def set_jpeg_quality(self, quality: int) -> bool:
+        """ Trade image quality for bandwidth: 10 is the best quality, 63 the smallest frames """
+        response = self._send_command(f"QUALITY {quality}")
+        if response != "success":
+            return False
+        self.jpeg_quality = quality
+        return True
+
+    def set_target_fps(self, fps: int) -> bool:
+        """ Cap the frame rate of the MJPEG stream (0 for no cap) """
+        response = self._send_command(f"FPS {fps}")
+        if response != "success":
+            return False
+        self.target_fps = fps
+        return True
+
+    def servo_degree_at(self, timestamp: float) -> tuple[float, float]:
+        """
+        Estimate the servo position at `timestamp` (Clock.now()) from the sent servo commands, assuming a command
+        arrives after half the RTT. The servos turn towards a MOVE target at `servo_speed`, follow a VEL velocity until
+        the next command or VELOCITY_TIMEOUT, and a POS reply puts them where the device reported them.
+        """
+        arrival_delay = self.round_trip_time / 2
+        with self.servo_lock:
+            history = iter(tuple(self.servo_history))
+        last_time, command, pan_degree, tilt_degree = next(history)
+        following = (command, pan_degree, tilt_degree, last_time)  # the command the servos follow, and its arrival
+        for sent_time, command, pan_value, tilt_value in history:
+            arrival_time = max(sent_time + arrival_delay, last_time)
+            if arrival_time > timestamp:
+                break
+            pan_degree, tilt_degree = self._follow(following, pan_degree, tilt_degree, last_time, arrival_time)
+            if command == "POS":
+                pan_degree, tilt_degree = pan_value, tilt_value
+            else:
+                following = (command, pan_value, tilt_value, arrival_time)
+            last_time = arrival_time
+        return self._follow(following, pan_degree, tilt_degree, last_time, timestamp)
+
+    def _follow(self, following: tuple[str, float, float, float], pan_degree: float, tilt_degree: float,
+                start_time: float, end_time: float) -> tuple[float, float]:
+        """ Advance the position estimate from `start_time` to `end_time` along a MOVE or VEL command """
+        command, pan_value, tilt_value, arrival_time = following
+        if command == "VEL":
+            duration = max(0.0, min(end_time, arrival_time + self.VELOCITY_TIMEOUT) - start_time)
+            return (min(max(pan_degree + pan_value * duration, 0.0), 180.0),
+                    min(max(tilt_degree + tilt_value * duration, 0.0), 180.0))
+        max_step = self.servo_speed * (end_time - start_time) if start_time != float("-inf") else float("inf")
+        return (pan_degree + max(-max_step, min(max_step, pan_value - pan_degree)),
+                tilt_degree + max(-max_step, min(max_step, tilt_value - tilt_degree)))
+
+    def move_by_pixel(self, x: int, y: int, frame_width: Optional[int] = None, frame_height: Optional[int] = None,
+                      capture_time: Optional[float] = None, deadband: int = 0) -> bool:
+        """
+        Move the camera by pixel offset, `frame_width/height` is the size of the frame the offset was measured in and
+        `capture_time` (Clock.now()) is when that frame was captured. An axis whose offset is within `deadband` pixels
+        doesn't move, but its offset still updates the controller (the predictive controller needs every sample).
+        """
         if x == 0 and y == 0:
             return False
+        frame_width = frame_width if frame_width is not None else self.frame_size.width
+        frame_height = frame_height if frame_height is not None else self.frame_size.height
+        now = Clock.now()
+        capture_time = capture_time if capture_time is not None else now
+        lookahead = (now - capture_time) + self.round_trip_time / 2  # until the servo receives the command
+        pan_at_capture, tilt_at_capture = self.servo_degree_at(capture_time)
         pan_degree = tilt_degree = None
         if self.auto_pan is True:
-            pan_delta_degree = (x / self.frame_size.width) * self.FOV
-            pan_delta_degree = self._slow_panning(pan_delta_degree)   # TODO: a temporary solution
-            pan_degree = self.servo_degree[0] - pan_delta_degree
+            pan_delta_degree = self.pan_tilt_controller.pan_correction(
+                x, frame_width, self.servo_degree[0], pan_at_capture, capture_time, lookahead)
+            if abs(x) > deadband:
+                pan_degree = self.servo_degree[0] - pan_delta_degree
         if self.auto_tilt is True:
-            tilt_delta_degree = (y / self.frame_size.height) * self.FOV
-            tilt_delta_degree = self._slow_panning(tilt_delta_degree)  # TODO: a temporary solution
-            tilt_degree = self.servo_degree[1] - tilt_delta_degree
+            tilt_delta_degree = self.pan_tilt_controller.tilt_correction(
+                y, frame_height, self.servo_degree[1], tilt_at_capture, capture_time, lookahead)
+            if abs(y) > deadband:
+                tilt_degree = self.servo_degree[1] - tilt_delta_degree
         return self.move_servo(pan_degree, tilt_degree)
 
     @staticmethod
@@ -96,28 +179,70 @@ class Esp32Bridge:
         return degree
 
     def move_servo(self, pan_degree: Optional[float], tilt_degree: Optional[float]) -> bool:
+        """
+        Queue a move of either axis (`None` leaves it where it is) without waiting for the device, the servo scheduler
+        sends it. Returns False if there is nothing to move.
+        """
         pan_degree = self._normalize_degree(pan_degree)
         tilt_degree = self._normalize_degree(tilt_degree)
         if pan_degree is None and tilt_degree is None:
             return False
-        if pan_degree is None:
-            pan_degree = self.servo_degree[0] if self.queued_servo_duty is None else self.queued_servo_duty[0]
-        if tilt_degree is None:
-            tilt_degree = self.servo_degree[1] if self.queued_servo_duty is None else self.queued_servo_duty[1]
-        servo_lock_acquired = self.servo_lock.acquire(blocking=False)
-        if servo_lock_acquired is not True:
-            self.queued_servo_duty = (pan_degree, tilt_degree)  # queue up the pan & tilt command
+        return self.servo_scheduler.submit(pan_degree, tilt_degree)
+
+    def set_servo_velocity(self, pan_velocity: float, tilt_velocity: float) -> bool:
+        """
+        Turn the servos at the given speeds (degrees per second, negative turns back) with one command instead of a
+        stream of MOVEs. The device stops an axis at its end stop, or when no VEL arrived for half a second, so send
+        it every control cycle. A MOVE switches back to heading for an absolute target, queued MOVEs are dropped.
+        """
+        pan_velocity, tilt_velocity = round(pan_velocity, 1), round(tilt_velocity, 1)
+        return self.servo_scheduler.send_instead(lambda: self._send_velocity(pan_velocity, tilt_velocity))
+
+    def set_motion_limits(self, max_velocity: float, max_acceleration: float) -> bool:
+        """ Speed and acceleration limits of the device's motion planner, max_velocity 0 turns the planner off """
+        response = self._send_command(f"MOTION {max_velocity} {max_acceleration}")
+        if response != "success":
+            return False
+        if max_velocity > 0:  # without the planner the servos turn as fast as they can, keep the previous estimate
+            self.servo_speed = max_velocity
+        self.servo_acceleration = max_acceleration
+        return True
+
+    def read_servo_position(self) -> Optional[tuple[float, float]]:
+        """ Ask the device where the servos are (e.g. after velocity commands), None if it didn't answer """
+        send_time = Clock.now()
+        response = self._send_command("POS", is_servo_command=True)
+        try:
+            pan_degree, tilt_degree = (float(value) for value in response.split())
+        except (AttributeError, ValueError):
+            return None
+        self.servo_degree = (pan_degree, tilt_degree)
+        with self.servo_lock:
+            self.servo_history.append((send_time, "POS", pan_degree, tilt_degree))
+        self.servo_scheduler.sync(self.servo_degree)
+        if self.move_servo_callback is not None:
+            self.move_servo_callback()
+        return self.servo_degree
+
+    def _send_move(self, pan_degree: float, tilt_degree: float) -> bool:
+        send_time = Clock.now()
+        response = self._send_command(f"MOVE {pan_degree} {tilt_degree}")
+        if response != "success":
+            return False
+        self.servo_degree = (pan_degree, tilt_degree)
+        with self.servo_lock:
+            self.servo_history.append((send_time, "MOVE", pan_degree, tilt_degree))
+        if self.move_servo_callback is not None:
+            self.move_servo_callback()
+        return True
+
+    def _send_velocity(self, pan_velocity: float, tilt_velocity: float) -> bool:
+        send_time = Clock.now()
+        response = self._send_command(f"VEL {pan_velocity} {tilt_velocity}", is_servo_command=True)
+        if response != "success":
             return False
-        while True:
-            response = self._send_command(f"MOVE {pan_degree} {tilt_degree}")
-            if response != "success":
-                self.servo_lock.release()
-                return False
-            self.servo_degree = (pan_degree, tilt_degree)
-            if self.move_servo_callback is not None:
-                self.move_servo_callback()
-            if self.queued_servo_duty is None:
-                self.servo_lock.release()
-                return True
-            pan_degree, tilt_degree = self.queued_servo_duty
-            self.queued_servo_duty = None
+        self.servo_velocity = (pan_velocity, tilt_velocity)
+        with self.servo_lock:
+            self.servo_history.append((send_time, "VEL", pan_velocity, tilt_velocity))
+        self.servo_scheduler.sync(self.servo_degree_at(Clock.now()))  # the MOVE target is given up
+        return True
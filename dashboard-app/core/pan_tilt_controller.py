@@ -0,0 +1,174 @@
+import math
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import Optional
+
+
+class ControllerType(Enum):
+    STEP = "step"  # the original fixed-step heuristic
+    PID = "pid"
+    PREDICTIVE = "predictive"  # PID on where the target will be once the servo moves
+
+
+class AxisController(ABC):
+    """ Turns the angular error of one axis (degrees, target relative to the camera center) into a servo correction """
+
+    def reset(self) -> None:
+        pass
+
+    @abstractmethod
+    def correction(self, error: float, servo_degree: float, servo_degree_at_capture: float, capture_time: float,
+                   lookahead: float) -> float:
+        pass
+
+
+class StepAxisController(AxisController):
+    """ The original stepwise heuristic: 3 degrees for big errors, 1 degree for medium ones """
+
+    def correction(self, error: float, servo_degree: float, servo_degree_at_capture: float, capture_time: float,
+                   lookahead: float) -> float:
+        abs_degree = abs(error)
+        if abs_degree > 10:
+            abs_degree = 3
+        elif abs_degree > 3:
+            abs_degree = 1
+        return abs_degree if error > 0 else abs_degree * -1
+
+
+class PidAxisController(AxisController):
+
+    def __init__(self, kp: float = 0.6, ki: float = 0.0, kd: float = 0.02, max_step: float = 10.0,
+                 reset_after: float = 0.5):
+        self.kp = kp  # proportional gain
+        self.ki = ki  # integral gain
+        self.kd = kd  # derivative gain
+        self.max_step = max_step  # maximum correction (degrees) per command
+        self.reset_after = reset_after  # seconds without an update after which the state is stale
+        self.integral = 0.0
+        self.last_measurement: Optional[float] = None
+        self.last_time: Optional[float] = None
+
+    def reset(self) -> None:
+        self.integral = 0.0
+        self.last_measurement = self.last_time = None
+
+    def _elapsed(self, capture_time: float) -> Optional[float]:
+        """ Seconds since the previous frame, None (and a reset) when there is no recent previous frame """
+        if self.last_time is None or capture_time - self.last_time > self.reset_after:
+            self.reset()
+            return None
+        elapsed = capture_time - self.last_time
+        return elapsed if elapsed > 1e-3 else None
+
+    def _pid(self, error: float, elapsed: Optional[float], measurement: float) -> float:
+        """ The derivative is taken on the measurement, so our own servo moves don't kick the D term """
+        derivative = 0.0
+        if elapsed is not None:
+            self.integral = max(-self.max_step, min(self.max_step, self.integral + error * elapsed))
+            if self.last_measurement is not None:
+                derivative = (measurement - self.last_measurement) / elapsed
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        self.last_measurement = measurement
+        return max(-self.max_step, min(self.max_step, output))
+
+    def correction(self, error: float, servo_degree: float, servo_degree_at_capture: float, capture_time: float,
+                   lookahead: float) -> float:
+        elapsed = self._elapsed(capture_time)
+        self.last_time = capture_time
+        position = servo_degree_at_capture - error  # the target in servo degrees, it doesn't jump when the servo moves
+        return self._pid(error, elapsed, measurement=-position)
+
+
+class PredictiveAxisController(PidAxisController):
+    """
+    A PID controller that aims at where the target will be when the servo actually moves.
+
+    The target position is tracked in servo degrees (servo position when the frame was captured, minus the error), its
+    velocity is smoothed over frames (constant-velocity model) and extrapolated by `lookahead` seconds: the age of the
+    frame plus the time the command needs to reach the camera.
+    """
+
+    def __init__(self, kp: float = 0.6, ki: float = 0.0, kd: float = 0.02, max_step: float = 10.0,
+                 reset_after: float = 0.5, smoothing: float = 0.5, max_lookahead: float = 0.5):
+        super().__init__(kp=kp, ki=ki, kd=kd, max_step=max_step, reset_after=reset_after)
+        self.smoothing = smoothing  # weight of the newest velocity sample (0..1]
+        self.max_lookahead = max_lookahead  # never extrapolate further than this many seconds
+        self.last_position: Optional[float] = None
+        self.velocity = 0.0  # degrees per second
+
+    def reset(self) -> None:
+        super().reset()
+        self.last_position = None
+        self.velocity = 0.0
+
+    def correction(self, error: float, servo_degree: float, servo_degree_at_capture: float, capture_time: float,
+                   lookahead: float) -> float:
+        elapsed = self._elapsed(capture_time)
+        self.last_time = capture_time
+        position = servo_degree_at_capture - error  # where the target was (in servo degrees) when it was captured
+        if elapsed is not None and self.last_position is not None:
+            velocity = (position - self.last_position) / elapsed
+            self.velocity += self.smoothing * (velocity - self.velocity)
+        self.last_position = position
+        predicted_position = position + self.velocity * min(max(lookahead, 0.0), self.max_lookahead)
+        return self._pid(servo_degree - predicted_position, elapsed, measurement=-predicted_position)
+
+
+class PanTiltController:
+    """
+    PanTiltController converts the pixel offset of the target into pan & tilt corrections (degrees).
+
+    - pixel offsets are turned into angles with a separate field of view per axis
+    - the corrections come from a pluggable per-axis controller (see `ControllerType`)
+    """
+
+    def __init__(self, controller_type: ControllerType = ControllerType.PREDICTIVE, pan_fov: float = 60.0,
+                 tilt_fov: float = 45.0, kp: float = 0.6, ki: float = 0.0, kd: float = 0.02):
+        self.pan_fov = pan_fov  # horizontal field of view of the camera (degrees)
+        self.tilt_fov = tilt_fov  # vertical field of view of the camera (degrees)
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.controller_type = controller_type
+        self.pan: AxisController = self._create_axis()
+        self.tilt: AxisController = self._create_axis()
+
+    def _create_axis(self) -> AxisController:
+        if self.controller_type == ControllerType.STEP:
+            return StepAxisController()
+        if self.controller_type == ControllerType.PID:
+            return PidAxisController(kp=self.kp, ki=self.ki, kd=self.kd)
+        return PredictiveAxisController(kp=self.kp, ki=self.ki, kd=self.kd)
+
+    def set_controller_type(self, controller_type: ControllerType) -> None:
+        self.controller_type = controller_type
+        self.pan = self._create_axis()
+        self.tilt = self._create_axis()
+
+    def set_gains(self, kp: Optional[float] = None, ki: Optional[float] = None, kd: Optional[float] = None) -> None:
+        self.kp = kp if kp is not None else self.kp
+        self.ki = ki if ki is not None else self.ki
+        self.kd = kd if kd is not None else self.kd
+        for axis in (self.pan, self.tilt):
+            if isinstance(axis, PidAxisController):
+                axis.kp, axis.ki, axis.kd = self.kp, self.ki, self.kd
+
+    def reset(self) -> None:
+        self.pan.reset()
+        self.tilt.reset()
+
+    @staticmethod
+    def pixel_to_degree(pixels: float, frame_pixels: int, fov: float) -> float:
+        """ Angle between the frame center and a point `pixels` away from it (pinhole camera model) """
+        half_fov = math.radians(fov / 2)
+        return math.degrees(math.atan((pixels / (frame_pixels / 2)) * math.tan(half_fov)))
+
+    def pan_correction(self, x: int, frame_width: int, servo_degree: float, servo_degree_at_capture: float,
+                       capture_time: float, lookahead: float) -> float:
+        error = self.pixel_to_degree(x, frame_width, self.pan_fov)
+        return self.pan.correction(error, servo_degree, servo_degree_at_capture, capture_time, lookahead)
+
+    def tilt_correction(self, y: int, frame_height: int, servo_degree: float, servo_degree_at_capture: float,
+                        capture_time: float, lookahead: float) -> float:
+        error = self.pixel_to_degree(y, frame_height, self.tilt_fov)
+        return self.tilt.correction(error, servo_degree, servo_degree_at_capture, capture_time, lookahead)
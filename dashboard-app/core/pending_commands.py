@@ -0,0 +1,76 @@
+import collections
+import itertools
+import threading
+from typing import Optional
+
+
+class PendingCommands:
+    """
+    Bookkeeping of the commands in flight on the device command channel of `AsyncDeviceClient`.
+
+    Commands are tagged with a sequence ID (`#<id> <command>`) that the firmware echoes in its reply (`#<id> <reply>`).
+    Each command has a future (`concurrent.futures.Future` or `asyncio.Future`), resolved by the reply with the same
+    ID. An untagged reply (firmware without sequence IDs) answers the oldest command in flight. IDs wrap at 16 bits, the
+    size of the ID field of the binary protocol.
+    """
+
+    TAG_PREFIX = "#"
+
+    def __init__(self):
+        self._sequence = itertools.count(1)
+        self._futures: collections.OrderedDict[int, object] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._futures)
+
+    def add(self, future) -> int:
+        sequence_id = next(self._sequence) & 0xFFFF
+        with self._lock:
+            self._futures[sequence_id] = future
+        return sequence_id
+
+    def tag(self, sequence_id: int, command: str) -> str:
+        return f"{self.TAG_PREFIX}{sequence_id} {command}"
+
+    def forget(self, sequence_id: int) -> None:
+        with self._lock:
+            self._futures.pop(sequence_id, None)
+
+    def _match(self, message: str) -> tuple[Optional[object], str]:
+        if message.startswith(self.TAG_PREFIX):
+            tag, _, reply = message.partition(" ")
+            if tag[1:].isdigit():
+                with self._lock:
+                    return self._futures.pop(int(tag[1:]), None), reply
+        with self._lock:
+            if len(self._futures) == 0:
+                return None, message
+            return self._futures.popitem(last=False)[1], message
+
+    def resolve(self, message: str) -> bool:
+        """ Resolve the command the reply belongs to, returns False for a reply nobody waits for anymore """
+        future, reply = self._match(message)
+        return self._set_result(future, reply)
+
+    def resolve_id(self, sequence_id: int, reply: str) -> bool:
+        """ Resolve the command with a known sequence ID (binary replies), like `resolve(...)` """
+        with self._lock:
+            future = self._futures.pop(sequence_id, None)
+        return self._set_result(future, reply)
+
+    @staticmethod
+    def _set_result(future, reply: str) -> bool:
+        if future is None or future.done():  # the command timed out already
+            return False
+        future.set_result(reply)
+        return True
+
+    def fail_all(self) -> None:
+        """ Resolve every command in flight with None (the connection is gone) """
+        with self._lock:
+            futures, self._futures = self._futures, collections.OrderedDict()
+        for future in futures.values():
+            if not future.done():
+                future.set_result(None)
@@ -0,0 +1,116 @@
+import threading
+from typing import Callable, Optional
+
+from common import Clock, METRICS
+
+
+class ServoScheduler:
+    """
+    ServoScheduler sends the MOVE commands from its own thread, so the frame loop and the GUI don't wait on the device.
+
+    - `submit(...)` only records the newest target of each axis (latest wins) and returns right away
+    - at most `max_rate` commands are sent per second, targets submitted in between are coalesced into one command
+    - an axis target closer than `deadband` degrees to the last sent position is ignored
+
+    With `background = False` the commands are sent inline by `submit(...)` (still rate limited on `Clock.now()`), which
+    is how the tracking simulator keeps the control loop on simulated time.
+    """
+
+    def __init__(self, send_move: Callable[[float, float], bool], max_rate: float = 20.0, deadband: float = 0.25,
+                 background: bool = True):
+        self.send_move = send_move  # sends one MOVE command and returns whether it succeeded
+        self.max_rate = max_rate  # commands per second
+        self.deadband = deadband  # degrees
+        self.background = background
+        self.sent_degree: tuple[float, float] = (90.0, 90.0)  # position of the last successful MOVE
+        self._pending: list[Optional[float]] = [None, None]  # newest (pan, tilt) targets that aren't sent yet
+        self._last_send = float("-inf")
+        self._condition = threading.Condition()
+        self._send_lock = threading.Lock()  # held while a servo command is on its way, so they go out in order
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def min_interval(self) -> float:
+        return 1 / self.max_rate if self.max_rate > 0 else 0.0
+
+    def submit(self, pan_degree: Optional[float], tilt_degree: Optional[float]) -> bool:
+        """ Queue a move of either axis (`None` leaves it alone), returns False if the whole move is within deadband """
+        accepted = False
+        with self._condition:
+            for axis, degree in enumerate((pan_degree, tilt_degree)):
+                if degree is None:
+                    continue
+                if abs(degree - self.sent_degree[axis]) < self.deadband:
+                    self._pending[axis] = None  # the newest target is where we already are
+                    METRICS.increment("servo_moves_suppressed")
+                    continue
+                if self._pending[axis] is not None:
+                    METRICS.increment("servo_moves_coalesced")
+                self._pending[axis] = degree
+                accepted = True
+            if accepted is True and self.background is True:
+                self._ensure_thread()
+                self._condition.notify()
+        if accepted is True and self.background is False:
+            self._send_pending()
+        return accepted
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="servo-scheduler", daemon=True)
+            self._thread.start()
+
+    def _take_pending(self) -> Optional[tuple[float, float]]:
+        if self._pending[0] is None and self._pending[1] is None:
+            return None
+        move = tuple(sent if pending is None else pending for pending, sent in zip(self._pending, self.sent_degree))
+        self._pending = [None, None]
+        return move
+
+    def send_instead(self, send: Callable[[], bool]) -> bool:
+        """
+        Drop the queued targets and send another servo command (e.g. VEL) in their place, after the MOVE that is already
+        on its way, so a stale MOVE can't overtake it. Returns what `send` returned.
+        """
+        with self._send_lock:
+            with self._condition:
+                self._pending = [None, None]
+            return send()
+
+    def sync(self, degree: tuple[float, float]) -> None:
+        """ The servos got to `degree` without a MOVE (velocity commands), compare the next targets to it """
+        with self._condition:
+            self.sent_degree = degree
+
+    def _send(self, move: tuple[float, float]) -> None:
+        with self._send_lock:
+            self._last_send = Clock.now()
+            if self.send_move(*move) is True:
+                with self._condition:
+                    self.sent_degree = move
+
+    def _send_pending(self) -> None:
+        if Clock.now() - self._last_send < self.min_interval:
+            return  # stays pending, the next submit sends it
+        with self._condition:
+            move = self._take_pending()
+        if move is not None:
+            self._send(move)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending[0] is None and self._pending[1] is None:
+                    self._condition.wait()
+                wait_time = self._last_send + self.min_interval - Clock.now()
+                if wait_time > 0:
+                    self._condition.wait(timeout=wait_time)  # let newer targets replace this one in the meantime
+                    continue
+                move = self._take_pending()
+            if move is None:
+                continue
+            try:
+                self._send(move)
+            except Exception as e:  # keep the thread alive, the next submitted target is sent as usual
+                METRICS.increment("servo_send_errors")
+                print(f"Failed to send the servo move {move}: {type(e).__name__}: {e}")
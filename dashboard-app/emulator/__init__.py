@@ -0,0 +1,2 @@
+from emulator.device import EmulatedDevice, EmulatorThread
+from emulator.frame_source import FrameSource, ImageFolderSource, TestPatternSource, VideoFileSource
@@ -0,0 +1,438 @@
+"""
+Emulated ESP32 Cam: serves `/camera` as a multipart MJPEG stream and speaks the firmware's websocket command set (text
+commands with sequence IDs, `PROTOCOL` negotiation and the binary commands), with injectable latency, jitter and
+packet loss. Any number of emulated cameras run on one event loop, each on its own port.
+
+Usage (from the dashboard-app directory):
+    python -m emulator.device --source ../smartcam-demo.mp4 --port 8080 --fps 15 --frame-size SVGA
+    python -m emulator.device --source frames/ --count 8 --port 9000 --latency 0.05 --jitter 0.02 --loss 0.01
+
+Then connect the dashboard to `127.0.0.1:8080`. From tests and benchmarks, use `EmulatorThread`:
+    with EmulatorThread([EmulatedDevice(source_path="../smartcam-demo.mp4")]) as emulator:
+        address = emulator.addresses[0]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from common import FrameSize
+from core import binary_protocol
+from core.device_client import OPCODE_BINARY, OPCODE_CLOSE, OPCODE_PING, OPCODE_PONG, OPCODE_TEXT, WEBSOCKET_MAGIC, \
+    mask_payload
+from emulator.frame_source import FrameSource
+
+
+MJPEG_HEADER = b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace;boundary=frame\r\n\r\n"
+FRAME_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+VELOCITY_TIMEOUT = 0.5  # seconds a VEL command lasts, like the firmware's motion planner
+
+
+@dataclass
+class DeviceState:
+    flash: bool = False
+    frame_size: FrameSize = FrameSize.SVGA
+    pan: float = 90.0
+    tilt: float = 90.0
+    pan_velocity: float = 0.0  # degrees per second
+    tilt_velocity: float = 0.0
+    max_velocity: float = 300.0  # motion planner limits, accepted but only the speed limit is emulated
+    max_acceleration: float = 2000.0
+    jpeg_quality: int = 12  # on the sensor's scale, 10 (best) - 63 (smallest frames)
+    target_fps: int = 0  # frame rate cap, 0 for none
+
+
+@dataclass
+class DeviceStats:
+    commands: int = 0  # commands received
+    lost: int = 0  # commands dropped by the emulated packet loss
+    frames_sent: int = 0  # MJPEG frames sent, summed over the clients
+    stream_clients: int = 0  # clients currently streaming
+
+
+class EmulatedDevice:
+
+    def __init__(self, source_path: Optional[str] = None, port: int = 0, host: str = "127.0.0.1", fps: float = 15.0,
+                 frame_size: FrameSize = FrameSize.SVGA, quality: int = 80, latency: float = 0.0,
+                 jitter: float = 0.0, loss: float = 0.0, seed: Optional[int] = None):
+        self.source_path = source_path  # video file or image folder, None for a test pattern
+        self.host = host
+        self.port = port  # 0 picks a free port, see `port` after `start()`
+        self.fps = fps
+        self.quality = quality
+        self.latency = latency  # command round-trip time (seconds)
+        self.jitter = jitter  # standard deviation of the round-trip time (seconds)
+        self.loss = loss  # probability that a command (and so its reply) is lost
+        self.random = random.Random(seed)
+        self.state = DeviceState(frame_size=frame_size)
+        self.stats = DeviceStats()
+        self.source: Optional[FrameSource] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._latest_jpeg: Optional[bytes] = None
+        self._frame_id = 0
+        self._new_frame: Optional[asyncio.Condition] = None
+        self._producer: Optional[asyncio.Task] = None
+        self._connections: set[asyncio.Task] = set()
+        self._velocity_time = 0.0  # when the last VEL command arrived (time.monotonic())
+        self._servo_time = 0.0  # up to when the velocities have been applied to the servo positions
+
+    @property
+    def address(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self.source = FrameSource.open(self.source_path, resolution=(self.state.frame_size.width,
+                                                                      self.state.frame_size.height),
+                                       quality=self.quality)
+        self._new_frame = asyncio.Condition()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._producer is not None:
+            self._producer.cancel()
+            self._producer = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for connection in list(self._connections):
+            connection.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self.source is not None:
+            self.source.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = asyncio.current_task()
+        self._connections.add(connection)
+        try:
+            request = (await reader.readuntil(b"\r\n\r\n")).decode("utf-8", errors="replace")
+            if request.startswith("GET /camera"):
+                await self._stream(writer)
+            elif "upgrade: websocket" in request.lower():
+                await self._websocket(request, reader, writer)
+            else:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n"
+                             b"<!doctype html><html><body><img src=\"/camera\"></body></html>")
+                await writer.drain()
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass  # the client went away
+        except asyncio.CancelledError:
+            pass  # the device is stopping
+        finally:
+            writer.close()
+            self._connections.discard(connection)
+
+    # --- MJPEG stream
+
+    async def _produce_frames(self) -> None:
+        """
+        Capture one frame per tick while anybody is streaming, every client sends the latest one. If the source fails,
+        a None frame ends the streams
+        """
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while self.stats.stream_clients > 0:
+            try:
+                jpeg = await loop.run_in_executor(None, self.source.next_jpeg)
+            except Exception as e:
+                print(f"Emulated SMART Cam on {self.address} can't capture a frame: {type(e).__name__}: {e}")
+                jpeg = None
+            async with self._new_frame:
+                self._latest_jpeg = jpeg
+                self._frame_id += 1
+                self._new_frame.notify_all()
+            if jpeg is None:
+                break
+            fps = min(self.fps, self.state.target_fps) if self.state.target_fps > 0 else self.fps
+            next_tick = max(next_tick + 1 / fps, loop.time())
+            await asyncio.sleep(next_tick - loop.time())
+        self._producer = None
+
+    async def _stream(self, writer: asyncio.StreamWriter) -> None:
+        writer.write(MJPEG_HEADER)
+        self.stats.stream_clients += 1
+        if self._producer is None:
+            self._producer = asyncio.get_running_loop().create_task(self._produce_frames())
+        sent_frame_id = self._frame_id
+        try:
+            while True:
+                async with self._new_frame:
+                    await self._new_frame.wait_for(lambda: self._frame_id != sent_frame_id)
+                    jpeg, sent_frame_id = self._latest_jpeg, self._frame_id
+                if jpeg is None:
+                    return  # the frame source failed, close the stream
+                writer.writelines((FRAME_HEADER, jpeg, b"\r\n"))
+                await writer.drain()  # a slow client skips the frames produced in the meantime
+                self.stats.frames_sent += 1
+        finally:
+            self.stats.stream_clients -= 1
+
+    # --- websocket commands
+
+    async def _websocket(self, request: str, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        websocket_key = None
+        for line in request.split("\r\n"):
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "sec-websocket-key":
+                websocket_key = value.strip()
+        if websocket_key is None:
+            return
+        accept = base64.b64encode(hashlib.sha1(websocket_key.encode() + WEBSOCKET_MAGIC).digest())
+        writer.write(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+        await writer.drain()
+        loop = asyncio.get_running_loop()
+        last_reply_time = loop.time()
+        while True:
+            opcode, payload = await self._read_frame(reader)
+            if opcode == OPCODE_CLOSE:
+                return
+            if opcode == OPCODE_PING:
+                self._write_frame(writer, OPCODE_PONG, payload)
+                continue
+            self.stats.commands += 1
+            if self.random.random() < self.loss:
+                self.stats.lost += 1
+                continue
+            round_trip_time = max(0.0, self.latency + (self.random.gauss(0, self.jitter) if self.jitter > 0 else 0))
+            last_reply_time = max(loop.time() + round_trip_time, last_reply_time)  # replies stay in order (TCP)
+            loop.call_at(last_reply_time - round_trip_time / 2, self._execute, writer, opcode, payload,
+                         last_reply_time)
+
+    def _execute(self, writer: asyncio.StreamWriter, opcode: int, payload: bytes, reply_time: float) -> None:
+        """ The command reached the device: apply it, and send the reply when it is due """
+        if opcode == OPCODE_BINARY:
+            reply = self.handle_binary_command(payload)
+            if reply is None:
+                return
+        elif opcode == OPCODE_TEXT:
+            reply = self.handle_tagged_command(payload.decode("utf-8", errors="replace")).encode("utf-8")
+        else:
+            return
+        asyncio.get_running_loop().call_at(reply_time, self._write_frame, writer, opcode, reply)
+
+    @staticmethod
+    async def _read_frame(reader: asyncio.StreamReader) -> tuple[int, bytes]:
+        first, second = await reader.readexactly(2)
+        length = second & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await reader.readexactly(8))[0]
+        mask = await reader.readexactly(4) if second & 0x80 else None
+        payload = await reader.readexactly(length)
+        return first & 0x0F, payload if mask is None else mask_payload(mask, payload)
+
+    @staticmethod
+    def _write_frame(writer: asyncio.StreamWriter, opcode: int, payload: bytes) -> None:
+        if writer.is_closing():
+            return
+        length = len(payload)
+        if length < 126:
+            header = struct.pack(">BB", 0x80 | opcode, length)
+        elif length < (1 << 16):
+            header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+        writer.write(header + payload)
+
+    def handle_tagged_command(self, message: str) -> str:
+        tag = None
+        if message.startswith("#"):
+            tag, _, message = message.partition(" ")
+        try:
+            reply = self.handle_command(message)
+        except (ValueError, IndexError) as exception:
+            reply = f"ERROR: Invalid Command - {exception}"
+        return reply if tag is None else f"{tag} {reply}"
+
+    def handle_command(self, message: str) -> str:
+        parsed = message.split()
+        command, args = parsed[0].upper(), parsed[1:]
+        if command == "PING" and len(args) == 0:
+            return "PONG"
+        if command == "FLASH" and len(args) == 1:
+            if args[0].lower() not in ("on", "off"):
+                return f"ERROR: Unknown Flash argument - {args[0].lower()}"
+            self.state.flash = args[0].lower() == "on"
+            return "success"
+        if command == "FRAMESIZE" and len(args) == 1:
+            return "success" if self.set_frame_size(int(args[0])) else \
+                f"ERROR: Unknown Camera Frame Size - {int(args[0])}"
+        if command == "MOVE" and len(args) == 2:
+            self.move(float(args[0]), float(args[1]))
+            return "success"
+        if command == "VEL" and len(args) == 2:
+            self.set_velocity(float(args[0]), float(args[1]))
+            return "success"
+        if command == "MOTION" and len(args) == 2:
+            return "success" if self.set_motion_limits(float(args[0]), float(args[1])) else \
+                f"ERROR: Invalid Motion Limits - {args[0]} {args[1]}"
+        if command == "POS" and len(args) == 0:
+            self._advance_servos()
+            return f"{self.state.pan:.2f} {self.state.tilt:.2f}"
+        if command == "QUALITY" and len(args) == 1:
+            return "success" if self.set_jpeg_quality(int(args[0])) else f"ERROR: Invalid JPEG Quality - {int(args[0])}"
+        if command == "FPS" and len(args) == 1:
+            return "success" if self.set_target_fps(int(args[0])) else f"ERROR: Invalid Frame Rate - {int(args[0])}"
+        if command == "PROTOCOL" and len(args) == 1:
+            return "success" if args[0].lower() in ("binary", "text") else f"ERROR: Unknown Protocol - {args[0]}"
+        return f"ERROR: Unknown Command - {command} (with {len(args)} arguments)"
+
+    def handle_binary_command(self, payload: bytes) -> Optional[bytes]:
+        if len(payload) != binary_protocol.REQUEST.size:
+            return None
+        command, sequence_id, arg1, arg2 = binary_protocol.REQUEST.unpack(payload)
+        status = binary_protocol.STATUS_OK
+        if command == binary_protocol.CMD_PING:
+            pass
+        elif command == binary_protocol.CMD_FLASH:
+            self.state.flash = arg1 != 0
+        elif command == binary_protocol.CMD_FRAMESIZE:
+            if self.set_frame_size(arg1) is False:
+                status = binary_protocol.STATUS_INVALID_ARGUMENT
+        elif command == binary_protocol.CMD_MOVE:
+            if arg1 > 18000 or arg2 > 18000:
+                status = binary_protocol.STATUS_INVALID_ARGUMENT
+            else:
+                self.move(arg1 / 100, arg2 / 100)
+        elif command == binary_protocol.CMD_VEL:
+            self.set_velocity(binary_protocol.to_signed(arg1) / 10, binary_protocol.to_signed(arg2) / 10)
+        elif command == binary_protocol.CMD_QUALITY:
+            if self.set_jpeg_quality(arg1) is False:
+                status = binary_protocol.STATUS_INVALID_ARGUMENT
+        elif command == binary_protocol.CMD_FPS:
+            if self.set_target_fps(arg1) is False:
+                status = binary_protocol.STATUS_INVALID_ARGUMENT
+        else:
+            status = binary_protocol.STATUS_UNKNOWN_COMMAND
+        return binary_protocol.REPLY.pack(command | binary_protocol.REPLY_FLAG, sequence_id, status)
+
+    def set_frame_size(self, key: int) -> bool:
+        for frame_size in FrameSize:
+            if frame_size.key == key:
+                self.state.frame_size = frame_size
+                if self.source is not None:
+                    self.source.resolution = (frame_size.width, frame_size.height)
+                return True
+        return False
+
+    def _advance_servos(self) -> None:
+        """ Apply the commanded velocities up to now, at constant speed (the planner's ramps aren't emulated) """
+        now = time.monotonic()
+        elapsed = max(0.0, min(now, self._velocity_time + VELOCITY_TIMEOUT) - self._servo_time)
+        self.state.pan = min(max(self.state.pan + self.state.pan_velocity * elapsed, 0.0), 180.0)
+        self.state.tilt = min(max(self.state.tilt + self.state.tilt_velocity * elapsed, 0.0), 180.0)
+        self._servo_time = now
+
+    def move(self, pan: float, tilt: float) -> None:
+        self._advance_servos()
+        self.state.pan, self.state.tilt = min(max(pan, 0.0), 180.0), min(max(tilt, 0.0), 180.0)
+        self.state.pan_velocity = self.state.tilt_velocity = 0.0
+
+    def set_velocity(self, pan_velocity: float, tilt_velocity: float) -> None:
+        self._advance_servos()
+        limit = self.state.max_velocity
+        self.state.pan_velocity = min(max(pan_velocity, -limit), limit)
+        self.state.tilt_velocity = min(max(tilt_velocity, -limit), limit)
+        self._velocity_time = self._servo_time
+
+    def set_motion_limits(self, max_velocity: float, max_acceleration: float) -> bool:
+        if not (0 <= max_velocity <= 1000 and 0 < max_acceleration <= 100000):
+            return False
+        self.state.max_velocity, self.state.max_acceleration = max_velocity, max_acceleration
+        return True
+
+    def set_jpeg_quality(self, quality: int) -> bool:
+        if not 10 <= quality <= 63:
+            return False
+        self.state.jpeg_quality = quality
+        if self.source is not None:  # the sensor's 10 - 63 onto OpenCV's 95 - 10
+            self.source.quality = round(95 - (quality - 10) * 85 / 53)
+        return True
+
+    def set_target_fps(self, fps: int) -> bool:
+        if not 0 <= fps <= 60:
+            return False
+        self.state.target_fps = fps
+        return True
+
+
+class EmulatorThread:
+    """ Runs emulated devices on an event loop in a daemon thread, for synchronous tests and benchmarks """
+
+    def __init__(self, devices: list[EmulatedDevice]):
+        self.devices = devices
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="device-emulator", daemon=True)
+
+    @property
+    def addresses(self) -> list[str]:
+        return [device.address for device in self.devices]
+
+    def start(self) -> "EmulatorThread":
+        self.thread.start()
+        for device in self.devices:
+            asyncio.run_coroutine_threadsafe(device.start(), self.loop).result()
+        return self
+
+    def stop(self) -> None:
+        for device in self.devices:
+            asyncio.run_coroutine_threadsafe(device.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def __enter__(self) -> "EmulatorThread":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+async def serve(devices: list[EmulatedDevice]) -> None:
+    for device in devices:
+        await device.start()
+        print(f"Emulated SMART Cam on {device.address} (stream: http://{device.address}/camera)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for device in devices:
+            await device.stop()
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Emulated ESP32 SMART Cam devices")
+    parser.add_argument("--source", help="video file or image folder, a test pattern if omitted")
+    parser.add_argument("--count", type=int, default=1, help="number of emulated cameras")
+    parser.add_argument("--port", type=int, default=8080, help="port of the first camera, the others follow")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--fps", type=float, default=15.0)
+    parser.add_argument("--frame-size", default=FrameSize.SVGA.name,
+                        choices=[frame_size.name for frame_size in FrameSize])
+    parser.add_argument("--quality", type=int, default=80, help="JPEG quality")
+    parser.add_argument("--latency", type=float, default=0.0, help="command round-trip time (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="round-trip time std deviation (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="probability that a command is lost")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(arguments)
+
+    devices = [
+        EmulatedDevice(source_path=args.source, port=args.port + index, host=args.host, fps=args.fps,
+                       frame_size=FrameSize[args.frame_size], quality=args.quality, latency=args.latency,
+                       jitter=args.jitter, loss=args.loss, seed=None if args.seed is None else args.seed + index)
+        for index in range(args.count)
+    ]
+    try:
+        asyncio.run(serve(devices))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+class FrameSource(ABC):
+    """ Endless supply of JPEG frames for an emulated camera, resized to `resolution` (width, height) if set """
+
+    def __init__(self, resolution: Optional[tuple[int, int]] = None, quality: int = 80):
+        self.resolution = resolution
+        self.quality = quality
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        if self.resolution is not None and (frame.shape[1], frame.shape[0]) != self.resolution:
+            frame = cv2.resize(frame, self.resolution, interpolation=cv2.INTER_AREA)
+        success, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if success is False:
+            raise ValueError("Failed to encode an emulated camera frame")
+        return jpeg.tobytes()
+
+    @abstractmethod
+    def next_jpeg(self) -> bytes:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def open(path: Optional[str], resolution: Optional[tuple[int, int]] = None, quality: int = 80) -> "FrameSource":
+        """ A folder of images, a video file, or a synthetic test pattern if `path` is None """
+        if path is None:
+            return TestPatternSource(resolution=resolution or (800, 600), quality=quality)
+        if os.path.isdir(path):
+            return ImageFolderSource(path, resolution=resolution, quality=quality)
+        return VideoFileSource(path, resolution=resolution, quality=quality)
+
+
+class VideoFileSource(FrameSource):
+    """ Decodes a video file frame by frame, starting over at the end """
+
+    def __init__(self, path: str, resolution: Optional[tuple[int, int]] = None, quality: int = 80):
+        super().__init__(resolution=resolution, quality=quality)
+        self.path = path
+        self.capture = cv2.VideoCapture(path)
+        if self.capture.isOpened() is False:
+            raise ValueError(f"Can't open the video {path}")
+
+    def next_jpeg(self) -> bytes:
+        success, frame = self.capture.read()
+        if success is False:  # end of the video
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture.read()
+            if success is False:
+                raise ValueError(f"Can't read a frame from the video {self.path}")
+        return self._encode(frame)
+
+    def close(self) -> None:
+        self.capture.release()
+
+
+class ImageFolderSource(FrameSource):
+    """ Cycles through the images of a folder (in name order), encoded once up front """
+
+    def __init__(self, path: str, resolution: Optional[tuple[int, int]] = None, quality: int = 80):
+        super().__init__(resolution=resolution, quality=quality)
+        self.jpegs = []
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(path, name))
+                if frame is not None:
+                    self.jpegs.append(self._encode(frame))
+        if len(self.jpegs) == 0:
+            raise ValueError(f"No images found in {path}")
+        self.index = 0
+
+    def next_jpeg(self) -> bytes:
+        jpeg = self.jpegs[self.index]
+        self.index = (self.index + 1) % len(self.jpegs)
+        return jpeg
+
+
+class TestPatternSource(FrameSource):
+    """ A moving bar on a gradient, for when no recording is at hand """
+
+    def __init__(self, resolution: tuple[int, int] = (800, 600), quality: int = 80):
+        super().__init__(resolution=resolution, quality=quality)
+        self.background: Optional[np.ndarray] = None
+        self.index = 0
+
+    def next_jpeg(self) -> bytes:
+        width, height = self.resolution
+        if self.background is None or self.background.shape[:2] != (height, width):  # the frame size changed
+            gradient = np.linspace(0, 255, width, dtype=np.uint8)
+            self.background = np.ascontiguousarray(np.broadcast_to(gradient[None, :, None], (height, width, 3)))
+        frame = self.background.copy()
+        left = (self.index * 8) % width
+        frame[:, left:left + 20] = (0, 0, 255)
+        self.index += 1
+        return self._encode(frame)
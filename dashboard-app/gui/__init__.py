@@ -4,6 +4,7 @@ from core.esp32_bridge import Esp32Bridge
 from gui.camera_gui import CameraGui
 from gui.config_gui import ConfigGui
 from gui.logging_gui import LoggingGui
+from gui.stats_gui import StatsGui
 from gui.tracker_gui import TrackerGui
 from logic import VideoHandler
 
@@ -15,6 +16,7 @@ cam_gui = CameraGui(video_handler=video_handler)
 config_gui = ConfigGui(video_handler=video_handler)
 tracker_gui = TrackerGui(video_handler=video_handler)
 logging_gui = LoggingGui(video_handler=video_handler)
+stats_gui = StatsGui(video_handler=video_handler, logger_class=logging_gui)
 
 
 PARENT_CONTAINER = ft.Container(
@@ -53,6 +55,11 @@ PARENT_CONTAINER = ft.Container(
                     text="Logs",
                     icon=ft.icons.NOTES,
                     content=ft.Container(alignment=ft.alignment.center, content=logging_gui),
+                ),
+                ft.Tab(
+                    text="Stats",
+                    icon=ft.icons.INSIGHTS,
+                    content=ft.Container(alignment=ft.alignment.center, content=stats_gui),
                 )
             ]
         )
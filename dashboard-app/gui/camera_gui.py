@@ -2,6 +2,7 @@ import time
 
 import flet as ft
 
+from common import METRICS
 from logic import VideoHandler
 
 
@@ -33,21 +34,25 @@ class CameraGui(ft.UserControl):
             )
         )
         self.fps_value_label = ft.Text("n/a", size=15, weight=ft.FontWeight.NORMAL)
+        self.pipeline_value_label = ft.Text("n/a", size=12, weight=ft.FontWeight.NORMAL)
 
     def did_mount(self):
-        """ Load update_timer() when FLET run """
+        """ Start the frame pipeline and load update_timer() when FLET run """
+        self.video_handler.start_pipeline()
         self.update_timer()
 
+    def will_unmount(self):
+        self.video_handler.stop_pipeline()
+
     def update_timer(self):
         while True:
-            base64_frame = self.video_handler.process_frame()
+            base64_frame = self.video_handler.get_latest_frame(timeout=.1)
 
             if base64_frame is None:
-                if self.camera_feed_image.visible is True:
+                if self.camera_feed_image.visible is True and self.video_handler.is_streaming() is False:
                     self.camera_feed_image.visible = False
-                    self.fps_value_label.value = "n/a"
+                    self.fps_value_label.value = self.pipeline_value_label.value = "n/a"
                     self.update()
-                time.sleep(.1)
                 continue
 
             if self.camera_feed_image.visible is False:
@@ -95,12 +100,20 @@ class CameraGui(ft.UserControl):
                 ft.Row([
                     ft.Text("FPS : ", size=15, weight=ft.FontWeight.BOLD),
                     self.fps_value_label
+                ]),
+                ft.Row([
+                    ft.Text("Pipeline (queued/dropped) : ", size=12, weight=ft.FontWeight.BOLD),
+                    self.pipeline_value_label
                 ])
             ]),
         ])
 
     def update_fps(self):
         new_frame_time = time.time()
+        METRICS.observe("gui_frame_interval", new_frame_time - self.last_frame_time)
         fps = 1 / (new_frame_time - self.last_frame_time)
         self.fps_value_label.value = f"{fps:.2f}"
         self.last_frame_time = new_frame_time
+        self.pipeline_value_label.value = "  ".join(
+            f"{stats.name} {stats.queue_depth}/{stats.dropped}" for stats in self.video_handler.pipeline.stats()
+        )
@@ -1,7 +1,9 @@
 import flet as ft
 
 from common import FrameSize
+from core import ControllerType
 from logic import VideoHandler
+from logic.link_monitor import LinkState, LinkStatus
 
 
 class ConfigGui(ft.UserControl):
@@ -11,6 +13,8 @@ class ConfigGui(ft.UserControl):
         self.video_handler = video_handler
         self.esp32_bridge = self.video_handler.esp32_bridge
         self.esp32_bridge.move_servo_callback = self.update_slider
+        self.link_monitor = self.video_handler.link_monitor
+        self.link_monitor.on_update = self.update_link_status
 
         self.ip_textfield = ft.TextField(label="IP Address", prefix_text="https:// ", suffix_text="/camera",
                                          value="192.168.4.1", on_submit=self.submit_ip_address)
@@ -24,6 +28,14 @@ class ConfigGui(ft.UserControl):
             options=[ft.dropdown.Option(frame_size.name) for frame_size in FrameSize],
             on_change=self.select_resolution,
         )
+        self.adaptive_switch = ft.Switch(label="adapt to link quality", value=self.link_monitor.adaptive,
+                                         on_change=self.toggle_adaptive)
+        self.quality_slider = ft.Slider(min=10, max=63, divisions=53, label="{value}",
+                                        value=self.esp32_bridge.jpeg_quality, on_change=self.set_jpeg_quality)
+        self.fps_slider = ft.Slider(min=0, max=30, divisions=30, label="{value} fps",
+                                    value=self.esp32_bridge.target_fps, on_change=self.set_target_fps)
+        self.link_icon = ft.Icon(name=ft.icons.WIFI, color=ft.colors.GREEN)
+        self.link_text = ft.Text("n/a", size=12)
         self.cam_config_card = ft.Card(
             scale=2,
             opacity=0,
@@ -40,7 +52,15 @@ class ConfigGui(ft.UserControl):
                     ft.Row(
                         alignment=ft.MainAxisAlignment.SPACE_AROUND,
                         controls=[self.flash_switch, self.resolution_dropdown]
-                    )
+                    ),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.adaptive_switch, ft.Row([self.link_icon, self.link_text])]
+                    ),
+                    ft.Text("JPEG Quality (10 best - 63 smallest)", size=15, weight=ft.FontWeight.NORMAL),
+                    self.quality_slider,
+                    ft.Text("Max Frame Rate (0 unlimited)", size=15, weight=ft.FontWeight.NORMAL),
+                    self.fps_slider
                 ]),
             )
         )
@@ -51,6 +71,35 @@ class ConfigGui(ft.UserControl):
                                     on_change=self.pan_servo)
         self.tilt_slider = ft.Slider(min=0, max=180, divisions=180, label="{value}", value=tilt_value,
                                      on_change=self.tilt_servo)
+        pan_tilt_controller = self.esp32_bridge.pan_tilt_controller
+        self.controller_dropdown = ft.Dropdown(
+            width=150,
+            height=50,
+            label="Controller",
+            value=pan_tilt_controller.controller_type.name,
+            options=[ft.dropdown.Option(controller_type.name) for controller_type in ControllerType],
+            on_change=self.select_controller,
+        )
+        self.kp_slider = ft.Slider(min=0, max=2, divisions=40, label="Kp {value}", value=pan_tilt_controller.kp,
+                                   on_change=self.set_gains)
+        self.ki_slider = ft.Slider(min=0, max=1, divisions=20, label="Ki {value}", value=pan_tilt_controller.ki,
+                                   on_change=self.set_gains)
+        self.kd_slider = ft.Slider(min=0, max=0.5, divisions=50, label="Kd {value}", value=pan_tilt_controller.kd,
+                                   on_change=self.set_gains)
+        self.pan_fov_slider = ft.Slider(min=20, max=120, divisions=100, label="{value}°",
+                                        value=pan_tilt_controller.pan_fov, on_change=self.set_fov)
+        self.tilt_fov_slider = ft.Slider(min=20, max=120, divisions=100, label="{value}°",
+                                         value=pan_tilt_controller.tilt_fov, on_change=self.set_fov)
+        servo_scheduler = self.esp32_bridge.servo_scheduler
+        self.command_rate_slider = ft.Slider(min=5, max=50, divisions=45, label="{value} Hz",
+                                             value=servo_scheduler.max_rate, on_change=self.set_servo_scheduling)
+        self.deadband_slider = ft.Slider(min=0, max=2, divisions=20, label="{value}°",
+                                         value=servo_scheduler.deadband, on_change=self.set_servo_scheduling)
+        self.servo_speed_slider = ft.Slider(min=0, max=600, divisions=60, label="{value}°/s",
+                                            value=self.esp32_bridge.servo_speed, on_change=self.set_motion_limits)
+        self.servo_acceleration_slider = ft.Slider(min=500, max=10000, divisions=19, label="{value}°/s²",
+                                                   value=self.esp32_bridge.servo_acceleration,
+                                                   on_change=self.set_motion_limits)
         self.servo_config_card = ft.Card(
             scale=2,
             opacity=0,
@@ -71,7 +120,27 @@ class ConfigGui(ft.UserControl):
                     ft.Text("Manual Panning", size=15, weight=ft.FontWeight.NORMAL),
                     self.pan_slider,
                     ft.Text("Manual Tilting", size=15, weight=ft.FontWeight.NORMAL),
-                    self.tilt_slider
+                    self.tilt_slider,
+                    ft.Row([
+                        ft.Text("Tracking Controller", size=15, weight=ft.FontWeight.NORMAL),
+                        self.controller_dropdown
+                    ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+                    ft.Text("Gains (Kp, Ki, Kd)", size=15, weight=ft.FontWeight.NORMAL),
+                    self.kp_slider,
+                    self.ki_slider,
+                    self.kd_slider,
+                    ft.Text("Horizontal Field of View", size=15, weight=ft.FontWeight.NORMAL),
+                    self.pan_fov_slider,
+                    ft.Text("Vertical Field of View", size=15, weight=ft.FontWeight.NORMAL),
+                    self.tilt_fov_slider,
+                    ft.Text("Max Command Rate", size=15, weight=ft.FontWeight.NORMAL),
+                    self.command_rate_slider,
+                    ft.Text("Servo Deadband", size=15, weight=ft.FontWeight.NORMAL),
+                    self.deadband_slider,
+                    ft.Text("Max Servo Speed (0 turns the motion planner off)", size=15, weight=ft.FontWeight.NORMAL),
+                    self.servo_speed_slider,
+                    ft.Text("Servo Acceleration", size=15, weight=ft.FontWeight.NORMAL),
+                    self.servo_acceleration_slider
                 ]),
             )
         )
@@ -119,6 +188,7 @@ class ConfigGui(ft.UserControl):
             )
             return
         self.resolution_dropdown.value = self.esp32_bridge.frame_size = self.video_handler.determine_frame_size()
+        self.link_monitor.start(frame_size=self.esp32_bridge.frame_size)
         self.cam_config_card.scale = self.cam_config_card.opacity = 1
         self.servo_config_card.scale = self.servo_config_card.opacity = 1
         self.update()
@@ -139,6 +209,26 @@ class ConfigGui(ft.UserControl):
         frame_size = FrameSize[self.resolution_dropdown.value]
         self.esp32_bridge.set_frame_size(frame_size=frame_size)
         self.video_handler.set_frame_size(frame_size=frame_size)
+        self.link_monitor.set_ceiling(frame_size)
+
+    def set_jpeg_quality(self, event: ft.ControlEvent):
+        self.esp32_bridge.set_jpeg_quality(quality=int(self.quality_slider.value))
+
+    def set_target_fps(self, event: ft.ControlEvent):
+        self.esp32_bridge.set_target_fps(fps=int(self.fps_slider.value))
+
+    def toggle_adaptive(self, event: ft.ControlEvent):
+        self.link_monitor.adaptive = self.adaptive_switch.value
+
+    def update_link_status(self, status: LinkStatus):
+        """ Called by the link monitor (on its own thread) after every evaluation """
+        self.link_icon.name, self.link_icon.color = {
+            LinkState.GOOD: (ft.icons.WIFI, ft.colors.GREEN),
+            LinkState.DEGRADED: (ft.icons.NETWORK_CHECK, ft.colors.ORANGE),
+            LinkState.DOWN: (ft.icons.WIFI_OFF, ft.colors.RED),
+        }[status.state]
+        self.link_text.value = status.describe()
+        self.update()
 
     def toggle_auto_pan(self, event: ft.ControlEvent):
         if self.pan_slider.disabled != self.auto_pan_switch.value:
@@ -152,6 +242,25 @@ class ConfigGui(ft.UserControl):
             self.update()
         self.esp32_bridge.auto_tilt = self.auto_tilt_switch.value
 
+    def select_controller(self, event: ft.ControlEvent):
+        self.esp32_bridge.pan_tilt_controller.set_controller_type(ControllerType[self.controller_dropdown.value])
+
+    def set_gains(self, event: ft.ControlEvent):
+        self.esp32_bridge.pan_tilt_controller.set_gains(kp=self.kp_slider.value, ki=self.ki_slider.value,
+                                                        kd=self.kd_slider.value)
+
+    def set_fov(self, event: ft.ControlEvent):
+        self.esp32_bridge.pan_tilt_controller.pan_fov = self.pan_fov_slider.value
+        self.esp32_bridge.pan_tilt_controller.tilt_fov = self.tilt_fov_slider.value
+
+    def set_servo_scheduling(self, event: ft.ControlEvent):
+        self.esp32_bridge.servo_scheduler.max_rate = self.command_rate_slider.value
+        self.esp32_bridge.servo_scheduler.deadband = self.deadband_slider.value
+
+    def set_motion_limits(self, event: ft.ControlEvent):
+        self.esp32_bridge.set_motion_limits(max_velocity=self.servo_speed_slider.value,
+                                            max_acceleration=self.servo_acceleration_slider.value)
+
     def pan_servo(self, event: ft.ControlEvent):
         self.esp32_bridge.move_servo(pan_degree=self.pan_slider.value, tilt_degree=None)
 
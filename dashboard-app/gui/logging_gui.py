@@ -14,6 +14,7 @@ class LoggingGui(ft.UserControl, LoggerInterface):
         self.video_handler = video_handler
         self.esp32_bridge = self.video_handler.esp32_bridge
         self.esp32_bridge.socket_handler.logger_class = self  # always log websocket connections
+        self.video_handler.link_monitor.logger_class = self  # and reconnects and frame size changes
         self.log_length_dropdown = ft.Dropdown(
             width=100,
             height=50,
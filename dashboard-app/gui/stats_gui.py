@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+from typing import Optional
+
+import flet as ft
+
+from common import LoggerInterface, METRICS
+from logic import VideoHandler
+
+
+class StatsGui(ft.UserControl):
+
+    REFRESH_SECONDS = 1
+    METRICS_PORT = 9108
+    EXPORT_FILENAME = "metrics.prom"
+
+    def __init__(self, video_handler: VideoHandler, logger_class: Optional[LoggerInterface] = None):
+        super().__init__()
+        self.video_handler = video_handler
+        self.logger_class = logger_class
+
+        self.metrics_switch = ft.Switch(label="collect metrics", value=METRICS.enabled, on_change=self.toggle_metrics)
+        self.http_switch = ft.Switch(label=f"HTTP endpoint (:{self.METRICS_PORT})", value=False,
+                                     on_change=self.toggle_http)
+        self.export_button = ft.ElevatedButton("export", icon=ft.icons.SAVE_ALT, on_click=self.export_metrics)
+        self.timer_table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(title), numeric=title != "Timer")
+                     for title in ("Timer", "p50 (ms)", "p90 (ms)", "p99 (ms)", "count")],
+            rows=[]
+        )
+        self.pipeline_table = ft.DataTable(
+            columns=[ft.DataColumn(ft.Text(title), numeric=title != "Stage")
+                     for title in ("Stage", "queued", "dropped", "processed", "errors", "last (ms)")],
+            rows=[]
+        )
+        self.counters_text = ft.Text("n/a", size=12)
+        self.mounted = False
+
+    def did_mount(self):
+        self.mounted = True
+        threading.Thread(target=self.refresh_loop, name="stats-gui", daemon=True).start()
+
+    def will_unmount(self):
+        self.mounted = False
+
+    def refresh_loop(self):
+        while self.mounted is True:
+            time.sleep(self.REFRESH_SECONDS)
+            if METRICS.enabled is True:
+                self.refresh()
+
+    def refresh(self):
+        for stats in self.video_handler.pipeline.stats():
+            METRICS.set_gauge(f"pipeline_{stats.name}_queue_depth", stats.queue_depth)
+            METRICS.set_gauge(f"pipeline_{stats.name}_dropped", stats.dropped)
+        snapshot = METRICS.snapshot()
+        self.timer_table.rows = [
+            ft.DataRow(cells=[ft.DataCell(ft.Text(name))] + [
+                ft.DataCell(ft.Text(f"{timer['quantiles'].get(quantile, 0) * 1000:.2f}")) for quantile in (.5, .9, .99)
+            ] + [ft.DataCell(ft.Text(str(timer["count"])))])
+            for name, timer in sorted(snapshot["timers"].items())
+        ]
+        self.pipeline_table.rows = [
+            ft.DataRow(cells=[
+                ft.DataCell(ft.Text(stats.name)),
+                ft.DataCell(ft.Text(str(stats.queue_depth))),
+                ft.DataCell(ft.Text(str(stats.dropped))),
+                ft.DataCell(ft.Text(str(stats.processed))),
+                ft.DataCell(ft.Text(str(stats.errors))),
+                ft.DataCell(ft.Text(f"{stats.last_latency * 1000:.2f}")),
+            ])
+            for stats in self.video_handler.pipeline.stats()
+        ]
+        self.counters_text.value = "  ".join(f"{name}: {value:g}"
+                                             for name, value in sorted(snapshot["counters"].items())) or "n/a"
+        self.update()
+
+    def toggle_metrics(self, event: ft.ControlEvent):
+        METRICS.enabled = self.metrics_switch.value
+        if METRICS.enabled is False:
+            METRICS.reset()
+
+    def toggle_http(self, event: ft.ControlEvent):
+        if self.http_switch.value is True:
+            try:
+                METRICS.serve(port=self.METRICS_PORT)
+            except OSError as e:  # e.g. the port is taken
+                msg = f"Can't serve the metrics on port {self.METRICS_PORT}: {e}"
+                print(msg)
+                if self.logger_class is not None:
+                    self.logger_class.log(message=msg, fg_color="red")
+                self.http_switch.value = False
+                self.http_switch.update()
+        else:
+            METRICS.stop_serving()
+
+    def export_metrics(self, event: ft.ControlEvent):
+        METRICS.write_prometheus(os.path.join(os.getcwd(), self.EXPORT_FILENAME))
+
+    def build(self):
+        return ft.Card(
+            width=500,
+            elevation=30,
+            margin=ft.margin.only(top=20, bottom=70),
+            content=ft.Container(
+                bgcolor=ft.colors.WHITE24,
+                padding=30,
+                border_radius=ft.border_radius.all(20),
+                content=ft.Column(scroll=ft.ScrollMode.AUTO, controls=[
+                    ft.Text("Performance Stats", size=20, weight=ft.FontWeight.BOLD),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.metrics_switch, self.http_switch, self.export_button]
+                    ),
+                    ft.Text("Hot Path Timers", size=15, weight=ft.FontWeight.NORMAL),
+                    self.timer_table,
+                    ft.Text("Frame Pipeline", size=15, weight=ft.FontWeight.NORMAL),
+                    self.pipeline_table,
+                    ft.Text("Counters", size=15, weight=ft.FontWeight.NORMAL),
+                    self.counters_text
+                ]),
+            )
+        )
@@ -1,6 +1,10 @@
+from concurrent.futures import Future
+
 import flet as ft
 
 from logic import VideoHandler
+from logic.frame_encoder import ImageFormat
+from logic.model_backends import ModelBackend
 
 
 class TrackerGui(ft.UserControl):
@@ -17,6 +21,23 @@ class TrackerGui(ft.UserControl):
             options=[ft.dropdown.Option(model_name) for model_name in self.video_handler.list_downloaded_models()],
             on_change=self.select_model,
         )
+        self.model_loading_ring = ft.ProgressRing(width=20, height=20, stroke_width=3, visible=False)
+        self.backend_dropdown = ft.Dropdown(
+            width=150,
+            height=50,
+            label="Backend",
+            options=[ft.dropdown.Option(backend.name) for backend in ModelBackend],
+            value=self.video_handler.model_backend.name,
+            on_change=self.select_model,
+        )
+        self.decode_scale_dropdown = ft.Dropdown(
+            width=150,
+            height=50,
+            label="Detector Input",
+            options=[ft.dropdown.Option(key=str(scale), text=f"1/{scale} scale") for scale in (1, 2, 4)],
+            value=str(self.video_handler.decode_scale),
+            on_change=self.select_decode_scale,
+        )
         self.tracking_switch = ft.Switch(label="tracking disabled", value=self.cam_controller.tracking_enabled,
                                          on_change=self.toggle_tracking)
         self.show_bounding_box_switch = ft.Switch(label="bounding box", value=self.video_handler.show_bounding_boxes,
@@ -31,10 +52,81 @@ class TrackerGui(ft.UserControl):
                                          min=0, max=300, divisions=300, on_change=self.sliding_boundary)
         self.coyote_slider = ft.Slider(width=600, label="{value}", value=self.cam_controller.coyote_seconds,
                                        min=0, max=10, divisions=10, on_change=self.sliding_coyote)
+        inference_cadence = self.video_handler.inference_cadence
+        self.adaptive_inference_switch = ft.Switch(label="adaptive inference", value=inference_cadence.enabled,
+                                                   on_change=self.toggle_adaptive_inference)
+        self.target_fps_slider = ft.Slider(width=600, label="{value}", value=inference_cadence.target_fps,
+                                           min=1, max=30, divisions=29, on_change=self.sliding_target_fps)
+        self.roi_inference_switch = ft.Switch(label="target ROI inference",
+                                              value=self.video_handler.roi_inference.enabled,
+                                              on_change=self.toggle_roi_inference)
+        self.inference_process_switch = ft.Switch(label="separate inference process",
+                                                  value=self.video_handler.inference_worker is not None,
+                                                  on_change=self.toggle_inference_process)
+        frame_encoder = self.video_handler.frame_encoder
+        self.image_format_dropdown = ft.Dropdown(
+            width=150,
+            height=50,
+            label="Display Format",
+            options=[ft.dropdown.Option(image_format.name) for image_format in ImageFormat],
+            value=frame_encoder.image_format.name,
+            on_change=self.select_image_format,
+        )
+        self.display_scale_dropdown = ft.Dropdown(
+            width=150,
+            height=50,
+            label="Display Size",
+            options=[ft.dropdown.Option(key=str(scale), text=f"{int(scale * 100)}%") for scale in (1.0, 0.75, 0.5)],
+            value=str(frame_encoder.display_scale),
+            on_change=self.select_display_scale,
+        )
+        self.quality_slider = ft.Slider(width=600, label="{value}", value=frame_encoder.quality,
+                                        min=10, max=100, divisions=18, on_change=self.sliding_quality)
         # TODO: add boundary and coyote RESET icon to reset the values to DEFAULT values
 
     def select_model(self, event: ft.ControlEvent):
-        self.video_handler.set_model(model_name=self.model_dropdown.value)
+        future = self.video_handler.set_model(model_name=self.model_dropdown.value,
+                                              backend=ModelBackend[self.backend_dropdown.value])
+        if future.done() is False:
+            self.model_loading_ring.visible = True
+            self.update()
+            future.add_done_callback(self.model_loaded)
+
+    def model_loaded(self, future: Future):
+        self.model_loading_ring.visible = False
+        self.update()
+
+    def select_decode_scale(self, event: ft.ControlEvent):
+        self.video_handler.set_decode_scale(decode_scale=int(self.decode_scale_dropdown.value))
+
+    def toggle_adaptive_inference(self, event: ft.ControlEvent):
+        self.video_handler.inference_cadence.enabled = self.adaptive_inference_switch.value
+        self.video_handler.inference_cadence.reset()
+
+    def sliding_target_fps(self, event: ft.ControlEvent):
+        self.video_handler.inference_cadence.target_fps = self.target_fps_slider.value
+
+    def toggle_inference_process(self, event: ft.ControlEvent):
+        future = self.video_handler.set_inference_process(enabled=self.inference_process_switch.value)
+        if future.done() is False:
+            self.model_loading_ring.visible = True
+            self.update()
+            future.add_done_callback(self.model_loaded)
+
+    def toggle_roi_inference(self, event: ft.ControlEvent):
+        self.video_handler.roi_inference.enabled = self.roi_inference_switch.value
+        self.video_handler.roi_inference.reset()
+
+    def select_image_format(self, event: ft.ControlEvent):
+        self.video_handler.frame_encoder.image_format = ImageFormat[self.image_format_dropdown.value]
+        self.quality_slider.disabled = self.video_handler.frame_encoder.image_format != ImageFormat.JPEG
+        self.update()
+
+    def select_display_scale(self, event: ft.ControlEvent):
+        self.video_handler.frame_encoder.display_scale = float(self.display_scale_dropdown.value)
+
+    def sliding_quality(self, event: ft.ControlEvent):
+        self.video_handler.frame_encoder.quality = int(self.quality_slider.value)
 
     def toggle_tracking(self, event: ft.ControlEvent):
         self.cam_controller.tracking_enabled = self.tracking_switch.value
@@ -72,8 +164,22 @@ class TrackerGui(ft.UserControl):
                     ft.Text("Tracker Settings", size=20, weight=ft.FontWeight.BOLD),
                     ft.Row(
                         alignment=ft.MainAxisAlignment.SPACE_AROUND,
-                        controls=[self.model_dropdown, self.tracking_switch]
+                        controls=[ft.Row([self.model_dropdown, self.model_loading_ring]), self.tracking_switch]
+                    ),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.backend_dropdown, self.decode_scale_dropdown]
                     ),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.adaptive_inference_switch, self.roi_inference_switch]
+                    ),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.inference_process_switch]
+                    ),
+                    ft.Text("Adaptive Inference Target FPS", size=15, weight=ft.FontWeight.NORMAL),
+                    self.target_fps_slider,
                     ft.Text("Heads-Up Display", size=15, weight=ft.FontWeight.NORMAL),
                     ft.Row(
                         alignment=ft.MainAxisAlignment.SPACE_AROUND,
@@ -85,7 +191,14 @@ class TrackerGui(ft.UserControl):
                     ft.Text("Boundary Size", size=15, weight=ft.FontWeight.NORMAL),
                     self.boundary_slider,
                     ft.Text("Coyote Pause (in seconds)", size=15, weight=ft.FontWeight.NORMAL),
-                    self.coyote_slider
+                    self.coyote_slider,
+                    ft.Text("Display Encoding", size=15, weight=ft.FontWeight.NORMAL),
+                    ft.Row(
+                        alignment=ft.MainAxisAlignment.SPACE_AROUND,
+                        controls=[self.image_format_dropdown, self.display_scale_dropdown]
+                    ),
+                    ft.Text("Display Quality", size=15, weight=ft.FontWeight.NORMAL),
+                    self.quality_slider
                 ]),
             )
         )
@@ -0,0 +1,56 @@
+from typing import Optional
+
+import numpy as np
+from supervision import Detections
+
+
+class BoxPropagator:
+    """
+    BoxPropagator moves the last known detections forward in time with a constant-velocity model, so frames that skip
+    the detector still get detections (with their tracker IDs) for the CamController.
+
+    Every real detector result is passed to `update(...)`, which estimates a velocity for each tracker ID by comparing
+    its box center with the previous result. `predict(...)` shifts the boxes (keeping their size) to the time of a new
+    frame.
+    """
+
+    def __init__(self, smoothing: float = 0.5, max_extrapolation: float = 1.0):
+        self.smoothing = smoothing  # weight of the newest velocity measurement (exponential moving average)
+        self.max_extrapolation = max_extrapolation  # never extrapolate further than this many seconds
+        self.detections: Optional[Detections] = None
+        self.timestamp: Optional[float] = None
+        self.velocities: Optional[np.ndarray] = None  # pixel/second of each box center (N x 2)
+
+    def reset(self) -> None:
+        self.detections = self.timestamp = self.velocities = None
+
+    def update(self, detections: Detections, timestamp: float) -> None:
+        velocities = np.zeros((len(detections), 2), dtype=np.float32)
+        if self.detections is not None and detections.tracker_id is not None and self.detections.tracker_id is not None:
+            delta_time = timestamp - self.timestamp
+            if delta_time > 0:
+                previous_index = {tracker_id: index for index, tracker_id in enumerate(self.detections.tracker_id)}
+                for index, tracker_id in enumerate(detections.tracker_id):
+                    previous = previous_index.get(tracker_id)
+                    if previous is None:
+                        continue
+                    displacement = (detections.xyxy[index] - self.detections.xyxy[previous]).reshape(2, 2).mean(axis=0)
+                    measured = displacement / delta_time
+                    velocities[index] = self.smoothing * measured + (1 - self.smoothing) * self.velocities[previous]
+        self.detections = detections
+        self.timestamp = timestamp
+        self.velocities = velocities
+
+    def predict(self, timestamp: float, width: int, height: int) -> Detections:
+        if self.detections is None or len(self.detections) == 0:
+            return Detections.empty()
+        delta_time = min(max(timestamp - self.timestamp, 0), self.max_extrapolation)
+        xyxy = self.detections.xyxy + np.tile(self.velocities * delta_time, 2)
+        xyxy[:, [0, 2]] = np.clip(xyxy[:, [0, 2]], 0, width)
+        xyxy[:, [1, 3]] = np.clip(xyxy[:, [1, 3]], 0, height)
+        return Detections(
+            xyxy=xyxy,
+            confidence=self.detections.confidence,
+            class_id=self.detections.class_id,
+            tracker_id=self.detections.tracker_id
+        )
@@ -0,0 +1,59 @@
+import binascii
+from enum import Enum
+from typing import Optional
+
+import cv2
+import numpy as np
+
+
+class ImageFormat(Enum):
+    JPEG = ".jpg"
+    PNG = ".png"
+
+    @property
+    def extension(self) -> str:
+        return self.value
+
+
+class FrameEncoder:
+    """
+    FrameEncoder turns frames into the base64 strings the Flet GUI displays (`ft.Image.src_base64`).
+
+    - JPEG (with a quality setting) is much cheaper to encode than PNG, PNG is kept for lossless output
+    - `display_scale` downscales the frame before encoding, the resize buffer is reused between frames
+    - `passthrough(...)` sends the camera's own JPEG to the GUI without decoding and re-encoding it
+    """
+
+    def __init__(self, image_format: ImageFormat = ImageFormat.JPEG, quality: int = 80, display_scale: float = 1.0):
+        self.image_format = image_format
+        self.quality = quality  # JPEG quality (0 - 100)
+        self.display_scale = display_scale  # e.g. 0.5 displays the frame at half of its size
+        self._resize_buffer: Optional[np.ndarray] = None
+
+    def _encode_params(self) -> list[int]:
+        if self.image_format == ImageFormat.JPEG:
+            return [cv2.IMWRITE_JPEG_QUALITY, int(self.quality)]
+        return [cv2.IMWRITE_PNG_COMPRESSION, 1]  # favour speed over size
+
+    def _scale(self, frame: np.ndarray) -> np.ndarray:
+        if self.display_scale == 1:
+            return frame
+        frame_height, frame_width = frame.shape[:2]
+        size = (max(1, int(frame_width * self.display_scale)), max(1, int(frame_height * self.display_scale)))
+        if self._resize_buffer is None or self._resize_buffer.shape[:2] != (size[1], size[0]):
+            self._resize_buffer = np.empty((size[1], size[0], frame.shape[2]), dtype=frame.dtype)
+        return cv2.resize(frame, size, dst=self._resize_buffer, interpolation=cv2.INTER_AREA)
+
+    def can_passthrough(self) -> bool:
+        """ A camera JPEG can only be shown as-is if the GUI doesn't want a downscaled frame """
+        return self.display_scale == 1
+
+    def encode(self, frame: np.ndarray) -> Optional[str]:
+        success, encoded_frame = cv2.imencode(self.image_format.extension, self._scale(frame), self._encode_params())
+        if success is False:
+            return None
+        return binascii.b2a_base64(encoded_frame, newline=False).decode("ascii")
+
+    @staticmethod
+    def passthrough(jpeg: bytes) -> str:
+        return binascii.b2a_base64(jpeg, newline=False).decode("ascii")
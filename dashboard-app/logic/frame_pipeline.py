@@ -0,0 +1,183 @@
+import collections
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from common import METRICS
+
+
+class LatestQueue:
+    """
+    A bounded queue where the newest item always wins. When the queue is full, putting a new item drops the oldest
+    one instead of blocking the producer, so a slow consumer always works on the freshest frame.
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self.maxsize = maxsize
+        self._items = collections.deque(maxlen=maxsize)
+        self._condition = threading.Condition()
+        self.dropped = 0  # number of items that were replaced before anybody consumed them
+
+    def put(self, item: Any) -> None:
+        with self._condition:
+            if len(self._items) == self.maxsize:
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout=timeout)
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def clear(self) -> None:
+        with self._condition:
+            self._items.clear()
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+
+@dataclass(frozen=True)
+class StageStats:
+    name: str
+    queue_depth: int  # items waiting in front of this stage
+    dropped: int  # items dropped in front of this stage (replaced by a newer item)
+    processed: int  # items this stage has finished
+    errors: int  # items whose handler raised an exception
+    last_latency: float  # seconds spent on the last item
+
+
+class PipelineStage:
+    """
+    A single pipeline step running on its own worker thread. It takes items from its input queue, runs `handler` on
+    them and pushes the result to the output queue. A stage without an input queue is a source stage, and it calls
+    `handler()` in a loop to produce new items (e.g. reading the camera).
+    """
+
+    IDLE_SLEEP = .1  # how long a source stage waits when it has nothing to produce
+    POLL_TIMEOUT = .1  # how long a stage waits for an input item before re-checking if it should stop
+
+    def __init__(self, name: str, handler: Callable[..., Optional[Any]],
+                 input_queue: Optional[LatestQueue], output_queue: LatestQueue):
+        self.name = name
+        self.handler = handler
+        self.input_queue = input_queue
+        self.output_queue = output_queue
+        self.processed = 0
+        self.errors = 0
+        self.last_latency = 0.0
+        self.thread: Optional[threading.Thread] = None
+        self.running = False
+
+    def start(self) -> None:
+        if self.running is True:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _next_item(self) -> Optional[Any]:
+        if self.input_queue is None:
+            start_time = time.perf_counter()
+            result = self.handler()
+        else:
+            item = self.input_queue.get(timeout=self.POLL_TIMEOUT)
+            if item is None:
+                return None
+            start_time = time.perf_counter()
+            result = self.handler(item)
+        self.last_latency = time.perf_counter() - start_time
+        return result
+
+    def _run(self) -> None:
+        while self.running is True:
+            try:
+                result = self._next_item()
+            except Exception as e:  # one broken item must not stop the stage
+                self.errors += 1
+                METRICS.increment(f"pipeline_{self.name}_errors")
+                print(f"Pipeline stage {self.name} failed: {type(e).__name__}: {e}")
+                result = None
+            if result is None:
+                if self.input_queue is None:
+                    time.sleep(self.IDLE_SLEEP)
+                continue
+            self.processed += 1
+            self.output_queue.put(result)
+
+    def stats(self) -> StageStats:
+        input_queue = self.input_queue
+        return StageStats(
+            name=self.name,
+            queue_depth=input_queue.depth if input_queue is not None else 0,
+            dropped=input_queue.dropped if input_queue is not None else 0,
+            processed=self.processed,
+            errors=self.errors,
+            last_latency=self.last_latency
+        )
+
+
+class FramePipeline:
+    """
+    FramePipeline chains a source and a list of handlers into stages that each run on their own worker thread. The
+    stages are connected by `LatestQueue`s, so a slow stage (e.g. YOLO inference) never makes the capture stage wait
+    and stale frames are dropped in front of it instead of piling up.
+
+    The output of the last stage can be picked up with `get(...)`.
+    """
+
+    def __init__(self, source: tuple[str, Callable[[], Optional[Any]]],
+                 stages: list[tuple[str, Callable[[Any], Optional[Any]]]], queue_size: int = 1):
+        source_name, source_handler = source
+        self.output_queue = LatestQueue(maxsize=queue_size)
+        next_queue = LatestQueue(maxsize=queue_size) if len(stages) > 0 else self.output_queue
+        self.stages = [PipelineStage(name=source_name, handler=source_handler, input_queue=None,
+                                     output_queue=next_queue)]
+        for index, (name, handler) in enumerate(stages):
+            input_queue = next_queue
+            next_queue = LatestQueue(maxsize=queue_size) if index < len(stages) - 1 else self.output_queue
+            self.stages.append(PipelineStage(name=name, handler=handler, input_queue=input_queue,
+                                             output_queue=next_queue))
+
+    @property
+    def running(self) -> bool:
+        return any(stage.running for stage in self.stages)
+
+    def start(self) -> None:
+        for stage in reversed(self.stages):  # start consumers before producers
+            stage.start()
+
+    def stop(self) -> None:
+        for stage in self.stages:
+            stage.stop()
+        for stage in self.stages:
+            if stage.input_queue is not None:
+                stage.input_queue.clear()
+        self.output_queue.clear()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Any]:
+        return self.output_queue.get(timeout=timeout)
+
+    def stats(self) -> list[StageStats]:
+        stats = [stage.stats() for stage in self.stages]
+        stats.append(StageStats(
+            name="output",
+            queue_depth=self.output_queue.depth,
+            dropped=self.output_queue.dropped,
+            processed=0,
+            errors=0,
+            last_latency=0.0
+        ))
+        return stats
@@ -0,0 +1,76 @@
+import math
+from typing import Optional
+
+import cv2
+import numpy as np
+from supervision import Detections
+
+
+class InferenceCadence:
+    """
+    InferenceCadence decides for every frame whether the (expensive) detector should run, or whether the boxes of the
+    last detection can be propagated instead (see `BoxPropagator`).
+
+    The detector runs every `interval` frames, where `interval` adapts to the measured inference time so the target
+    FPS can be held. It also runs early when:
+    - the scene changed a lot since the last detection (motion trigger)
+    - the last detection was not confident (confidence trigger)
+    """
+
+    MOTION_FRAME_SIZE = (64, 48)  # frames are compared at this tiny resolution, which keeps the motion check cheap
+
+    def __init__(self, enabled: bool = False, target_fps: float = 15, max_interval: int = 10,
+                 motion_threshold: float = 12.0, confidence_threshold: float = 0.4, smoothing: float = 0.2):
+        self.enabled = enabled
+        self.target_fps = target_fps
+        self.max_interval = max_interval  # never skip the detector for more than this many frames in a row
+        self.motion_threshold = motion_threshold  # mean absolute gray level difference that counts as motion
+        self.confidence_threshold = confidence_threshold
+        self.smoothing = smoothing  # weight of the newest inference time (exponential moving average)
+        self.inference_time: Optional[float] = None  # average detector time in seconds
+        self.interval = 1  # run the detector every N frames
+        self.frames_since_detection = 0
+        self._reference_frame: Optional[np.ndarray] = None
+        self._last_confidence: Optional[float] = None
+
+    def reset(self) -> None:
+        self.inference_time = self._reference_frame = self._last_confidence = None
+        self.interval = 1
+        self.frames_since_detection = 0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        return cv2.cvtColor(cv2.resize(frame, self.MOTION_FRAME_SIZE, interpolation=cv2.INTER_AREA),
+                            cv2.COLOR_BGR2GRAY)
+
+    def _motion_detected(self, frame: np.ndarray) -> bool:
+        if self._reference_frame is None:
+            return True
+        difference = cv2.absdiff(self._thumbnail(frame), self._reference_frame)
+        return float(difference.mean()) > self.motion_threshold
+
+    def should_detect(self, frame: np.ndarray) -> bool:
+        if self.enabled is False or self.inference_time is None:
+            return True
+        if self.frames_since_detection + 1 >= self.interval:
+            return True
+        if self._last_confidence is not None and self._last_confidence < self.confidence_threshold:
+            return True
+        return self._motion_detected(frame)
+
+    def skipped(self) -> None:
+        """ Record a frame on which the detector didn't run """
+        self.frames_since_detection += 1
+
+    def detected(self, frame: np.ndarray, detections: Detections, inference_time: float) -> None:
+        """ Record a detector run and adapt the interval to its duration """
+        if self.inference_time is None:
+            self.inference_time = inference_time
+        else:
+            self.inference_time = self.smoothing * inference_time + (1 - self.smoothing) * self.inference_time
+        frame_budget = 1 / self.target_fps
+        self.interval = min(max(math.ceil(self.inference_time / frame_budget), 1), self.max_interval)
+        self.frames_since_detection = 0
+        self._last_confidence = float(detections.confidence.mean()) \
+            if detections.confidence is not None and len(detections) > 0 else None
+        if self.enabled is True:
+            self._reference_frame = self._thumbnail(frame)
@@ -0,0 +1,278 @@
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent import futures
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Optional
+
+import numpy as np
+import supervision
+from supervision import Detections
+
+from common import FrameSize, METRICS
+
+
+class SharedFrameRing:
+    """
+    A ring of frame slots in shared memory, each slot fits one BGR frame of the given FrameSize. Frames are copied
+    into the next slot and the worker process reads them in place, so no frame is ever pickled.
+    """
+
+    def __init__(self, frame_size: FrameSize, slots: int = 2, name: Optional[str] = None):
+        self.frame_size = frame_size
+        self.slots = slots
+        self.slot_bytes = frame_size.width * frame_size.height * 3
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.owner = name is None
+        self._next_slot = itertools.cycle(range(slots))
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def fits(self, frame: np.ndarray) -> bool:
+        return frame.nbytes <= self.slot_bytes
+
+    def view(self, slot: int, shape: tuple[int, ...]) -> np.ndarray:
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def write(self, frame: np.ndarray) -> int:
+        slot = next(self._next_slot)
+        self.view(slot, frame.shape)[:] = frame
+        return slot
+
+    def close(self) -> None:
+        self.shm.close()
+        if self.owner is True:
+            self.shm.unlink()
+
+
+def _detections_to_arrays(detections: Detections) -> tuple:
+    """ Pack detections into compact arrays for the trip back to the main process """
+    tracker_id = detections.tracker_id.astype(np.int32) if detections.tracker_id is not None else None
+    confidence = detections.confidence.astype(np.float32) if detections.confidence is not None else None
+    class_id = detections.class_id.astype(np.int32) if detections.class_id is not None else None
+    return detections.xyxy.astype(np.float32), confidence, class_id, tracker_id
+
+
+def _worker_main(requests: multiprocessing.Queue, responses: multiprocessing.Queue, torch_threads: int) -> None:
+    """ Entry point of the inference process: load models and run inference on frames from the shared ring """
+    import torch
+    from logic.model_backends import ModelBackend, load_model
+    from logic.model_manager import ModelManager
+
+    torch.set_num_threads(torch_threads)
+    model = ring = None
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, command, arguments = request
+        try:
+            if command == "attach":
+                if ring is not None:
+                    ring.close()
+                frame_size_name, slots, shm_name = arguments
+                ring = SharedFrameRing(frame_size=FrameSize[frame_size_name], slots=slots, name=shm_name)
+                result = None
+            elif command == "threads":  # another worker started or stopped
+                torch.set_num_threads(arguments[0])
+                result = None
+            elif command == "model":
+                model_name, backend_name, imgsz = arguments
+                model = load_model(model_name=model_name, backend=ModelBackend[backend_name], imgsz=imgsz)
+                frame_size = ring.frame_size if ring is not None else FrameSize.SVGA
+                ModelManager.warmup(model, imgsz=imgsz, frame_shape=(frame_size.height, frame_size.width))
+                result = dict(model.names)
+            else:  # "track" or "predict"
+                slot, shape, imgsz = arguments
+                frame = ring.view(slot, shape)
+                if command == "track":
+                    results = model.track(source=frame, show=False, stream=False, agnostic_nms=True, verbose=False,
+                                          imgsz=imgsz)
+                else:
+                    results = model.predict(source=frame, show=False, stream=False, agnostic_nms=True,
+                                            verbose=False, imgsz=imgsz)
+                detections = supervision.Detections.from_ultralytics(results[0])
+                if results[0].boxes.id is not None:
+                    detections.tracker_id = results[0].boxes.id.cpu().numpy().astype(int)
+                result = _detections_to_arrays(detections)
+            responses.put((request_id, True, result))
+        except Exception as e:
+            responses.put((request_id, False, f"{type(e).__name__}: {e}"))
+    if ring is not None:
+        ring.close()
+
+
+class InferenceWorker:
+    """
+    InferenceWorker runs YOLO in a separate process, so inference doesn't hold the GIL of the process that runs the
+    Flet UI and the websocket thread. Frames are passed through a `SharedFrameRing`, detections come back as compact
+    arrays.
+
+    Every camera (VideoHandler) gets its own worker process, and the CPU cores are split between the running workers,
+    so several cameras do their inference in parallel.
+    """
+
+    active_workers: list["InferenceWorker"] = []  # running workers, the CPU cores are split between them
+    _workers_lock = threading.Lock()
+    TIMEOUT = 30  # seconds to wait for an inference result (model loading can take much longer)
+
+    def __init__(self, frame_size: FrameSize, slots: int = 2):
+        self.frame_size = frame_size
+        self.slots = slots
+        self.names: dict[int, str] = {}  # class names of the loaded model (the worker stands in for the model)
+        self.ring: Optional[SharedFrameRing] = None
+        self.process: Optional[multiprocessing.Process] = None
+        self._context = multiprocessing.get_context("spawn")  # never fork the UI, torch or websocket threads
+        self._requests = self._responses = None
+        self._pending: dict[int, Future] = {}
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count()
+        self._receiver: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    @staticmethod
+    def _torch_threads() -> int:
+        return max(1, (os.cpu_count() or 1) // max(1, len(InferenceWorker.active_workers)))
+
+    @staticmethod
+    def _rebalance_threads() -> None:
+        """ Split the CPU cores again between the running workers, after one of them started or stopped """
+        with InferenceWorker._workers_lock:
+            torch_threads = InferenceWorker._torch_threads()
+            for worker in InferenceWorker.active_workers:
+                worker._request("threads", (torch_threads,))
+
+    def start(self) -> None:
+        if self.running is True:
+            return
+        with InferenceWorker._workers_lock:
+            InferenceWorker.active_workers.append(self)
+            torch_threads = InferenceWorker._torch_threads()
+        self._requests = self._context.Queue()
+        self._responses = self._context.Queue()
+        self.process = self._context.Process(target=_worker_main, args=(self._requests, self._responses, torch_threads),
+                                             name="inference-worker", daemon=True)
+        self.process.start()
+        self._receiver = threading.Thread(target=self._receive, name="inference-worker-receiver", daemon=True)
+        self._receiver.start()
+        InferenceWorker._rebalance_threads()
+        self._attach_ring(self.frame_size)
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+        self._requests.put(None)
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self._responses.put(None)  # stop the receiver thread
+        self._receiver.join()
+        self.process = self._receiver = None
+        with InferenceWorker._workers_lock:
+            InferenceWorker.active_workers.remove(self)
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+        with self._pending_lock:
+            for future in self._pending.values():
+                future.set_exception(RuntimeError("inference worker stopped"))
+            self._pending.clear()
+        InferenceWorker._rebalance_threads()
+
+    def _receive(self) -> None:
+        while True:
+            response = self._responses.get()
+            if response is None:
+                break
+            request_id, success, result = response
+            with self._pending_lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue  # the caller gave up waiting
+            if success is True:
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(result))
+
+    def _request(self, command: str, arguments: tuple) -> Future:
+        request_id = next(self._request_ids)
+        future = Future()
+        if self.process is None:
+            future.set_exception(RuntimeError("inference worker stopped"))
+            return future
+        with self._pending_lock:
+            self._pending[request_id] = future
+        self._requests.put((request_id, command, arguments))
+        return future
+
+    def _forget(self, future: Future) -> None:
+        """ Stop waiting for a request, its late result is dropped by the receiver """
+        with self._pending_lock:
+            for request_id, pending_future in self._pending.items():
+                if pending_future is future:
+                    del self._pending[request_id]
+                    return
+
+    def _attach_ring(self, frame_size: FrameSize) -> None:
+        old_ring = self.ring
+        self.ring = SharedFrameRing(frame_size=frame_size, slots=self.slots)
+        self.frame_size = frame_size
+        future = self._request("attach", (frame_size.name, self.slots, self.ring.name))
+        try:
+            future.result(timeout=self.TIMEOUT)
+        finally:
+            self._forget(future)
+        if old_ring is not None:
+            old_ring.close()
+
+    def load_model(self, model_name: str, backend_name: str, imgsz: int) -> Future:
+        """ Load a model in the worker process, the Future resolves once the worker is ready to use it """
+        future = Future()
+
+        def loaded(request_future: Future):
+            exception = request_future.exception()
+            if exception is not None:
+                future.set_exception(exception)
+                return
+            self.names = request_future.result()
+            future.set_result(self)
+
+        self._request("model", (model_name, backend_name, imgsz)).add_done_callback(loaded)
+        return future
+
+    def infer(self, frame: np.ndarray, imgsz: int, track: bool = True) -> Detections:
+        """ Run the model on the frame, no detections if the worker is stopped (e.g. while switching it off) or late """
+        ring = self.ring
+        if ring is None:
+            return Detections.empty()
+        try:
+            if ring.fits(frame) is False:  # the camera switched to a bigger frame size
+                frame_height, frame_width = frame.shape[:2]
+                bigger_sizes = [size for size in FrameSize if size.width * size.height >= frame_width * frame_height]
+                self._attach_ring(bigger_sizes[0] if bigger_sizes else FrameSize.FHD)
+                ring = self.ring
+            slot = ring.write(frame)
+            future = self._request("track" if track is True else "predict", (slot, frame.shape, imgsz))
+            try:
+                xyxy, confidence, class_id, tracker_id = future.result(timeout=self.TIMEOUT)
+            finally:
+                self._forget(future)
+        except futures.TimeoutError:  # a slow model load or a hanging worker, skip this frame
+            METRICS.increment("inference_worker_timeouts")
+            print(f"No inference result from the worker process within {self.TIMEOUT}s, skipping the frame")
+            return Detections.empty()
+        except RuntimeError:
+            if self.running is True:
+                raise  # the model itself failed
+            return Detections.empty()
+        return Detections(xyxy=xyxy, confidence=confidence, class_id=class_id, tracker_id=tracker_id)
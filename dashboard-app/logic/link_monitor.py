@@ -0,0 +1,216 @@
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Optional
+
+from common import FrameSize, LoggerInterface, METRICS
+from core import Esp32Bridge
+
+
+class LinkState(Enum):
+    GOOD = "good"  # full quality
+    DEGRADED = "degraded"  # running below the selected frame size to keep up with the link
+    DOWN = "down"  # the device doesn't answer, reconnecting
+
+
+# frame sizes the policy steps through, smallest first
+FRAME_SIZE_LADDER = (FrameSize.QVGA, FrameSize.CIF, FrameSize.VGA, FrameSize.SVGA, FrameSize.XGA, FrameSize.HD,
+                     FrameSize.SXGA, FrameSize.UXGA)
+
+
+@dataclass(frozen=True)
+class LinkPolicy:
+    rtt_degrade: float = 0.3  # step down when the command round-trip time is above this (seconds)
+    rtt_recover: float = 0.1  # step up again only below this
+    frame_interval_degrade: float = 0.25  # step down when frames arrive slower than this (seconds apart)
+    frame_interval_recover: float = 0.12  # step up again only faster than this
+    capped_degrade_factor: float = 2.0  # with a frame rate cap, step down at this many times the capped interval
+    capped_recover_factor: float = 1.2  # and step up again only below this many times the capped interval
+    hold_seconds: float = 5.0  # minimum time between two frame size changes
+    max_failed_pings: int = 3  # the link is down after this many pings in a row without a reply
+    backoff_seconds: float = 1.0  # first reconnect delay, doubled after every failed attempt
+    max_backoff_seconds: float = 30.0
+
+
+@dataclass(frozen=True)
+class LinkStatus:
+    state: LinkState
+    rtt: Optional[float]  # seconds, moving average
+    frame_interval: Optional[float]  # seconds between MJPEG frames, moving average
+    frame_size: Optional[FrameSize]  # frame size the camera is running at
+    reconnects: int
+
+    def describe(self) -> str:
+        rtt = f"{self.rtt * 1000:.0f} ms" if self.rtt is not None else "n/a"
+        fps = f"{1 / self.frame_interval:.1f} fps" if self.frame_interval else "n/a"
+        frame_size = self.frame_size.name if self.frame_size is not None else "n/a"
+        return f"{self.state.name} | RTT {rtt} | {fps} | {frame_size}"
+
+
+class LinkMonitor:
+    """
+    LinkMonitor watches the quality of the connection to the ESP32 Cam and adapts to it.
+
+    - it PINGs the device every `ping_interval` seconds (the round-trip time is measured by `Esp32Bridge`) and tracks
+      the inter-arrival time of the MJPEG frames (reported by the capture stage through `frame_arrived(...)`)
+    - when the pings keep failing or the stream stalls, it reconnects with exponential backoff
+    - when the RTT or the frame interval crosses the `LinkPolicy` thresholds it steps the camera down one frame size,
+      and back up (never above the frame size the user selected) once the link has recovered
+
+    Every evaluation is reported to `on_update` (e.g. to show the link state in the GUI).
+    """
+
+    SMOOTHING = 0.2  # weight of the newest frame interval in the moving average
+
+    def __init__(self, esp32_bridge: Esp32Bridge, reopen_stream: Callable[[], bool],
+                 apply_frame_size: Callable[[FrameSize], None], policy: LinkPolicy = LinkPolicy(),
+                 ping_interval: float = 1.0, stall_seconds: float = 3.0,
+                 logger_class: Optional[LoggerInterface] = None):
+        self.esp32_bridge = esp32_bridge
+        self.reopen_stream = reopen_stream  # reconnects the MJPEG stream, returns whether it worked
+        self.apply_frame_size = apply_frame_size  # adapts the local side (stream, controller) to a new frame size
+        self.policy = policy
+        self.ping_interval = ping_interval
+        self.stall_seconds = stall_seconds  # no frame for this long counts as a stalled stream
+        self.logger_class = logger_class
+        self.adaptive = True  # step the frame size down and up automatically
+        self.on_update: Optional[Callable[[LinkStatus], None]] = None
+        self.ceiling: Optional[FrameSize] = None  # the frame size selected by the user
+        self.frame_size: Optional[FrameSize] = None  # the frame size the camera is running at
+        self.frame_interval: Optional[float] = None
+        self.last_frame_time: Optional[float] = None
+        self.state = LinkState.GOOD
+        self.failed_pings = 0
+        self.reconnects = 0
+        self._backoff = policy.backoff_seconds
+        self._next_reconnect = 0.0
+        self._last_change = float("-inf")
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def log(self, msg: str, fg_color: Optional[str] = None) -> None:
+        if self.logger_class is not None:
+            self.logger_class.log(message=msg, fg_color=fg_color)
+
+    def start(self, frame_size: Optional[FrameSize]) -> None:
+        self.set_ceiling(frame_size)
+        self.frame_interval = self.last_frame_time = None
+        self.failed_pings = 0
+        self.state = LinkState.GOOD
+        self._running = True  # a thread that is still winding down after stop() keeps going
+        if self._thread is None or self._thread.is_alive() is False:
+            self._thread = threading.Thread(target=self._run, name="link-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def set_ceiling(self, frame_size: Optional[FrameSize]) -> None:
+        """ The user picked a frame size: run at it, and never step above it """
+        self.ceiling = self.frame_size = frame_size
+        self._last_change = time.monotonic()
+
+    def frame_arrived(self, arrival_time: float) -> None:
+        """ Called for every MJPEG frame (on the capture thread) """
+        if self.last_frame_time is not None:
+            interval = arrival_time - self.last_frame_time
+            METRICS.observe("mjpeg_frame_interval", interval)
+            if self.frame_interval is None:
+                self.frame_interval = interval
+            else:
+                self.frame_interval += self.SMOOTHING * (interval - self.frame_interval)
+        self.last_frame_time = arrival_time
+
+    def status(self) -> LinkStatus:
+        rtt = self.esp32_bridge.round_trip_time if self.esp32_bridge.round_trip_time > 0 else None
+        return LinkStatus(state=self.state, rtt=rtt, frame_interval=self.frame_interval, frame_size=self.frame_size,
+                          reconnects=self.reconnects)
+
+    def _run(self) -> None:
+        while self._running is True:
+            started = time.monotonic()
+            try:
+                if self.esp32_bridge.test_mode is False:
+                    self.evaluate(now=started)
+                if self.on_update is not None:
+                    self.on_update(self.status())
+            except Exception as e:  # keep monitoring, the next cycle starts over
+                METRICS.increment("link_monitor_errors")
+                msg = f"Link monitor error: {type(e).__name__}: {e}"
+                print(msg)
+                self.log(msg, fg_color="red")
+            time.sleep(max(0.0, self.ping_interval - (time.monotonic() - started)))
+
+    def evaluate(self, now: float) -> None:
+        if self.state is LinkState.DOWN:
+            if now >= self._next_reconnect:
+                self._reconnect(now)
+            return
+        if self.esp32_bridge.ping() is True:
+            self.failed_pings = 0
+        else:
+            self.failed_pings += 1
+            METRICS.increment("link_failed_pings")
+        stalled = self.last_frame_time is not None and now - self.last_frame_time > self.stall_seconds
+        if self.failed_pings >= self.policy.max_failed_pings or stalled:
+            reason = "stream stalled" if stalled else f"{self.failed_pings} pings without reply"
+            self.log(f"Lost the connection to the camera ({reason}), reconnecting...", fg_color="orange")
+            self.state = LinkState.DOWN
+            self._backoff = self.policy.backoff_seconds
+            self._reconnect(now)
+            return
+        if self.adaptive is True:
+            self._adapt(now)
+
+    def _reconnect(self, now: float) -> None:
+        ip_address = self.esp32_bridge.ip_address
+        self.reconnects += 1
+        METRICS.increment("link_reconnects")
+        if ip_address is not None and self.esp32_bridge.connect(ip_address=ip_address) is True \
+                and self.reopen_stream() is True:
+            self.log("Reconnected to the camera", fg_color="green")
+            self.state = LinkState.GOOD if self.frame_size == self.ceiling else LinkState.DEGRADED
+            self.failed_pings = 0
+            self.frame_interval = self.last_frame_time = None
+            self._last_change = now
+            return
+        self._next_reconnect = now + self._backoff
+        self._backoff = min(self._backoff * 2, self.policy.max_backoff_seconds)
+
+    def _frame_interval_thresholds(self) -> tuple[float, float]:
+        """ (degrade, recover) frame intervals, a frame rate cap makes the frames arrive slower on purpose """
+        degrade, recover = self.policy.frame_interval_degrade, self.policy.frame_interval_recover
+        if self.esp32_bridge.target_fps > 0:
+            capped_interval = 1 / self.esp32_bridge.target_fps
+            degrade = max(degrade, capped_interval * self.policy.capped_degrade_factor)
+            recover = max(recover, capped_interval * self.policy.capped_recover_factor)
+        return degrade, recover
+
+    def _adapt(self, now: float) -> None:
+        if self.frame_size not in FRAME_SIZE_LADDER or self.ceiling not in FRAME_SIZE_LADDER:
+            return  # a frame size outside of the ladder was selected, leave it alone
+        if now - self._last_change < self.policy.hold_seconds:
+            return
+        rtt = self.esp32_bridge.round_trip_time
+        frame_interval = self.frame_interval if self.frame_interval is not None else 0.0
+        frame_interval_degrade, frame_interval_recover = self._frame_interval_thresholds()
+        index = FRAME_SIZE_LADDER.index(self.frame_size)
+        if rtt > self.policy.rtt_degrade or frame_interval > frame_interval_degrade:
+            if index > 0:
+                self._change_frame_size(FRAME_SIZE_LADDER[index - 1], now, reason=f"RTT {rtt * 1000:.0f} ms, "
+                                        f"frame interval {frame_interval * 1000:.0f} ms")
+        elif rtt < self.policy.rtt_recover and frame_interval < frame_interval_recover:
+            if self.frame_size != self.ceiling:
+                self._change_frame_size(FRAME_SIZE_LADDER[index + 1], now, reason="link recovered")
+        self.state = LinkState.GOOD if self.frame_size == self.ceiling else LinkState.DEGRADED
+
+    def _change_frame_size(self, frame_size: FrameSize, now: float, reason: str) -> None:
+        if self.esp32_bridge.set_frame_size(frame_size=frame_size) is False:
+            return
+        self.log(f"Switching the camera to {frame_size.name} ({reason})", fg_color="orange")
+        METRICS.increment("link_frame_size_changes")
+        self.frame_size = frame_size
+        self.apply_frame_size(frame_size)
+        self.frame_interval = self.last_frame_time = None  # the stream was reopened
+        self._last_change = now
@@ -0,0 +1,142 @@
+import socket
+import time
+from typing import Optional
+
+import numpy as np
+
+from common import MjpegFrame
+
+
+class MjpegReader:
+    """
+    MjpegReader reads the `multipart/x-mixed-replace` MJPEG stream that the ESP32 Cam serves on `/camera`.
+
+    Unlike cv2.VideoCapture, it doesn't buffer frames: every `read_jpeg()` returns the next complete frame as raw JPEG
+    bytes with its arrival timestamp, and decoding is left to the caller (see `MjpegFrame.decode`). The socket is read
+    with `recv_into` straight into one reusable receive buffer and the multipart boundaries are searched in place, so
+    the only copy per frame is handing the finished JPEG out of the buffer.
+
+    `read()` and `isOpened()` mimic cv2.VideoCapture so it can be used as a drop-in video source.
+    """
+
+    RECEIVE_SIZE = 64 * 1024
+
+    def __init__(self, host: str, path: str = "/camera", port: int = 80, timeout: float = 5,
+                 buffer_size: int = 512 * 1024, decode_scale: int = 1):
+        self.host = host
+        self.path = path
+        self.port = port
+        self.timeout = timeout
+        self.decode_scale = decode_scale
+        self.sock: Optional[socket.socket] = None
+        self.boundary = b"--frame"
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0  # first unconsumed byte in the receive buffer
+        self._end = 0  # end of the received data in the receive buffer
+        self._scan = 0  # position from where we continue searching the next boundary
+
+    def open(self) -> bool:
+        self.release()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.sendall(f"GET {self.path} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode("utf-8"))
+            self.sock = sock
+            self._start = self._end = self._scan = 0
+            headers = self._read_until(b"\r\n\r\n")
+        except OSError:
+            self.release()
+            return False
+        if headers is None or not headers.startswith(b"HTTP/1.") or b" 200 " not in headers.split(b"\r\n", 1)[0]:
+            self.release()
+            return False
+        for line in headers.split(b"\r\n"):
+            if line.lower().startswith(b"content-type:") and b"boundary=" in line:
+                boundary = line.split(b"boundary=", 1)[1].strip().strip(b'"')
+                self.boundary = boundary if boundary.startswith(b"--") else b"--" + boundary
+        return True
+
+    def isOpened(self) -> bool:
+        return self.sock is not None
+
+    def release(self) -> None:
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+
+    def _receive(self) -> bool:
+        """ Receive more data at the end of the buffer, compacting or growing the buffer when it is full """
+        if self._end == len(self._buffer):
+            if self._start > 0:  # move the unconsumed tail to the front of the buffer
+                unconsumed = self._end - self._start
+                self._view[:unconsumed] = self._view[self._start:self._end]
+                self._scan -= self._start
+                self._start, self._end = 0, unconsumed
+            else:  # a single frame is bigger than the buffer
+                self._view.release()
+                self._buffer.extend(bytes(len(self._buffer)))
+                self._view = memoryview(self._buffer)
+        received = self.sock.recv_into(self._view[self._end:self._end + self.RECEIVE_SIZE])
+        if received == 0:
+            raise ConnectionError("MJPEG stream closed by the camera")
+        self._end += received
+        return True
+
+    def _read_until(self, delimiter: bytes) -> Optional[bytes]:
+        """ Consume and return everything up to (and including) the delimiter """
+        while True:
+            index = self._buffer.find(delimiter, self._start, self._end)
+            if index != -1:
+                data = bytes(self._view[self._start:index + len(delimiter)])
+                self._start = self._scan = index + len(delimiter)
+                return data
+            self._receive()
+
+    def read_jpeg(self) -> Optional[MjpegFrame]:
+        """ Return the next complete JPEG frame of the stream """
+        if self.sock is None:
+            return None
+        try:
+            while True:  # skip everything (e.g. a preamble) before the part boundary
+                index = self._buffer.find(self.boundary, self._start, self._end)
+                if index != -1:
+                    self._start = self._scan = index
+                    break
+                self._start = self._scan = max(self._start, self._end - len(self.boundary))
+                self._receive()
+            part_headers = self._read_until(b"\r\n\r\n")
+            jpeg_start = self._start
+            content_length = None
+            for line in part_headers.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    content_length = int(line.split(b":", 1)[1])
+            delimiter = b"\r\n" + self.boundary
+            while True:
+                if content_length is not None:
+                    if self._end - jpeg_start >= content_length:
+                        jpeg_end = jpeg_start + content_length
+                        break
+                else:
+                    jpeg_end = self._buffer.find(delimiter, self._scan, self._end)
+                    if jpeg_end != -1:
+                        break
+                    self._scan = max(jpeg_start, self._end - len(delimiter))
+                previous_start = self._start
+                self._receive()
+                jpeg_start -= previous_start - self._start  # the buffer might have been compacted
+            jpeg = bytes(self._view[jpeg_start:jpeg_end])
+            self._start = self._scan = jpeg_end
+            return MjpegFrame(jpeg=jpeg, arrival_time=time.monotonic())
+        except (OSError, ConnectionError, ValueError):
+            self.release()
+            return None
+
+    def read(self) -> tuple[bool, Optional[np.ndarray]]:
+        frame = self.read_jpeg()
+        if frame is None:
+            return False, None
+        decoded_frame = frame.decode(scale=self.decode_scale)
+        return decoded_frame is not None, decoded_frame
@@ -0,0 +1,51 @@
+import os
+import shutil
+from enum import Enum
+from typing import Optional
+
+from ultralytics import YOLO
+
+
+class ModelBackend(Enum):
+    # (ultralytics export format, suffix of the exported artifact)
+    PYTORCH = (None, ".pt")
+    TORCHSCRIPT = ("torchscript", ".torchscript")
+    ONNX = ("onnx", ".onnx")
+    OPENVINO = ("openvino", "_openvino_model")  # OpenVINO exports are a directory
+
+    @property
+    def export_format(self) -> Optional[str]:
+        return self.value[0]
+
+    @property
+    def suffix(self) -> str:
+        return self.value[1]
+
+
+def models_dir() -> str:
+    return os.path.join(os.getcwd(), "models")
+
+
+def exported_model_path(model_name: str, backend: ModelBackend, imgsz: int) -> str:
+    """ Where the exported artifact of a model is cached, keyed by model name, input size and backend """
+    filename = f"{model_name}_{imgsz}_{backend.name.lower()}{backend.suffix}"
+    return os.path.join(models_dir(), "exported", filename)
+
+
+def export_model(model_name: str, backend: ModelBackend, imgsz: int) -> str:
+    """ Export `models/<model_name>.pt` to the backend's format (once) and return the path of the cached artifact """
+    cached_path = exported_model_path(model_name=model_name, backend=backend, imgsz=imgsz)
+    if os.path.exists(cached_path):
+        return cached_path
+    model = YOLO(os.path.join(models_dir(), f"{model_name}.pt"))
+    export_path = model.export(format=backend.export_format, imgsz=imgsz, verbose=False)
+    os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+    shutil.move(str(export_path), cached_path)
+    return cached_path
+
+
+def load_model(model_name: str, backend: ModelBackend = ModelBackend.PYTORCH, imgsz: int = 640) -> YOLO:
+    """ Load a YOLO model for the given backend, exporting it first if there is no cached artifact yet """
+    if backend == ModelBackend.PYTORCH:
+        return YOLO(os.path.join(models_dir(), f"{model_name}.pt"))
+    return YOLO(export_model(model_name=model_name, backend=backend, imgsz=imgsz), task="detect")
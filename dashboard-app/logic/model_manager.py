@@ -0,0 +1,70 @@
+import collections
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+from ultralytics import YOLO
+
+from logic.model_backends import ModelBackend, load_model
+
+
+ModelKey = tuple[str, ModelBackend, int]  # (model name, backend, input size)
+
+
+class ModelManager:
+    """
+    ModelManager loads YOLO models on a background worker and keeps the most recently used ones warmed up in memory.
+
+    - `load(...)` returns a Future right away, loading (and the slow first inference) happens on the worker thread
+    - loaded models are kept in a size-bounded LRU cache, so switching back to a recently used model is instant
+    """
+
+    def __init__(self, capacity: int = 3):
+        self.capacity = capacity  # maximum number of models kept in memory
+        self._models: collections.OrderedDict[ModelKey, YOLO] = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model-loader")
+
+    def cached_models(self) -> list[ModelKey]:
+        with self._lock:
+            return list(self._models.keys())
+
+    def _get_cached(self, key: ModelKey) -> Optional[YOLO]:
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+            return model
+
+    def _add_to_cache(self, key: ModelKey, model: YOLO) -> None:
+        with self._lock:
+            self._models[key] = model
+            self._models.move_to_end(key)
+            while len(self._models) > self.capacity:
+                self._models.popitem(last=False)  # evict the least recently used model
+
+    @staticmethod
+    def warmup(model: YOLO, imgsz: int, frame_shape: tuple[int, int]) -> None:
+        """ Run a first (slow) inference on a blank frame, so the first camera frame doesn't pay for it """
+        frame_height, frame_width = frame_shape
+        model.predict(source=np.zeros((frame_height, frame_width, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+
+    def _load(self, key: ModelKey, frame_shape: tuple[int, int]) -> YOLO:
+        model = self._get_cached(key)  # another request might have loaded it in the meantime
+        if model is not None:
+            return model
+        model_name, backend, imgsz = key
+        model = load_model(model_name=model_name, backend=backend, imgsz=imgsz)
+        self.warmup(model, imgsz=imgsz, frame_shape=frame_shape)
+        self._add_to_cache(key, model)
+        return model
+
+    def load(self, model_name: str, backend: ModelBackend, imgsz: int, frame_shape: tuple[int, int]) -> "Future[YOLO]":
+        key = (model_name, backend, imgsz)
+        model = self._get_cached(key)
+        if model is not None:
+            future = Future()
+            future.set_result(model)
+            return future
+        return self._executor.submit(self._load, key, frame_shape)
@@ -0,0 +1,86 @@
+import numpy as np
+import supervision
+from supervision import Detections
+
+
+class RoiInference:
+    """
+    RoiInference keeps the detector on a padded crop around the tracked target instead of the whole frame, which is a
+    lot cheaper at SVGA and above. The detections of the crop are mapped back into frame coordinates and get the
+    tracker IDs of the boxes they overlap the most with.
+
+    A full-frame pass still runs every `full_frame_interval` detector runs (to notice new objects) and whenever the
+    caller asks for one (e.g. as soon as the CamController lost its target).
+
+    The crop sides are multiples of the model stride, so the crop runs at its own size (`inference_size_for(...)`)
+    instead of being scaled up to the full-frame input size.
+    """
+
+    STRIDE = 32  # YOLO input sizes are multiples of the model stride
+
+    def __init__(self, enabled: bool = False, padding: float = 1.0, min_size: int = 192, full_frame_interval: int = 15,
+                 iou_threshold: float = 0.3):
+        self.enabled = enabled
+        self.padding = padding  # pad the target box on every side by this ratio of its biggest dimension
+        self.min_size = min_size  # the crop is never smaller than min_size x min_size pixels (a multiple of STRIDE)
+        self.full_frame_interval = full_frame_interval
+        self.iou_threshold = iou_threshold  # minimum overlap to inherit the tracker ID of a previous box
+        self.runs_since_full_frame = 0
+
+    def reset(self) -> None:
+        self.runs_since_full_frame = 0
+
+    def full_frame_due(self) -> bool:
+        return self.runs_since_full_frame + 1 >= self.full_frame_interval
+
+    def full_frame_done(self) -> None:
+        self.runs_since_full_frame = 0
+
+    def roi_done(self) -> None:
+        self.runs_since_full_frame += 1
+
+    def region_for(self, target_xyxy: np.ndarray, width: int, height: int) -> tuple[int, int, int, int]:
+        """ Return the (x1, y1, x2, y2) crop around the target box, clamped to the frame, sides multiples of STRIDE """
+        x1, y1, x2, y2 = target_xyxy
+        center_x, center_y = (x1 + x2) / 2, (y1 + y2) / 2
+        size = self._round_up(max(max(x2 - x1, y2 - y1) * (1 + 2 * self.padding), self.min_size))
+        crop_width, crop_height = min(size, self._round_down(width)), min(size, self._round_down(height))
+        center_x = min(max(center_x, crop_width / 2), width - crop_width / 2)  # shift the crop back inside the frame
+        center_y = min(max(center_y, crop_height / 2), height - crop_height / 2)
+        left, top = int(center_x - crop_width / 2), int(center_y - crop_height / 2)
+        return left, top, left + crop_width, top + crop_height
+
+    def inference_size_for(self, region: tuple[int, int, int, int], max_size: int) -> int:
+        """ The detector input size of a crop: its longest side (never scaled up), `max_size` at most """
+        x1, y1, x2, y2 = region
+        return min(max(self._round_up(max(x2 - x1, y2 - y1)), self.min_size), max_size)
+
+    @classmethod
+    def _round_up(cls, size: float) -> int:
+        return int(-(-size // cls.STRIDE)) * cls.STRIDE
+
+    @classmethod
+    def _round_down(cls, size: int) -> int:
+        return max(size // cls.STRIDE * cls.STRIDE, min(size, cls.STRIDE))
+
+    @staticmethod
+    def crop(frame: np.ndarray, region: tuple[int, int, int, int]) -> np.ndarray:
+        x1, y1, x2, y2 = region
+        return np.ascontiguousarray(frame[y1:y2, x1:x2])
+
+    def map_to_frame(self, detections: Detections, region: tuple[int, int, int, int],
+                     reference: Detections) -> Detections:
+        """ Move crop detections into frame coordinates and take over the tracker IDs from `reference` """
+        x1, y1, _, _ = region
+        detections.xyxy = detections.xyxy + np.array([x1, y1, x1, y1], dtype=detections.xyxy.dtype)
+        tracker_id = np.full(len(detections), -1, dtype=int)  # -1: no previous box matched
+        if len(detections) > 0 and len(reference) > 0 and reference.tracker_id is not None:
+            iou = supervision.box_iou_batch(detections.xyxy, reference.xyxy)
+            for index in np.argsort(-iou.max(axis=1)):  # best overlapping boxes pick first
+                best = int(np.argmax(iou[index]))
+                if iou[index, best] < self.iou_threshold:
+                    continue
+                tracker_id[index] = reference.tracker_id[best]
+                iou[:, best] = 0  # a reference box can only hand out its ID once
+        detections.tracker_id = tracker_id
+        return detections
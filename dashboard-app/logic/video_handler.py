@@ -1,15 +1,27 @@
-import base64
+import itertools
 import os
+import threading
+import time
+from concurrent.futures import Future
 from typing import Union, Optional
 
 import cv2
 import numpy as np
 import supervision
 from supervision import Detections
-from ultralytics import YOLO
 
-from common import LoggerInterface, FrameSize
+from common import LoggerInterface, FrameSize, FramePacket, METRICS
 from core import Esp32Bridge, CamController
+from logic.box_propagator import BoxPropagator
+from logic.frame_encoder import FrameEncoder
+from logic.frame_pipeline import FramePipeline
+from logic.inference_cadence import InferenceCadence
+from logic.inference_worker import InferenceWorker
+from logic.link_monitor import LinkMonitor
+from logic.mjpeg_reader import MjpegReader
+from logic.model_backends import ModelBackend, models_dir
+from logic.model_manager import ModelManager
+from logic.roi_inference import RoiInference
 
 
 class VideoHandler:
@@ -23,6 +35,9 @@ class VideoHandler:
     - uses YOLO tracking system to assign tracking ID to objects
     - renders bounding boxes and bounding box labels
     - propagate the video frame to the CamController
+
+    Every step is its own method (`read_frame`, `detect`, `control`, `annotate`, `encode`), these are either chained
+    serially by `process_frame()` or run concurrently as stages of the `pipeline` (see `FramePipeline`).
     """
 
     def __init__(self, esp32_bridge: Esp32Bridge, logger_class: Optional[LoggerInterface] = None):
@@ -48,72 +63,200 @@ class VideoHandler:
             text_scale=0.5
         )
         self.model_name = self.model = None
+        self.model_backend = ModelBackend.PYTORCH
+        self.model_manager = ModelManager(capacity=3)  # loads models in the background, keeps recent ones warm
+        self.model_request_id = 0  # only the latest set_model() request is allowed to swap the model in
+        self.model_lock = threading.Lock()
+        self.inference_worker: Optional[InferenceWorker] = None  # run inference in a separate process when set
+        self.inference_size = 640  # YOLO input size (exported models are exported for this size)
         self.video_source_ip = self.video_capture = None
         self.show_bounding_boxes = True
+        self.frame_encoder = FrameEncoder()
+        self.inference_cadence = InferenceCadence(enabled=False)  # run the detector only every N frames
+        self.box_propagator = BoxPropagator()  # moves the boxes forward on frames that skip the detector
+        self.roi_inference = RoiInference(enabled=False)  # run the detector on a crop around the tracked target
+        self.decode_scale = 1  # decode the camera frames at 1/decode_scale of their resolution (1, 2 or 4)
+        self.frame_counter = itertools.count()
+        self.link_monitor = LinkMonitor(  # watches the device connection, reconnects and adapts the frame size
+            esp32_bridge=self.esp32_bridge,
+            reopen_stream=self.reopen_video_input,
+            apply_frame_size=self.set_frame_size,
+            logger_class=self.logger_class
+        )
+        self.pipeline = FramePipeline(
+            source=("capture", self.read_frame),
+            stages=[
+                ("inference", self.detect),
+                ("control", self.control),
+                ("annotate", self.annotate),
+                ("encode", self.encode),
+            ]
+        )
 
     def set_video_input(self, source: Union[str, int, None] = None) -> bool:
         if type(source) is str and source.isdigit():
             source = int(source)
+        if self.video_capture is not None:
+            self.video_capture.release()
         if source is None:
             self.video_source_ip = self.video_capture = None
             return True
-        camera_source = f"http://{source}/camera" if type(source) is str else source
-        video_capture = cv2.VideoCapture(camera_source)
+        if type(source) is str:  # esp32cam MJPEG stream, an optional port (`host:port`) selects an emulated device
+            host, _, port = source.partition(":")
+            video_capture = MjpegReader(host=host, path="/camera", port=int(port) if port else 80,
+                                        decode_scale=self.decode_scale)
+            video_capture.open()
+        else:
+            video_capture = cv2.VideoCapture(source)
         if not video_capture.isOpened():
+            self.video_source_ip = self.video_capture = None
             return False
         self.video_source_ip = source
         self.video_capture = video_capture
         return True
 
-    def set_model(self, model_name: Optional[str] = None):
-        self.model_name = model_name
+    def reopen_video_input(self) -> bool:
+        return self.set_video_input(self.video_source_ip)
+
+    def set_decode_scale(self, decode_scale: int) -> None:
+        """ Decode camera frames at a reduced scale (1/2, 1/4) when the detector doesn't need full resolution """
+        self.decode_scale = decode_scale
+        if isinstance(self.video_capture, MjpegReader):
+            self.video_capture.decode_scale = decode_scale
+
+    def set_model(self, model_name: Optional[str] = None, backend: Optional[ModelBackend] = None) -> "Future[None]":
+        """
+        Load the model in the background and swap it in once it is loaded and warmed up, the current model keeps
+        serving frames in the meantime. The returned Future completes once the new model is in use.
+        """
+        if backend is not None:
+            self.model_backend = backend
+        with self.model_lock:
+            self.model_request_id += 1
+            request_id = self.model_request_id
         if model_name is None:
-            self.model = None
+            self._swap_model(request_id=request_id, model_name=None, model=None)
+            future = Future()
+            future.set_result(None)
+            return future
+        if self.inference_worker is not None:
+            load_future = self.inference_worker.load_model(model_name=model_name, backend_name=self.model_backend.name,
+                                                           imgsz=self.inference_size)
         else:
-            model_filepath = os.path.join(os.getcwd(), "models", f"{model_name}.pt")
-            self.model = YOLO(model_filepath)
+            load_future = self.model_manager.load(model_name=model_name, backend=self.model_backend,
+                                                  imgsz=self.inference_size,
+                                                  frame_shape=(self.cam_controller.height, self.cam_controller.width))
+        swap_future = Future()
+
+        def swap_when_loaded(future: Future):
+            exception = future.exception()
+            if exception is not None:
+                if self.logger_class is not None:
+                    self.logger_class.log(message=f"Failed to load model {model_name}: {exception}", fg_color="red")
+                swap_future.set_exception(exception)
+                return
+            self._swap_model(request_id=request_id, model_name=model_name, model=future.result())
+            swap_future.set_result(None)
+
+        load_future.add_done_callback(swap_when_loaded)
+        return swap_future
+
+    def _swap_model(self, request_id: int, model_name: Optional[str], model) -> None:
+        with self.model_lock:
+            if request_id != self.model_request_id:
+                return  # a newer set_model() request superseded this one
+            trackers = getattr(getattr(model, "predictor", None), "trackers", None)
+            for tracker in trackers or []:  # a cached model might still remember tracks from its last use
+                tracker.reset()
+            self.inference_cadence.reset()
+            self.box_propagator.reset()
+            self.roi_inference.reset()
+            self.model_name, self.model = model_name, model
+
+    def set_inference_process(self, enabled: bool) -> "Future[None]":
+        """ Move inference into a separate worker process (or back into this process) and reload the current model """
+        if enabled is True and self.inference_worker is None:
+            inference_worker = InferenceWorker(frame_size=self.esp32_bridge.frame_size)
+            inference_worker.start()
+            self.inference_worker = inference_worker
+        elif enabled is False and self.inference_worker is not None:
+            inference_worker, self.inference_worker = self.inference_worker, None
+            with self.model_lock:
+                self.model = None  # the worker is the current model, stop using it before it goes away
+            inference_worker.stop()
+        return self.set_model(model_name=self.model_name)
 
     @staticmethod
     def list_downloaded_models() -> list[str]:
         models = []
-        models_dir = os.path.join(os.getcwd(), "models")
-        for filename in os.listdir(models_dir):
+        for filename in os.listdir(models_dir()):
             model_name, file_extension = os.path.splitext(filename)
             if file_extension == ".pt":
                 models.append(model_name)
         return models
 
-    def _track_target(self, frame: np.ndarray) -> np.ndarray:
+    @METRICS.timed("track_target")
+    def _track_target(self, model, frame: np.ndarray) -> Detections:
+        if isinstance(model, InferenceWorker):
+            return model.infer(frame, imgsz=self.inference_size, track=True)
         # for result in self.model.track(source="http://192.168.4.1:80/camera", show=False, stream=True, agnostic_nms=True, verbose=False):
-        results = self.model.track(source=frame, show=False, stream=False, agnostic_nms=True, verbose=False)
+        results = model.track(source=frame, show=False, stream=False, agnostic_nms=True, verbose=False,
+                              imgsz=self.inference_size)
         result = results[0]
 
         detections = supervision.Detections.from_ultralytics(result)
 
         if result.boxes.id is not None:
             detections.tracker_id = result.boxes.id.cpu().numpy().astype(int)
+        return detections
 
-        our_detection = self.cam_controller.handle(frame=frame, detections=detections)
-        interested_detections = our_detection.org_detections if our_detection is not None else Detections.empty()
+    def _detect_in_region(self, model, frame: np.ndarray, region: tuple[int, int, int, int],
+                          reference: Detections) -> Detections:
+        """ Run YOLO on a crop of the frame, the YOLO tracker only sees full frames, so IDs are taken from `reference` """
+        imgsz = self.inference_size
+        if self.model_backend == ModelBackend.PYTORCH:  # exported models only take the size they were exported for
+            imgsz = self.roi_inference.inference_size_for(region, max_size=self.inference_size)
+        if isinstance(model, InferenceWorker):
+            detections = model.infer(self.roi_inference.crop(frame, region), imgsz=imgsz, track=False)
+            return self.roi_inference.map_to_frame(detections, region=region, reference=reference)
+        results = model.predict(source=self.roi_inference.crop(frame, region), show=False, stream=False,
+                                agnostic_nms=True, verbose=False, imgsz=imgsz)
+        detections = supervision.Detections.from_ultralytics(results[0])
+        return self.roi_inference.map_to_frame(detections, region=region, reference=reference)
 
-        if self.show_bounding_boxes is True:
-            labels = [
-                f"{tracker_id} {self.model.model.names[class_id]} ({class_id}) {confidence:0.2f}"
-                for _, _, confidence, class_id, tracker_id
-                in interested_detections
-            ]
-            frame = self.box_annotator.annotate(
-                scene=frame,
-                detections=interested_detections,
-                labels=labels
-            )
-        return frame
+    def _target_region(self, packet: FramePacket) -> Optional[tuple[tuple[int, int, int, int], Detections]]:
+        """ Return the crop around the tracked target (and the expected boxes), or None for a full-frame pass """
+        target_tracker_id = self.cam_controller.target_tracker_id
+        if self.roi_inference.enabled is False or target_tracker_id is None:
+            return None
+        if self.cam_controller.coyote_timer is not None or self.roi_inference.full_frame_due():
+            return None  # re-detect on the full frame right away when the target got lost
+        frame_height, frame_width = packet.frame.shape[:2]
+        expected = self.box_propagator.predict(packet.capture_time, width=frame_width, height=frame_height)
+        if expected.tracker_id is None:
+            return None
+        target_index = np.flatnonzero(expected.tracker_id == target_tracker_id)
+        if len(target_index) == 0:
+            return None
+        region = self.roi_inference.region_for(expected.xyxy[target_index[0]], width=frame_width, height=frame_height)
+        return region, expected
 
-    def process_frame(self) -> Optional[str]:
-        if self.video_capture is None:
+    @METRICS.timed("stage_capture")
+    def read_frame(self) -> Optional[FramePacket]:
+        """ Capture stage: fetch the next frame from the video source """
+        video_capture = self.video_capture
+        if video_capture is None:
             return
 
-        ret, frame = self.video_capture.read()
+        if isinstance(video_capture, MjpegReader):  # keep the JPEG, it is only decoded when a stage needs pixels
+            jpeg_frame = video_capture.read_jpeg()
+            if jpeg_frame is None:
+                return
+            self.link_monitor.frame_arrived(jpeg_frame.arrival_time)
+            return FramePacket(frame_id=next(self.frame_counter), capture_time=jpeg_frame.arrival_time,
+                               jpeg=jpeg_frame, decode_scale=self.decode_scale)
+
+        ret, frame = video_capture.read()
 
         if ret is False or frame is None:
             return
@@ -121,25 +264,117 @@ class VideoHandler:
         if self.video_source_ip == 0:  # TODO: remove this temporary code to make webcam smaller
             frame = cv2.resize(frame, (800, 600), interpolation=cv2.INTER_LINEAR)
 
-        frame_height, frame_width, frame_channels = frame.shape
+        return FramePacket(frame_id=next(self.frame_counter), capture_time=time.monotonic(), frame=frame)
+
+    @METRICS.timed("stage_inference")
+    def detect(self, packet: FramePacket) -> FramePacket:
+        """ Inference stage: run YOLO tracking on the frame """
+        model = self.model
+        if model is None or packet.decoded() is None:
+            return packet
+        packet.class_names = model.names
+        if self.inference_cadence.should_detect(packet.frame) is False:
+            frame_height, frame_width = packet.frame.shape[:2]
+            packet.detections = self.box_propagator.predict(packet.capture_time, width=frame_width, height=frame_height)
+            self.inference_cadence.skipped()
+            return packet
+        start_time = time.perf_counter()
+        target_region = self._target_region(packet)
+        if target_region is None:
+            packet.detections = self._track_target(model, packet.frame)
+            self.roi_inference.full_frame_done()
+        else:
+            region, expected = target_region
+            packet.detections = self._detect_in_region(model, packet.frame, region=region, reference=expected)
+            self.roi_inference.roi_done()
+        self.inference_cadence.detected(packet.frame, packet.detections, time.perf_counter() - start_time)
+        self.box_propagator.update(packet.detections, packet.capture_time)
+        return packet
+
+    @METRICS.timed("stage_control")
+    def control(self, packet: FramePacket) -> Optional[FramePacket]:
+        """ Control stage: let the CamController pick/follow a target and move the camera """
+        shape = packet.shape()
+        if shape is None:
+            return
+        frame_height, frame_width = shape
         if self.cam_controller.width != frame_width or self.cam_controller.height != frame_height:
             self.cam_controller.resize(width=frame_width, height=frame_height)
 
-        if self.model is not None:
-            frame = self._track_target(frame)
+        if packet.detections is not None:
+            packet.target = self.cam_controller.handle(frame=packet.frame, detections=packet.detections,
+                                                      capture_time=packet.capture_time)
+            if self.cam_controller.tracking_enabled is True and len(packet.detections) > 0:
+                packet.drawn = True  # the CamController might have drawn its HUD on the frame
+        return packet
+
+    @METRICS.timed("stage_annotate")
+    def annotate(self, packet: FramePacket) -> FramePacket:
+        """ Annotate stage: render bounding boxes and bounding box labels """
+        if packet.detections is None or self.show_bounding_boxes is False:
+            return packet
+        interested_detections = packet.target.org_detections if packet.target is not None else Detections.empty()
+        labels = [
+            f"{tracker_id} {packet.class_names[class_id]} ({class_id}) {confidence:0.2f}"
+            for _, _, confidence, class_id, tracker_id
+            in interested_detections
+        ]
+        packet.frame = self.box_annotator.annotate(
+            scene=packet.frame,
+            detections=interested_detections,
+            labels=labels
+        )
+        packet.drawn = packet.drawn or len(interested_detections) > 0
+        return packet
+
+    @METRICS.timed("stage_encode")
+    def encode(self, packet: FramePacket) -> Optional[FramePacket]:
+        """ Encode stage: encode frame (image) for Flet GUI """
+        if packet.jpeg is not None and packet.drawn is False and self.frame_encoder.can_passthrough():
+            packet.encoded = self.frame_encoder.passthrough(packet.jpeg.jpeg)  # nothing to show on top of the camera JPEG
+            return packet
+        frame = packet.decoded()
+        if frame is None:
+            return
+        packet.encoded = self.frame_encoder.encode(frame)
+        return packet if packet.encoded is not None else None
+
+    @METRICS.timed("process_frame")
+    def process_frame(self) -> Optional[str]:
+        """ Run every stage serially on the calling thread (see `pipeline` for the concurrent version) """
+        packet = self.read_frame()
+        if packet is None:
+            return
+        for stage in (self.detect, self.control, self.annotate, self.encode):
+            packet = stage(packet)
+            if packet is None:
+                return
+        return packet.encoded
+
+    def start_pipeline(self) -> None:
+        self.pipeline.start()
+
+    def stop_pipeline(self) -> None:
+        self.pipeline.stop()
+
+    def get_latest_frame(self, timeout: Optional[float] = None) -> Optional[str]:
+        """ Get the latest base64 encoded frame produced by the pipeline """
+        packet = self.pipeline.get(timeout=timeout)
+        return packet.encoded if packet is not None else None
 
-        # encode frame (image) for Flet GUI
-        _, im_arr = cv2.imencode('.png', frame)
-        im_b64 = base64.b64encode(im_arr)
-        return im_b64.decode("utf-8")
+    def is_streaming(self) -> bool:
+        return self.video_capture is not None
 
     def get_frame_size(self) -> tuple[int, int]:
         return self.cam_controller.width, self.cam_controller.height
 
     def determine_frame_size(self) -> Optional[FrameSize]:
         width, height = self.get_frame_size()
+        if isinstance(self.video_capture, MjpegReader):  # frames are decoded at a reduced scale
+            width, height = width * self.decode_scale, height * self.decode_scale
         return FrameSize.determine_by(width=width, height=height)
 
     def set_frame_size(self, frame_size: FrameSize) -> None:
         self.set_video_input(self.video_source_ip)
-        self.cam_controller.resize(width=frame_size.width, height=frame_size.height)
+        scale = self.decode_scale if isinstance(self.video_capture, MjpegReader) else 1
+        self.cam_controller.resize(width=frame_size.width // scale, height=frame_size.height // scale)
@@ -1,9 +1,12 @@
-import flet as ft
+from typing import TYPE_CHECKING
 
-import gui
+if TYPE_CHECKING:
+    import flet as ft
 
 
-def main(page: ft.Page):
+def main(page: "ft.Page"):
+    import gui  # builds the whole GUI, so spawned inference workers (which re-run this module) must not import it
+
     page.window_width = 1600
     page.window_height = 1100
     page.window_top = 100
@@ -16,4 +19,6 @@ def main(page: ft.Page):
 
 
 if __name__ == '__main__':
+    import flet as ft
+
     ft.app(target=main)
@@ -0,0 +1,2 @@
+from simulator.virtual_camera import VirtualPanTiltCamera, VirtualServo, VirtualSocketHandler
+from simulator.scene import Scene, TargetMotion
@@ -0,0 +1,133 @@
+from enum import Enum
+from typing import Optional
+
+import cv2
+import numpy as np
+from supervision import Detections
+
+from simulator.virtual_camera import VirtualPanTiltCamera
+
+PERSON_CLASS_ID = 0
+TARGET_TRACKER_ID = 1
+
+
+class TargetMotion(Enum):
+    STATIC = "static"
+    LINEAR = "linear"  # constant velocity, bouncing off the edges of the panorama
+    RANDOM_WALK = "random_walk"  # a new random direction every `turn_interval` seconds
+
+
+class Scene:
+    """
+    A synthetic scene in panorama pixels: the target (and optional distractors) are person sized boxes moving around.
+
+    `detect(...)` plays the role of YOLO + the tracker: it returns the boxes inside the camera viewport as `Detections`,
+    with position noise and randomly missed detections. The target always has tracker ID 1.
+    """
+
+    def __init__(self, camera: VirtualPanTiltCamera, motion: TargetMotion = TargetMotion.LINEAR,
+                 target_speed: float = 10.0, box_size: tuple[int, int] = (80, 200), distractors: int = 0,
+                 turn_interval: float = 1.0, generator: Optional[np.random.Generator] = None):
+        self.camera = camera
+        self.motion = motion
+        self.target_speed = target_speed  # degrees per second
+        self.box_size = np.array(box_size, dtype=float)  # (width, height) in pixels
+        self.distractors = distractors  # number of other persons walking around
+        self.turn_interval = turn_interval
+        self.generator = generator if generator is not None else np.random.default_rng()
+        self.centers = np.zeros((1 + distractors, 2))  # panorama pixels, the target first
+        self.velocities = np.zeros((1 + distractors, 2))  # panorama pixels per second
+        self.time = 0.0
+        self.next_turn = 0.0
+        self.panorama: Optional[np.ndarray] = None
+
+    def reset(self, start_time: float = 0.0) -> None:
+        """ Put the target somewhere in the current viewport, the distractors anywhere around it """
+        view_x, view_y = self.camera.view_center()
+        spread = np.array([self.camera.frame_width, self.camera.frame_height]) * 0.4
+        self.centers[0] = (view_x, view_y) + self.generator.uniform(-spread, spread)
+        self.centers[1:] = (view_x, view_y) + self.generator.uniform(-spread * 3, spread * 3, size=(self.distractors, 2))
+        self.velocities[:] = [self._random_velocity() for _ in range(len(self.centers))]
+        self.time = start_time
+        self.next_turn = start_time + self.turn_interval
+
+    def _random_velocity(self) -> np.ndarray:
+        if self.motion == TargetMotion.STATIC:
+            return np.zeros(2)
+        angle = self.generator.uniform(0, 2 * np.pi)
+        return np.array([np.cos(angle), np.sin(angle)]) * self.target_speed * np.array(self.camera.pixels_per_degree)
+
+    def update(self, now: float) -> None:
+        elapsed = now - self.time
+        if elapsed <= 0:
+            return
+        self.time = now
+        if self.motion == TargetMotion.RANDOM_WALK and now >= self.next_turn:
+            self.velocities[:] = [self._random_velocity() for _ in range(len(self.centers))]
+            self.next_turn = now + self.turn_interval
+        self.centers += self.velocities * elapsed
+        half_size = self.box_size / 2
+        limits = np.array([self.camera.panorama_width, self.camera.panorama_height]) - half_size
+        bounced = (self.centers < half_size) | (self.centers > limits)
+        self.velocities[bounced] *= -1
+        self.centers = np.clip(self.centers, half_size, limits)
+
+    def boxes(self) -> np.ndarray:
+        """ Boxes of the target and the distractors in panorama pixels (xyxy) """
+        half_size = self.box_size / 2
+        return np.hstack([self.centers - half_size, self.centers + half_size])
+
+    def target_offset(self) -> tuple[float, float]:
+        """ Offset of the target from the center of the viewport, in degrees """
+        view_x, view_y = self.camera.view_center()
+        return ((self.centers[0, 0] - view_x) / self.camera.pixels_per_degree[0],
+                (self.centers[0, 1] - view_y) / self.camera.pixels_per_degree[1])
+
+    def target_visible(self) -> bool:
+        x, y = self.camera.to_view(self.boxes()[:1])[0].reshape(2, 2).mean(axis=0)
+        return bool(0 <= x < self.camera.frame_width and 0 <= y < self.camera.frame_height)
+
+    def detect(self, miss_rate: float = 0.0, noise: float = 0.0) -> Detections:
+        xyxy = self.camera.to_view(self.boxes())
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+        visible = ((centers[:, 0] >= 0) & (centers[:, 0] < self.camera.frame_width) &
+                   (centers[:, 1] >= 0) & (centers[:, 1] < self.camera.frame_height))
+        if miss_rate > 0:
+            visible &= self.generator.random(len(xyxy)) >= miss_rate
+        if noise > 0:
+            xyxy = xyxy + self.generator.normal(0, noise, size=(len(xyxy), 1))  # shift, keep the size
+        xyxy = np.clip(xyxy[visible], 0, [self.camera.frame_width - 1, self.camera.frame_height - 1] * 2)
+        count = len(xyxy)
+        return Detections(
+            xyxy=xyxy.astype(np.float32),
+            confidence=np.full(count, 0.9, dtype=np.float32),
+            class_id=np.full(count, PERSON_CLASS_ID, dtype=int),
+            tracker_id=np.flatnonzero(visible) + TARGET_TRACKER_ID,
+        )
+
+    def load_panorama(self, path: Optional[str] = None) -> np.ndarray:
+        """ The background for rendering: a recorded image / video frame stretched over the panorama, or a grid """
+        size = (self.camera.panorama_width, self.camera.panorama_height)
+        image = None
+        if path is not None:
+            image = cv2.imread(path)
+            if image is None:
+                video_capture = cv2.VideoCapture(path)
+                _, image = video_capture.read()
+                video_capture.release()
+        if image is not None:
+            self.panorama = cv2.resize(image, size, interpolation=cv2.INTER_LINEAR)
+        else:
+            self.panorama = np.full((size[1], size[0], 3), 40, dtype=np.uint8)
+            for x in range(0, size[0], 100):
+                cv2.line(self.panorama, (x, 0), (x, size[1]), (90, 90, 90), 1)
+            for y in range(0, size[1], 100):
+                cv2.line(self.panorama, (0, y), (size[0], y), (90, 90, 90), 1)
+        return self.panorama
+
+    def render(self) -> np.ndarray:
+        frame = self.camera.render(self.panorama if self.panorama is not None else self.load_panorama())
+        for index, box in enumerate(self.camera.to_view(self.boxes()).astype(int)):
+            color = (0, 140, 255) if index == 0 else (200, 200, 200)
+            cv2.rectangle(frame, tuple(box[:2]), tuple(box[2:]), color, thickness=-1)
+        return frame
@@ -0,0 +1,260 @@
+"""
+Closed-loop tracking simulator: CamController + Esp32Bridge drive a virtual pan/tilt camera on simulated time.
+
+Every episode puts a target somewhere in the view and lets the control loop follow it. The results are the time it took
+to center the target, the overshoot, the number of commands sent and whether the target was lost.
+
+Usage (from the dashboard-app directory):
+    python -m simulator.tracking --episodes 1000 --controllers STEP PID PREDICTIVE --latency 0.1
+    python -m simulator.tracking --episodes 1 --motion random_walk --record episode.avi
+"""
+import argparse
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from common import Clock, SimulatedClock
+from core import CamController, ControllerType, Esp32Bridge
+from simulator.scene import Scene, TargetMotion, TARGET_TRACKER_ID
+from simulator.virtual_camera import VirtualPanTiltCamera, VirtualSocketHandler
+
+
+@dataclass(frozen=True)
+class SimulationConfig:
+    controller_type: ControllerType = ControllerType.PREDICTIVE
+    kp: float = 0.6
+    ki: float = 0.0
+    kd: float = 0.02
+    duration: float = 10.0  # seconds per episode
+    fps: float = 15.0  # camera frame rate
+    processing_latency: float = 0.08  # seconds from capture until CamController gets the detections
+    latency: float = 0.05  # command round-trip time (seconds)
+    jitter: float = 0.0  # standard deviation of the round-trip time (seconds)
+    servo_speed: float = 180.0  # degrees per second
+    command_rate: float = 20.0  # maximum MOVE commands per second
+    servo_deadband: float = 0.25  # degrees, smaller moves aren't sent
+    frame_width: int = 800
+    frame_height: int = 600
+    pan_fov: float = 60.0
+    tilt_fov: float = 45.0
+    motion: TargetMotion = TargetMotion.LINEAR
+    target_speed: float = 10.0  # degrees per second
+    distractors: int = 0
+    miss_rate: float = 0.0  # probability of a missed detection
+    noise: float = 0.0  # standard deviation of the box position noise (pixels)
+    coyote_seconds: float = 3.0
+    boundary_offset: int = 10
+    center_tolerance: float = 20.0  # pixels, the target counts as centered within this distance
+
+
+@dataclass(frozen=True)
+class EpisodeResult:
+    time_to_center: Optional[float]  # seconds, None if the target was never centered
+    overshoot: float  # degrees past the center, worst axis
+    rms_error: float  # degrees, over the second half of the episode
+    commands: int
+    lost: bool  # the target left the view or CamController gave up on it
+    visible_fraction: float
+
+
+class TrackingSimulator:
+
+    def __init__(self, config: SimulationConfig, seed: int = 0, panorama_path: Optional[str] = None):
+        self.config = config
+        self.generator = np.random.default_rng(seed)
+        self.panorama_path = panorama_path  # background of the recorded episodes
+        self.panorama: Optional[np.ndarray] = None
+
+    def run_episode(self, video_writer: Optional[cv2.VideoWriter] = None) -> EpisodeResult:
+        config = self.config
+        clock = SimulatedClock()
+        Clock.use(clock)
+        try:
+            camera = VirtualPanTiltCamera(frame_width=config.frame_width, frame_height=config.frame_height,
+                                          pan_fov=config.pan_fov, tilt_fov=config.tilt_fov,
+                                          servo_speed=config.servo_speed)
+            scene = Scene(camera, motion=config.motion, target_speed=config.target_speed,
+                          distractors=config.distractors, generator=self.generator)
+            scene.reset(start_time=clock.time)
+            if video_writer is not None:
+                if self.panorama is None:
+                    self.panorama = scene.load_panorama(self.panorama_path)
+                scene.panorama = self.panorama
+            socket_handler = VirtualSocketHandler(camera, clock, latency=config.latency, jitter=config.jitter,
+                                                  generator=self.generator)
+            esp32_bridge = Esp32Bridge()
+            esp32_bridge.socket_handler = socket_handler
+            esp32_bridge.auto_pan = esp32_bridge.auto_tilt = True
+            esp32_bridge.servo_speed = config.servo_speed
+            esp32_bridge.servo_scheduler.background = False  # send inline, on simulated time
+            esp32_bridge.servo_scheduler.max_rate = config.command_rate
+            esp32_bridge.servo_scheduler.deadband = config.servo_deadband
+            controller = esp32_bridge.pan_tilt_controller
+            controller.pan_fov, controller.tilt_fov = config.pan_fov, config.tilt_fov
+            controller.set_gains(kp=config.kp, ki=config.ki, kd=config.kd)
+            controller.set_controller_type(config.controller_type)
+            rendering = video_writer is not None
+            cam_controller = CamController(width=config.frame_width, height=config.frame_height,
+                                           esp32_bridge=esp32_bridge, coyote_seconds=config.coyote_seconds,
+                                           boundary_offset=config.boundary_offset, show_arrows=rendering,
+                                           show_boundaries=rendering, show_center=rendering)
+            blank_frame = np.zeros((config.frame_height, config.frame_width, 3), dtype=np.uint8)
+            return self._run(clock, camera, scene, cam_controller, socket_handler, blank_frame, video_writer)
+        finally:
+            Clock.use(None)
+
+    def _run(self, clock: SimulatedClock, camera: VirtualPanTiltCamera, scene: Scene, cam_controller: CamController,
+             socket_handler: VirtualSocketHandler, blank_frame: np.ndarray,
+             video_writer: Optional[cv2.VideoWriter]) -> EpisodeResult:
+        config = self.config
+        frame_interval = 1 / config.fps
+        tolerance = (config.center_tolerance / camera.pixels_per_degree[0],
+                     config.center_tolerance / camera.pixels_per_degree[1])
+        time_to_center = None
+        initial_sign = None
+        overshoot = 0.0
+        errors = []
+        visible_frames = frames = 0
+        lost = False
+        frame_index = 0
+        while frame_index * frame_interval < config.duration:
+            capture_time = frame_index * frame_interval  # the camera keeps capturing at its own pace
+            newest_ready = int((clock.time - config.processing_latency) / frame_interval)
+            if newest_ready > frame_index:  # the control loop was busy, older frames were dropped by the pipeline
+                frame_index = newest_ready
+                continue
+            camera.update(capture_time)
+            scene.update(capture_time)
+            frames += 1
+            offset = np.array(scene.target_offset())
+            errors.append((capture_time, float(np.hypot(*offset))))
+            if initial_sign is None:
+                initial_sign = np.sign(offset)
+            overshoot = max(overshoot, float(np.max(-initial_sign * offset)))
+            if time_to_center is None and np.all(np.abs(offset) <= tolerance):
+                time_to_center = capture_time
+            if scene.target_visible() is True:
+                visible_frames += 1
+            else:
+                lost = True
+
+            detections = scene.detect(miss_rate=config.miss_rate, noise=config.noise)
+            frame = scene.render() if video_writer is not None else blank_frame
+            clock.advance_to(capture_time + config.processing_latency)
+            cam_controller.handle(frame=frame, detections=detections, capture_time=capture_time)
+            if cam_controller.target_tracker_id not in (None, TARGET_TRACKER_ID):
+                lost = True  # switched to a distractor
+            if video_writer is not None:
+                video_writer.write(frame)
+            frame_index += 1
+
+        late_errors = [error for timestamp, error in errors if timestamp >= config.duration / 2]
+        return EpisodeResult(
+            time_to_center=time_to_center,
+            overshoot=round(overshoot, 3),
+            rms_error=round(float(np.sqrt(np.mean(np.square(late_errors)))), 3) if late_errors else 0.0,
+            commands=socket_handler.commands_sent,
+            lost=lost,
+            visible_fraction=round(visible_frames / frames, 3) if frames > 0 else 0.0,
+        )
+
+    def run(self, episodes: int, record_path: Optional[str] = None) -> dict:
+        results = []
+        for episode in range(episodes):
+            video_writer = None
+            if record_path is not None and episode == 0:
+                video_writer = cv2.VideoWriter(record_path, cv2.VideoWriter_fourcc(*"MJPG"), self.config.fps,
+                                               (self.config.frame_width, self.config.frame_height))
+            try:
+                results.append(self.run_episode(video_writer=video_writer))
+            finally:
+                if video_writer is not None:
+                    video_writer.release()
+        return summarize(results)
+
+
+def summarize(results: list[EpisodeResult]) -> dict:
+    centered = [result.time_to_center for result in results if result.time_to_center is not None]
+
+    def stats(values: list[float]) -> Optional[dict]:
+        if len(values) == 0:
+            return None
+        return {"mean": round(float(np.mean(values)), 3), "p50": round(float(np.percentile(values, 50)), 3),
+                "p90": round(float(np.percentile(values, 90)), 3), "max": round(float(np.max(values)), 3)}
+
+    return {
+        "episodes": len(results),
+        "centered_rate": round(len(centered) / len(results), 3) if results else None,
+        "time_to_center_s": stats(centered),
+        "overshoot_deg": stats([result.overshoot for result in results]),
+        "rms_error_deg": stats([result.rms_error for result in results]),
+        "commands": stats([result.commands for result in results]),
+        "loss_rate": round(sum(result.lost for result in results) / len(results), 3) if results else None,
+        "visible_fraction": stats([result.visible_fraction for result in results]),
+    }
+
+
+def main(arguments: Optional[list[str]] = None) -> None:
+    defaults = SimulationConfig()
+    parser = argparse.ArgumentParser(description="Headless closed-loop tracking simulator")
+    parser.add_argument("--episodes", type=int, default=200)
+    parser.add_argument("--controllers", nargs="+", default=[defaults.controller_type.name],
+                        choices=[controller_type.name for controller_type in ControllerType])
+    parser.add_argument("--kp", type=float, default=defaults.kp)
+    parser.add_argument("--ki", type=float, default=defaults.ki)
+    parser.add_argument("--kd", type=float, default=defaults.kd)
+    parser.add_argument("--duration", type=float, default=defaults.duration, help="seconds per episode")
+    parser.add_argument("--fps", type=float, default=defaults.fps)
+    parser.add_argument("--processing-latency", type=float, default=defaults.processing_latency,
+                        help="seconds from frame capture until the detections reach CamController")
+    parser.add_argument("--latency", type=float, default=defaults.latency, help="command round-trip time (s)")
+    parser.add_argument("--jitter", type=float, default=defaults.jitter, help="round-trip time std deviation (s)")
+    parser.add_argument("--servo-speed", type=float, default=defaults.servo_speed, help="degrees per second")
+    parser.add_argument("--command-rate", type=float, default=defaults.command_rate,
+                        help="maximum MOVE commands per second")
+    parser.add_argument("--servo-deadband", type=float, default=defaults.servo_deadband,
+                        help="degrees, smaller moves aren't sent")
+    parser.add_argument("--motion", default=defaults.motion.value, choices=[motion.value for motion in TargetMotion])
+    parser.add_argument("--target-speed", type=float, default=defaults.target_speed, help="degrees per second")
+    parser.add_argument("--distractors", type=int, default=defaults.distractors)
+    parser.add_argument("--miss-rate", type=float, default=defaults.miss_rate)
+    parser.add_argument("--noise", type=float, default=defaults.noise, help="box position noise (pixels)")
+    parser.add_argument("--coyote-seconds", type=float, default=defaults.coyote_seconds)
+    parser.add_argument("--boundary-offset", type=int, default=defaults.boundary_offset)
+    parser.add_argument("--center-tolerance", type=float, default=defaults.center_tolerance)
+    parser.add_argument("--scene", help="image or video whose first frame is used as the background")
+    parser.add_argument("--record", help="write the first episode of every controller to this video file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="save the results as JSON to this file")
+    args = parser.parse_args(arguments)
+
+    results = {}
+    for controller_name in args.controllers:
+        config = SimulationConfig(
+            controller_type=ControllerType[controller_name], kp=args.kp, ki=args.ki, kd=args.kd,
+            duration=args.duration, fps=args.fps, processing_latency=args.processing_latency, latency=args.latency,
+            jitter=args.jitter, servo_speed=args.servo_speed, command_rate=args.command_rate,
+            servo_deadband=args.servo_deadband, motion=TargetMotion(args.motion),
+            target_speed=args.target_speed, distractors=args.distractors, miss_rate=args.miss_rate, noise=args.noise,
+            coyote_seconds=args.coyote_seconds, boundary_offset=args.boundary_offset,
+            center_tolerance=args.center_tolerance,
+        )
+        record_path = args.record
+        if record_path is not None and len(args.controllers) > 1:
+            root, extension = os.path.splitext(record_path)
+            record_path = f"{root}_{controller_name.lower()}{extension}"
+        simulator = TrackingSimulator(config, seed=args.seed, panorama_path=args.scene)
+        results[controller_name] = simulator.run(episodes=args.episodes, record_path=record_path)
+    results["config"] = {key: value for key, value in vars(args).items() if key not in ("output", "controllers")}
+    print(json.dumps(results, indent=2))
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import collections
+import re
+from typing import Optional
+
+import numpy as np
+
+from common import Clock, SimulatedClock
+
+
+class VirtualServo:
+    """ A servo that starts moving to a commanded angle after a delay, at a limited speed (degrees per second) """
+
+    def __init__(self, position: float = 90.0, speed: float = 180.0):
+        self.position = position
+        self.speed = speed
+        self.target = position
+        self.last_update = Clock.now()
+        self.pending: collections.deque[tuple[float, float]] = collections.deque()  # (apply time, angle)
+
+    def command(self, angle: float, apply_time: float) -> None:
+        if len(self.pending) > 0:
+            apply_time = max(apply_time, self.pending[-1][0])  # commands arrive in order (TCP)
+        self.pending.append((apply_time, angle))
+
+    def update(self, now: float) -> float:
+        """ Move the servo up to `now`, applying every command that arrived in the meantime """
+        while self.last_update < now:
+            next_time = now
+            if len(self.pending) > 0 and self.pending[0][0] <= now:
+                next_time = max(self.pending[0][0], self.last_update)
+            self._move(next_time - self.last_update)
+            self.last_update = next_time
+            while len(self.pending) > 0 and self.pending[0][0] <= self.last_update:
+                self.target = self.pending.popleft()[1]
+        return self.position
+
+    def _move(self, seconds: float) -> None:
+        max_step = self.speed * seconds
+        delta = self.target - self.position
+        self.position = self.target if abs(delta) <= max_step else self.position + np.sign(delta) * max_step
+
+
+class VirtualPanTiltCamera:
+    """
+    A pan/tilt camera looking at a panorama: the viewport is a crop of the panorama positioned by the servo angles.
+
+    Angles map linearly to panorama pixels (`frame_width / pan_fov` pixels per degree), with the same sign convention
+    as `Esp32Bridge`: lowering the pan angle moves the view to the right, lowering the tilt angle moves it down.
+    """
+
+    SERVO_RANGE = 180
+
+    def __init__(self, frame_width: int = 800, frame_height: int = 600, pan_fov: float = 60.0,
+                 tilt_fov: float = 45.0, servo_speed: float = 180.0):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.pixels_per_degree = (frame_width / pan_fov, frame_height / tilt_fov)
+        self.pan = VirtualServo(speed=servo_speed)
+        self.tilt = VirtualServo(speed=servo_speed)
+        self.panorama_width = int(self.SERVO_RANGE * self.pixels_per_degree[0]) + frame_width
+        self.panorama_height = int(self.SERVO_RANGE * self.pixels_per_degree[1]) + frame_height
+
+    def update(self, now: float) -> tuple[float, float]:
+        return self.pan.update(now), self.tilt.update(now)
+
+    def view_center(self) -> tuple[float, float]:
+        """ Center of the viewport in panorama pixels """
+        return ((self.SERVO_RANGE - self.pan.position) * self.pixels_per_degree[0] + self.frame_width / 2,
+                (self.SERVO_RANGE - self.tilt.position) * self.pixels_per_degree[1] + self.frame_height / 2)
+
+    def to_view(self, panorama_xyxy: np.ndarray) -> np.ndarray:
+        """ Convert panorama boxes (N, 4) to viewport pixels """
+        center_x, center_y = self.view_center()
+        offset = np.array([center_x - self.frame_width / 2, center_y - self.frame_height / 2] * 2)
+        return panorama_xyxy - offset
+
+    def render(self, panorama: np.ndarray) -> np.ndarray:
+        center_x, center_y = self.view_center()
+        left = int(round(center_x - self.frame_width / 2))
+        top = int(round(center_y - self.frame_height / 2))
+        left = min(max(left, 0), panorama.shape[1] - self.frame_width)
+        top = min(max(top, 0), panorama.shape[0] - self.frame_height)
+        return panorama[top:top + self.frame_height, left:left + self.frame_width].copy()
+
+
+class VirtualSocketHandler:
+    """
+    Stands in for `DeviceClient`: MOVE commands reach the virtual servos after half the network round-trip time, and
+    every command blocks the caller for the whole round trip (like the real websocket) by advancing the simulated clock.
+    """
+
+    MOVE_PATTERN = re.compile(r"MOVE (\S+) (\S+)")
+
+    def __init__(self, camera: VirtualPanTiltCamera, clock: SimulatedClock, latency: float = 0.05, jitter: float = 0.0,
+                 generator: Optional[np.random.Generator] = None):
+        self.camera = camera
+        self.clock = clock
+        self.latency = latency  # round-trip time (seconds)
+        self.jitter = jitter  # standard deviation of the round-trip time (seconds)
+        self.generator = generator if generator is not None else np.random.default_rng()
+        self.commands_sent = 0
+
+    def send_command(self, command: str) -> Optional[str]:
+        self.commands_sent += 1
+        round_trip_time = max(0.0, self.latency + (self.generator.normal(0, self.jitter) if self.jitter > 0 else 0))
+        match = self.MOVE_PATTERN.fullmatch(command)
+        if match is not None:
+            apply_time = self.clock.time + round_trip_time / 2
+            self.camera.pan.command(float(match.group(1)), apply_time)
+            self.camera.tilt.command(float(match.group(2)), apply_time)
+        self.clock.advance(round_trip_time)
+        return "PONG" if command == "PING" else "success"
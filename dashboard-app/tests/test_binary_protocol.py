@@ -0,0 +1,118 @@
+import ast
+import struct
+from pathlib import Path
+
+from core import binary_protocol
+
+
+FIRMWARE_MAIN = Path(__file__).resolve().parents[2] / "esp32-camera" / "main.py"
+
+
+def decode_request(message: bytes) -> tuple[int, int, int, int]:
+    return binary_protocol.REQUEST.unpack(message)
+
+
+def firmware_constants() -> dict:
+    """ The module level constants of the firmware, read from the source (importing it would start the hardware) """
+    constants = {}
+    for node in ast.parse(FIRMWARE_MAIN.read_text()).body:
+        if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+            try:
+                constants[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                pass  # not a literal
+    return constants
+
+
+def test_round_trip():
+    message = binary_protocol.encode_command(42, "MOVE 92.35 88.0")
+    assert len(message) == binary_protocol.REQUEST.size == 7
+    assert decode_request(message) == (binary_protocol.CMD_MOVE, 42, 9235, 8800)
+    reply = binary_protocol.REPLY.pack(binary_protocol.CMD_MOVE | binary_protocol.REPLY_FLAG, 42,
+                                       binary_protocol.STATUS_OK)
+    assert binary_protocol.decode_reply(reply) == (42, "success")
+
+
+def test_round_trip_other_commands():
+    assert decode_request(binary_protocol.encode_command(1, "PING")) == (binary_protocol.CMD_PING, 1, 0, 0)
+    assert decode_request(binary_protocol.encode_command(2, "FLASH on")) == (binary_protocol.CMD_FLASH, 2, 1, 0)
+    assert decode_request(binary_protocol.encode_command(3, "flash OFF")) == (binary_protocol.CMD_FLASH, 3, 0, 0)
+    assert decode_request(binary_protocol.encode_command(4, "FRAMESIZE 9")) == (binary_protocol.CMD_FRAMESIZE, 4, 9, 0)
+    assert decode_request(binary_protocol.encode_command(5, "QUALITY 12")) == (binary_protocol.CMD_QUALITY, 5, 12, 0)
+    assert decode_request(binary_protocol.encode_command(6, "FPS 10")) == (binary_protocol.CMD_FPS, 6, 10, 0)
+
+
+def test_sequence_id_wraps():
+    assert decode_request(binary_protocol.encode_command(0x10005, "PING"))[1] == 5
+
+
+def test_ping_reply():
+    reply = binary_protocol.REPLY.pack(binary_protocol.CMD_PING | binary_protocol.REPLY_FLAG, 7,
+                                       binary_protocol.STATUS_OK)
+    assert binary_protocol.decode_reply(reply) == (7, "PONG")
+
+
+def test_error_reply():
+    reply = binary_protocol.REPLY.pack(binary_protocol.CMD_FPS | binary_protocol.REPLY_FLAG, 8,
+                                       binary_protocol.STATUS_INVALID_ARGUMENT)
+    sequence_id, text = binary_protocol.decode_reply(reply)
+    assert sequence_id == 8
+    assert text.startswith("ERROR")
+
+
+def test_invalid_replies():
+    assert binary_protocol.decode_reply(b"\x81\x00") is None  # too short
+    assert binary_protocol.decode_reply(binary_protocol.REPLY.pack(binary_protocol.CMD_PING, 1, 0)) is None  # no flag
+
+
+def test_commands_without_binary_form():
+    assert binary_protocol.encode_command(1, "MOTION 300 2000") is None
+    assert binary_protocol.encode_command(1, "POS") is None
+    assert binary_protocol.encode_command(1, "FLASH maybe") is None
+    assert binary_protocol.encode_command(1, "QUALITY high") is None
+
+
+def test_velocity_signs():
+    message = binary_protocol.encode_command(9, "VEL -12.5 30.0")
+    command, sequence_id, pan, tilt = decode_request(message)
+    assert (command, sequence_id) == (binary_protocol.CMD_VEL, 9)
+    assert pan == 0x10000 - 125  # two's complement on the wire
+    assert (binary_protocol.to_signed(pan), binary_protocol.to_signed(tilt)) == (-125, 300)
+
+
+def test_velocity_limits():
+    _, _, pan, tilt = decode_request(binary_protocol.encode_command(1, "VEL -3276.8 3276.7"))
+    assert (binary_protocol.to_signed(pan), binary_protocol.to_signed(tilt)) == (-0x8000, 0x7FFF)
+    assert binary_protocol.encode_command(1, "VEL 3276.8 0") is None
+    assert binary_protocol.encode_command(1, "VEL 0 -3276.9") is None
+
+
+def test_to_signed():
+    assert binary_protocol.to_signed(0) == 0
+    assert binary_protocol.to_signed(0x7FFF) == 0x7FFF
+    assert binary_protocol.to_signed(0x8000) == -0x8000
+    assert binary_protocol.to_signed(0xFFFF) == -1
+
+
+def test_move_range():
+    assert decode_request(binary_protocol.encode_command(1, "MOVE 0 180"))[2:] == (0, 18000)
+    # above 18000 centidegrees still fits the field, the firmware rejects it with STATUS_INVALID_ARGUMENT
+    assert decode_request(binary_protocol.encode_command(1, "MOVE 200 90"))[2:] == (20000, 9000)
+
+
+def test_move_out_of_field():
+    assert binary_protocol.encode_command(1, "MOVE 700 90") is None  # 70000 centidegrees don't fit 16 bits
+    assert binary_protocol.encode_command(1, "MOVE -1 90") is None
+    assert binary_protocol.encode_command(1, "MOVE 90") is None
+
+
+def test_firmware_constants_match():
+    constants = firmware_constants()
+    assert constants["BINARY_REQUEST"] == binary_protocol.REQUEST.format
+    assert constants["BINARY_REQUEST_SIZE"] == binary_protocol.REQUEST.size
+    assert constants["BINARY_REPLY"] == binary_protocol.REPLY.format
+    names = [name for name in dir(binary_protocol) if name.startswith(("CMD_", "STATUS_"))]
+    assert sorted(names) == sorted(name for name in constants if name.startswith(("CMD_", "STATUS_")))
+    for name in names:
+        assert constants[name] == getattr(binary_protocol, name), name
+    assert struct.calcsize(constants["BINARY_REPLY"]) == binary_protocol.REPLY.size
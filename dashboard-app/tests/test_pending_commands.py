@@ -0,0 +1,81 @@
+from concurrent.futures import Future
+
+from core.pending_commands import PendingCommands
+
+
+def test_tagged_reply():
+    pending = PendingCommands()
+    first, second = Future(), Future()
+    first_id, second_id = pending.add(first), pending.add(second)
+    assert pending.tag(first_id, "PING") == f"#{first_id} PING"
+    assert pending.resolve(f"#{second_id} success") is True  # replies may arrive out of order
+    assert pending.resolve(f"#{first_id} PONG") is True
+    assert (first.result(), second.result()) == ("PONG", "success")
+    assert len(pending) == 0
+
+
+def test_untagged_reply_answers_oldest():
+    pending = PendingCommands()
+    first, second = Future(), Future()
+    pending.add(first)
+    pending.add(second)
+    assert pending.resolve("PONG") is True
+    assert first.result() == "PONG"
+    assert second.done() is False
+    assert len(pending) == 1
+
+
+def test_untagged_reply_without_commands():
+    assert PendingCommands().resolve("success") is False
+
+
+def test_late_reply_after_forget():
+    pending = PendingCommands()
+    future = Future()
+    sequence_id = pending.add(future)
+    pending.forget(sequence_id)  # the caller timed out
+    assert pending.resolve(f"#{sequence_id} success") is False
+    assert pending.resolve_id(sequence_id, "success") is False
+    assert future.done() is False
+
+
+def test_late_reply_for_done_future():
+    pending = PendingCommands()
+    future = Future()
+    sequence_id = pending.add(future)
+    future.set_result(None)
+    assert pending.resolve_id(sequence_id, "success") is False
+    assert future.result() is None
+
+
+def test_unknown_tag():
+    pending = PendingCommands()
+    future = Future()
+    pending.add(future)
+    assert pending.resolve("#999 success") is False
+    assert future.done() is False
+
+
+def test_resolve_id():
+    pending = PendingCommands()
+    future = Future()
+    sequence_id = pending.add(future)
+    assert pending.resolve_id(sequence_id, "PONG") is True
+    assert future.result() == "PONG"
+
+
+def test_sequence_ids_wrap():
+    pending = PendingCommands()
+    for _ in range(0xFFFF):
+        pending.forget(pending.add(Future()))
+    assert pending.add(Future()) == 0
+
+
+def test_fail_all():
+    pending = PendingCommands()
+    futures = [Future(), Future()]
+    for future in futures:
+        pending.add(future)
+    pending.fail_all()
+    assert [future.result() for future in futures] == [None, None]
+    assert len(pending) == 0
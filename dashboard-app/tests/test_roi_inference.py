@@ -0,0 +1,27 @@
+from logic.roi_inference import RoiInference
+
+FULL_FRAME_SIZE = 640  # VideoHandler.inference_size
+
+
+def test_crop_runs_below_the_full_frame_size():
+    roi_inference = RoiInference(enabled=True)
+    region = roi_inference.region_for((380, 260, 440, 380), width=800, height=600)  # a person in an SVGA frame
+    imgsz = roi_inference.inference_size_for(region, max_size=FULL_FRAME_SIZE)
+    assert imgsz < FULL_FRAME_SIZE
+    assert imgsz % RoiInference.STRIDE == 0
+
+
+def test_crop_is_never_scaled_up():
+    roi_inference = RoiInference(enabled=True)
+    for target in ((10, 10, 30, 40), (300, 200, 420, 330), (0, 0, 250, 590), (700, 500, 800, 600)):
+        x1, y1, x2, y2 = region = roi_inference.region_for(target, width=800, height=600)
+        assert 0 <= x1 < x2 <= 800 and 0 <= y1 < y2 <= 600
+        assert (x2 - x1) % RoiInference.STRIDE == 0 and (y2 - y1) % RoiInference.STRIDE == 0
+        imgsz = roi_inference.inference_size_for(region, max_size=FULL_FRAME_SIZE)
+        assert imgsz == min(max(x2 - x1, y2 - y1), FULL_FRAME_SIZE)
+
+
+def test_min_size_floor():
+    roi_inference = RoiInference(enabled=True, min_size=192)
+    region = roi_inference.region_for((400, 300, 405, 305), width=800, height=600)
+    assert roi_inference.inference_size_for(region, max_size=FULL_FRAME_SIZE) == 192
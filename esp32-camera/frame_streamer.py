@@ -0,0 +1,124 @@
+import time
+import _thread
+
+import uasyncio as asyncio
+
+from ticks import ticks_add, ticks_diff, ticks_ms
+
+
+FRAME_HEADER = b"--frame\r\nContent-Type: image/jpeg\r\n\r\n"
+FRAME_TRAILER = b"\r\n"
+MAX_FPS = 60
+WRITE_CHUNK = 4096  # bytes per write, a stream only ever buffers what's left of one chunk
+
+
+async def write_all(writer, data):
+    # the data goes out in memoryview slices (not copies), waiting for each one to drain
+    view = memoryview(data)
+    for start in range(0, len(view), WRITE_CHUNK):
+        writer.write(view[start:start + WRITE_CHUNK])
+        await writer.drain()
+
+
+async def write_frame(writer, frame):
+    # not `FRAME_HEADER + frame + FRAME_TRAILER`: that would allocate and copy the whole JPEG for every frame
+    writer.write(FRAME_HEADER)
+    await write_all(writer, frame)
+    writer.write(FRAME_TRAILER)
+    await writer.drain()
+
+
+class FrameStreamer:
+    """
+    One capture loop shared by every MJPEG client.
+
+    The producer thread captures into a double buffer (two frame slots, it always fills the one that isn't the newest)
+    while anybody is streaming, so the blocking capture never holds up the event loop. Every client coroutine sends the
+    newest frame it hasn't sent yet, so a slow client skips frames instead of holding the producer (or the other
+    clients) back.
+
+    A frame is sent as the preallocated header, the JPEG itself and the trailer, so no per-frame buffer is built.
+    `target_fps` caps the capture rate (0: as fast as the sensor goes) to save bandwidth.
+    """
+
+    IDLE_SLEEP = 0.05  # seconds between checks for clients while nobody is streaming
+    POLL_SLEEP = 0.005  # seconds between checks for a new frame
+
+    def __init__(self, camera):
+        self.camera = camera
+        self.frames = [None, None]  # double buffer
+        self.latest = 0  # slot of the newest frame
+        self.sequence = 0  # number of frames captured so far
+        self.clients = 0
+        self.lock = _thread.allocate_lock()
+        self.started = False
+        self.target_fps = 0  # frames per second, 0 for no limit
+        self._next_capture = ticks_ms()
+
+    def start(self):
+        self.lock.acquire()
+        start = not self.started
+        self.started = True
+        self.lock.release()
+        if start:
+            _thread.start_new_thread(self._capture_loop, ())
+
+    def set_target_fps(self, fps):
+        if not 0 <= fps <= MAX_FPS:
+            return False
+        self.target_fps = fps
+        return True
+
+    def _pace(self):
+        # sleep until the next capture is due at `target_fps`
+        if self.target_fps <= 0:
+            return
+        now = ticks_ms()
+        wait = ticks_diff(self._next_capture, now)
+        if wait > 0:
+            time.sleep(wait / 1000)
+            now = self._next_capture
+        self._next_capture = ticks_add(now, int(1000 / self.target_fps))
+
+    def _capture_loop(self):
+        while True:
+            if self.clients == 0:
+                time.sleep(self.IDLE_SLEEP)
+                continue
+            self._pace()
+            frame = self.camera.capture()
+            if not frame:
+                continue
+            slot = 1 - self.latest
+            self.frames[slot] = frame
+            self.lock.acquire()
+            self.latest = slot
+            self.sequence += 1
+            self.lock.release()
+
+    async def next_frame(self, sent_sequence):
+        # wait for a frame newer than `sent_sequence`, returns it with its sequence number
+        while True:
+            self.lock.acquire()
+            sequence, frame = self.sequence, self.frames[self.latest]
+            self.lock.release()
+            if sequence != sent_sequence and frame is not None:
+                return sequence, frame
+            await asyncio.sleep(self.POLL_SLEEP)
+
+    def _add_client(self, count):
+        self.lock.acquire()
+        self.clients += count
+        self.lock.release()
+
+    async def stream(self, writer):
+        # send frames to one client until it disconnects (raises OSError)
+        self.start()
+        self._add_client(1)
+        try:
+            sequence = self.sequence
+            while True:
+                sequence, frame = await self.next_frame(sequence)
+                await write_frame(writer, frame)
+        finally:
+            self._add_client(-1)
@@ -0,0 +1,44 @@
+"""
+Stub of the esp32-camera `camera` module for running the firmware on a host (CPython or the MicroPython unix port).
+
+`capture()` paces itself like the sensor (`FPS` frames per second) and returns a fake JPEG of `FRAME_BYTES` bytes that
+starts with the frame number, so a client can tell which frames it got.
+"""
+import time
+
+FPS = 25
+FRAME_BYTES = 20000
+
+captured = 0
+frame_size = 10
+jpeg_quality = 12
+_last_capture = 0.0
+
+
+def init():
+    return True
+
+
+def deinit():
+    pass
+
+
+def framesize(key):
+    global frame_size
+    frame_size = key
+
+
+def quality(value):
+    global jpeg_quality
+    jpeg_quality = value
+
+
+def capture():
+    global captured, _last_capture
+    delay = _last_capture + 1 / FPS - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    _last_capture = time.time()
+    captured += 1
+    header = b"\xff\xd8" + str(captured).encode() + b"\n"
+    return header + bytes(FRAME_BYTES - len(header) - 2) + b"\xff\xd9"
@@ -0,0 +1,520 @@
+"""
+Run the firmware on a host with the stub `camera`, `machine` and `network` modules of this folder.
+
+Usage (from the esp32-camera directory):
+    python host/harness.py serve --port 8080
+    python host/harness.py stream --clients 4 --slow-clients 1 --seconds 5
+    python host/harness.py heap --frames 200
+    python host/harness.py websocket --frames 2000
+    python host/harness.py latency --clients 3 --commands 200
+    python host/harness.py burst --connections 20
+    python host/harness.py motion --max-velocity 300 --max-acceleration 2000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+FIRMWARE_DIR = os.path.dirname(HOST_DIR)
+sys.path[:0] = [HOST_DIR, FIRMWARE_DIR]  # the stubs shadow the MicroPython-only modules
+
+import camera  # noqa: E402 (the stub)
+import frame_streamer  # noqa: E402
+import smooth_servo  # noqa: E402
+import websocket_decoder  # noqa: E402
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+LWIP_SEND_BUFFER = 5744  # TCP_SND_BUF of the ESP32 lwIP stack, the host's default is megabytes
+
+
+class _LwipSocket(socket.socket):
+    """ A socket with the small send buffer of the ESP32, so a slow reader fills it like on the device """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, LWIP_SEND_BUFFER)
+
+
+def start_firmware(port):
+    """ Import the firmware (which initializes the stub hardware) and serve on `port` in a background thread """
+    import main
+    socket.socket = _LwipSocket  # also what the accepted connections are created as
+    threading.Thread(target=asyncio.run, args=(main.serve(port),), daemon=True).start()
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return main
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("The firmware didn't start listening")
+
+
+class StreamClient(threading.Thread):
+    """ Reads /camera and counts the frames, a slow client pauses after every read """
+
+    def __init__(self, port, delay=0.0):
+        super().__init__(daemon=True)
+        self.port = port
+        self.delay = delay
+        self.frames = 0
+        self.frame_numbers = []
+        self.running = True
+
+    def run(self):
+        sock = socket.socket()
+        if self.delay > 0:  # a small receive buffer, so the firmware notices the slow reader
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024)
+        sock.connect(("127.0.0.1", self.port))
+        sock.sendall(b"GET /camera HTTP/1.1\r\n\r\n")
+        data = b""
+        while self.running:
+            chunk = sock.recv(16 * 1024 if self.delay > 0 else 64 * 1024)
+            if not chunk:
+                break
+            data += chunk
+            while True:
+                start = data.find(b"\xff\xd8")
+                end = data.find(b"\xff\xd9", start)
+                if start == -1 or end == -1:
+                    break
+                self.frames += 1
+                self.frame_numbers.append(int(data[start + 2:data.index(b"\n", start)]))
+                data = data[end + 2:]
+            if self.delay > 0:
+                time.sleep(self.delay)
+        sock.close()
+
+
+def run_stream(args):
+    camera.FPS = args.fps
+    camera.FRAME_BYTES = args.frame_bytes
+    port = free_port()
+    firmware = start_firmware(port)
+    firmware.streamer.set_target_fps(args.target_fps)
+    clients = [StreamClient(port) for _ in range(args.clients)]
+    clients += [StreamClient(port, delay=args.slow_delay) for _ in range(args.slow_clients)]
+    for client in clients:
+        client.start()
+    time.sleep(1)  # let every client connect
+    captured_before = camera.captured
+    frames_before = [client.frames for client in clients]
+    time.sleep(args.seconds)
+    captured = camera.captured - captured_before
+    target = args.target_fps or "unlimited"
+    print(f"sensor: {args.fps} fps (target {target}), captured {captured / args.seconds:.1f} fps "
+          f"with {len(clients)} clients")
+    for index, (client, before) in enumerate(zip(clients, frames_before)):
+        kind = "slow" if client.delay > 0 else "fast"
+        numbers = client.frame_numbers
+        skipped = sum(b - a - 1 for a, b in zip(numbers, numbers[1:]))
+        print(f"client {index} ({kind}): {(client.frames - before) / args.seconds:.1f} fps, skipped {skipped} frames")
+    for client in clients:
+        client.running = False
+
+
+class SinkWriter:
+    """ A stream writer that swallows what is written and never has to wait for the network """
+
+    def __init__(self):
+        self.received = 0
+
+    def write(self, data):
+        self.received += len(data)
+
+    async def drain(self):
+        pass
+
+
+async def concatenating_write(writer, frame):
+    # the send path before the copy-free one, for comparison
+    await frame_streamer.write_all(writer, frame_streamer.FRAME_HEADER + frame + frame_streamer.FRAME_TRAILER)
+
+
+def run_until_complete(coroutine):
+    # the fake streams never wait, so a single step runs the coroutine to the end without an event loop
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("the coroutine waited for something")
+
+
+def measure_heap(write, frames):
+    """ Heap bytes allocated per frame by `write` and the garbage collections it caused (None if unknown) """
+    writer = SinkWriter()
+    if hasattr(gc, "mem_alloc"):  # MicroPython: count every allocation with the collector paused
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for frame in frames:
+            run_until_complete(write(writer, frame))
+        allocated = gc.mem_alloc() - before
+        gc.enable()
+        return allocated / len(frames), None
+    # CPython: the memory freed right away never shows up as allocated, so the peak above the baseline is used
+    import tracemalloc
+    collections_before = sum(stats["collections"] for stats in gc.get_stats())
+    tracemalloc.start()
+    allocated = 0
+    for frame in frames:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        run_until_complete(write(writer, frame))
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    collections = sum(stats["collections"] for stats in gc.get_stats()) - collections_before
+    return allocated / len(frames), collections
+
+
+def run_heap(args):
+    camera.FPS = 1000  # don't pace the stub, the frames are captured up front
+    camera.FRAME_BYTES = args.frame_bytes
+    frames = [camera.capture() for _ in range(args.frames)]
+    for name, write in (("copy-free", frame_streamer.write_frame), ("concatenating", concatenating_write)):
+        per_frame, collections = measure_heap(write, frames)
+        gc_runs = "n/a" if collections is None else collections
+        print(f"{name}: {per_frame:.0f} heap bytes per {args.frame_bytes} byte frame, "
+              f"{gc_runs} GC runs over {args.frames} frames")
+
+
+def client_frame(opcode, payload, mask):
+    """ A masked websocket frame, as the dashboard sends it """
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, 0x80 | length)
+    elif length < (1 << 16):
+        header = struct.pack(">BBH", 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 0x80 | 127, length)
+    return header + mask + bytes(byte ^ mask[index % 4] for index, byte in enumerate(payload))
+
+
+def generator_unmask(mask, payload):
+    # the byte by byte unmasking the decoder replaced, for comparison
+    return bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+class ChunkedStream:
+    """ A stream reader handing out a byte stream in the given chunk sizes, with readinto() or only read() """
+
+    def __init__(self, data, chunk_sizes, readinto=True):
+        self.data = memoryview(data)
+        self.chunk_sizes = chunk_sizes
+        self.offset = 0
+        if readinto is True:
+            self.readinto = self._readinto
+
+    def _next_chunk(self, limit):
+        size = min(next(self.chunk_sizes), limit)
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+    async def read(self, limit):
+        return bytes(self._next_chunk(limit))
+
+    async def _readinto(self, buffer):
+        chunk = self._next_chunk(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def decode_all(reader, decoder=None):
+    decoder = decoder if decoder is not None else websocket_decoder.FrameDecoder()
+    frames = []
+    while run_until_complete(decoder.receive(reader)) > 0:
+        frame = decoder.next_frame()
+        while frame is not None:
+            frames.append((frame[0], bytes(frame[1])))
+            frame = decoder.next_frame()
+    return frames
+
+
+def random_messages(rng, count):
+    messages = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            messages.append((1, f"#{rng.randrange(1 << 16)} MOVE {rng.uniform(0, 180):.2f} {rng.uniform(0, 180):.2f}"
+                             .encode()))
+        elif kind < 0.8:
+            messages.append((2, struct.pack(">BHHH", 4, rng.randrange(1 << 16), rng.randrange(18001),
+                                            rng.randrange(18001))))
+        elif kind < 0.95:
+            messages.append((2, bytes(rng.randrange(256) for _ in range(rng.randrange(0, 300)))))
+        else:  # larger than a 1024 byte read, some larger than the initial buffer
+            messages.append((2, bytes(rng.randrange(256) for _ in range(rng.randrange(1000, 12000)))))
+    return messages
+
+
+def check_fragmented(args):
+    rng = random.Random(args.seed)
+    messages = random_messages(rng, args.frames)
+    stream = b"".join(client_frame(opcode, payload, bytes(rng.randrange(256) for _ in range(4)))
+                      for opcode, payload in messages)
+    splits = {
+        "byte by byte": lambda: iter(lambda: 1, None),
+        "random 1-16 bytes": lambda: iter(lambda: rng.randint(1, 16), None),
+        "random 1-1500 bytes": lambda: iter(lambda: rng.randint(1, 1500), None),
+        "1024 byte reads": lambda: iter(lambda: 1024, None),
+        "coalesced, full buffer reads": lambda: iter(lambda: len(stream), None),
+    }
+    failures = 0
+    for name, chunk_sizes in splits.items():
+        for readinto in (True, False):
+            frames = decode_all(ChunkedStream(stream, chunk_sizes(), readinto=readinto))
+            ok = frames == messages
+            failures += ok is False
+            api = "readinto" if readinto is True else "read"
+            print(f"{name} ({api}): {len(frames)}/{len(messages)} frames {'OK' if ok else 'MISMATCH'}")
+    decoder = websocket_decoder.FrameDecoder()
+    oversized = client_frame(2, bytes(decoder.max_payload + 1), b"\x00\x00\x00\x00")
+    try:
+        decode_all(ChunkedStream(oversized, iter(lambda: 1024, None)), decoder)
+        print("oversized frame: MISSED")
+        failures += 1
+    except ValueError:
+        print("oversized frame: rejected OK")
+    return failures
+
+
+def measure_decoding(args):
+    rng = random.Random(args.seed)
+    for name, payload in (("MOVE command", b"#1234 MOVE 92.35 88.00"), ("4 kB payload", bytes(4096))):
+        mask = bytes(rng.randrange(256) for _ in range(4))
+        stream = client_frame(1, payload, mask) * args.frames
+        started = time.perf_counter()
+        frames = decode_all(ChunkedStream(stream, iter(lambda: 1024, None)))
+        elapsed = time.perf_counter() - started
+        masked = stream[-len(payload):]
+        started = time.perf_counter()
+        for _ in range(args.frames):
+            generator_unmask(mask, masked)
+        generator_elapsed = time.perf_counter() - started
+        print(f"{name}: {len(frames) / elapsed:.0f} frames/s, {len(stream) / elapsed / 1e6:.1f} MB/s decoded "
+              f"(byte by byte unmasking alone: {args.frames / generator_elapsed:.0f} frames/s)")
+
+
+def run_websocket(args):
+    failures = check_fragmented(args)
+    measure_decoding(args)
+    if failures > 0:
+        sys.exit(f"{failures} fragmented streams weren't decoded correctly")
+
+
+class CommandClient:
+    """ A websocket client sending tagged text commands one at a time, like the dashboard """
+
+    def __init__(self, port):
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(b"GET / HTTP/1.1\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          b"Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n\r\n")
+        response = b""
+        while b"\r\n\r\n" not in response:
+            response += self.sock.recv(1024)
+        if not response.startswith(b"HTTP/1.1 101"):
+            raise RuntimeError("The firmware refused the websocket")
+        self.sequence = 0
+
+    def _read_exactly(self, count):
+        data = b""
+        while len(data) < count:
+            chunk = self.sock.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("The firmware closed the websocket")
+            data += chunk
+        return data
+
+    def command(self, command):
+        self.sequence += 1
+        self.sock.sendall(client_frame(1, f"#{self.sequence} {command}".encode(), os.urandom(4)))
+        length = self._read_exactly(2)[1] & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self._read_exactly(2))[0]
+        return self._read_exactly(length).decode()
+
+    def close(self):
+        self.sock.close()
+
+
+def measure_latency(port, count):
+    client = CommandClient(port)
+    round_trip_times = []
+    for _ in range(count):
+        started = time.perf_counter()
+        client.command("PING")
+        round_trip_times.append(time.perf_counter() - started)
+        time.sleep(0.005)
+    client.close()
+    round_trip_times.sort()
+    last = len(round_trip_times) - 1
+    return [round_trip_times[round(last * quantile)] * 1000 for quantile in (0.5, 0.95, 1.0)]
+
+
+def run_latency(args):
+    camera.FPS = args.fps
+    camera.FRAME_BYTES = args.frame_bytes
+    port = free_port()
+    start_firmware(port)
+    print("streaming clients | PING round-trip time: median, p95, max (ms)")
+    median, p95, worst = measure_latency(port, args.commands)
+    print(f"0 | {median:.1f}, {p95:.1f}, {worst:.1f}")
+    clients = [StreamClient(port) for _ in range(args.clients)]
+    clients += [StreamClient(port, delay=args.slow_delay) for _ in range(args.slow_clients)]
+    for client in clients:
+        client.start()
+    time.sleep(1)
+    median, p95, worst = measure_latency(port, args.commands)
+    print(f"{len(clients)} ({args.slow_clients} slow) | {median:.1f}, {p95:.1f}, {worst:.1f}")
+    for client in clients:
+        client.running = False
+
+
+def run_burst(args):
+    port = free_port()
+    firmware = start_firmware(port)
+    sockets = [socket.create_connection(("127.0.0.1", port)) for _ in range(args.connections)]
+    time.sleep(0.5)  # every connection is accepted and waits for its request
+    for sock in sockets:
+        sock.sendall(b"GET / HTTP/1.1\r\n\r\n")
+    statuses = {}
+    for sock in sockets:
+        status = sock.recv(1024).split(b"\r\n")[0].decode() or "closed"
+        statuses[status] = statuses.get(status, 0) + 1
+        sock.close()
+    print(f"{args.connections} connections at once (limit {firmware.MAX_CONNECTIONS}):")
+    for status, count in sorted(statuses.items()):
+        print(f"    {count} x {status}")
+    print(f"served by one event loop, {threading.active_count()} threads in the process")
+
+
+class RecordingServo:
+    """ Stands in for `servo.Servo` and records every angle written """
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, degree):
+        self.writes.append(degree)
+
+
+def simulate_motion(args, commands, seconds):
+    """
+    Run one axis planner on simulated time. `commands` maps a time (ms) to a ("move", degree) or ("vel", degrees per
+    second) command, returns the position after every MOTION_PERIOD step.
+    """
+    clock = {"ms": 0}
+    smooth_servo.ticks_ms = lambda: clock["ms"]  # the planner's velocity timeout runs on the simulated clock
+    axis = smooth_servo.SmoothServo(RecordingServo(), position=90.0, max_velocity=args.max_velocity,
+                                    max_acceleration=args.max_acceleration)
+    period_ms = round(args.period * 1000)
+    pending = sorted(commands.items())
+    positions = []
+    for step in range(round(seconds / args.period)):
+        clock["ms"] = step * period_ms
+        while pending and pending[0][0] <= clock["ms"]:  # the commands that arrived since the last step
+            kind, value = pending.pop(0)[1]
+            if kind == "move":
+                axis.move_to(value)
+            else:
+                axis.set_velocity(value)
+        axis.update(period_ms / 1000)
+        positions.append(axis.position)
+    return positions
+
+
+def describe_motion(positions, period, target=None):
+    velocities = [(b - a) / period for a, b in zip([90.0] + positions, positions)]
+    accelerations = [(b - a) / period for a, b in zip([0.0] + velocities, velocities)]
+    moving = [index for index, velocity in enumerate(velocities) if velocity != 0]
+    settled = (moving[-1] + 1) * period if moving else 0.0
+    overshoot = ""
+    if target is not None:
+        beyond = max((position - target) * (1 if target >= 90 else -1) for position in positions)
+        overshoot = f", overshoot {max(beyond, 0.0):.2f}°"
+    return (f"stops at {positions[-1]:.2f}° after {settled:.2f} s, peak speed {max(map(abs, velocities)):.0f}°/s, "
+            f"peak acceleration {max(map(abs, accelerations)):.0f}°/s²{overshoot}")
+
+
+def run_motion(args):
+    print(f"limits: {args.max_velocity}°/s, {args.max_acceleration}°/s², step {args.period * 1000:.0f} ms")
+    for target in (150.0, 92.0, 0.0):
+        positions = simulate_motion(args, {0: ("move", target)}, seconds=2)
+        print(f"MOVE 90 -> {target:.0f}: " + describe_motion(positions, args.period, target))
+    positions = simulate_motion(args, {ms: ("vel", 60.0) for ms in range(0, 1000, 100)}, seconds=3)
+    print("VEL 60 every 100 ms for 1 s, then silence: " + describe_motion(positions, args.period))
+    positions = simulate_motion(args, {0: ("vel", 200.0)}, seconds=3)
+    print("a single VEL 200 (expires): " + describe_motion(positions, args.period))
+    positions = simulate_motion(args, {0: ("vel", -200.0), 300: ("move", 120.0)}, seconds=3)
+    print("VEL -200, MOVE 120 after 300 ms: " + describe_motion(positions, args.period, 120.0))
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description="Run the ESP32 firmware on the host with stub hardware modules")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="serve the firmware on a local port")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    stream_parser = commands.add_parser("stream", help="measure the MJPEG fan-out with several clients")
+    stream_parser.add_argument("--clients", type=int, default=3)
+    stream_parser.add_argument("--slow-clients", type=int, default=1)
+    stream_parser.add_argument("--slow-delay", type=float, default=0.05, help="pause of the slow clients per read (s)")
+    stream_parser.add_argument("--seconds", type=float, default=5)
+    stream_parser.add_argument("--fps", type=float, default=25, help="frame rate of the stub sensor")
+    stream_parser.add_argument("--frame-bytes", type=int, default=20000)
+    stream_parser.add_argument("--target-fps", type=int, default=0, help="frame rate cap of the firmware (0: none)")
+    heap_parser = commands.add_parser("heap", help="measure the heap allocated by the MJPEG send path per frame")
+    heap_parser.add_argument("--frames", type=int, default=200)
+    heap_parser.add_argument("--frame-bytes", type=int, default=20000)
+    websocket_parser = commands.add_parser("websocket", help="decode fragmented websocket streams and time it")
+    websocket_parser.add_argument("--frames", type=int, default=2000)
+    websocket_parser.add_argument("--seed", type=int, default=1)
+    latency_parser = commands.add_parser("latency", help="time commands while the video stream is running")
+    latency_parser.add_argument("--clients", type=int, default=3)
+    latency_parser.add_argument("--slow-clients", type=int, default=1)
+    latency_parser.add_argument("--slow-delay", type=float, default=0.05, help="pause of the slow clients per read (s)")
+    latency_parser.add_argument("--commands", type=int, default=200)
+    latency_parser.add_argument("--fps", type=float, default=25, help="frame rate of the stub sensor")
+    latency_parser.add_argument("--frame-bytes", type=int, default=20000)
+    burst_parser = commands.add_parser("burst", help="open many connections at once")
+    burst_parser.add_argument("--connections", type=int, default=20)
+    motion_parser = commands.add_parser("motion", help="run the servo motion planner on simulated time")
+    motion_parser.add_argument("--max-velocity", type=float, default=300.0, help="degrees per second")
+    motion_parser.add_argument("--max-acceleration", type=float, default=2000.0, help="degrees per second^2")
+    motion_parser.add_argument("--period", type=float, default=0.01, help="planner step (s)")
+    args = parser.parse_args(arguments)
+
+    if args.command == "serve":
+        import main as firmware
+        asyncio.run(firmware.serve(args.port))
+    elif args.command == "motion":
+        run_motion(args)
+    elif args.command == "latency":
+        run_latency(args)
+    elif args.command == "burst":
+        run_burst(args)
+    elif args.command == "websocket":
+        run_websocket(args)
+    elif args.command == "heap":
+        run_heap(args)
+    else:
+        run_stream(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+""" Stub of the MicroPython `machine` module for running the firmware on a host """
+
+
+class Pin:
+    OUT = 1
+    IN = 0
+
+    def __init__(self, pin_id, mode=None):
+        self.pin_id = pin_id
+        self._value = 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = value
+
+
+class PWM:
+
+    def __init__(self, pin):
+        self.pin = pin
+        self._freq = 0
+        self._duty_ns = 0
+
+    def freq(self, freq=None):
+        if freq is None:
+            return self._freq
+        self._freq = freq
+
+    def duty_ns(self, duty_ns=None):
+        if duty_ns is None:
+            return self._duty_ns
+        self._duty_ns = duty_ns
+
+
+def reset():
+    raise SystemExit("machine.reset()")
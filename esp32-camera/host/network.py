@@ -0,0 +1,22 @@
+""" Stub of the MicroPython `network` module for running the firmware on a host """
+
+AP_IF = 1
+STA_IF = 0
+
+
+class WLAN:
+
+    def __init__(self, interface):
+        self.interface = interface
+        self._active = False
+
+    def active(self, active=None):
+        if active is None:
+            return self._active
+        self._active = active
+
+    def config(self, **kwargs):
+        pass
+
+    def ifconfig(self):
+        return ("127.0.0.1", "255.255.255.0", "127.0.0.1", "127.0.0.1")
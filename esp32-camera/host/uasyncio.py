@@ -0,0 +1,5 @@
+"""
+Stand-in for MicroPython's `uasyncio` on CPython: the firmware only uses the part of the API the two have in common
+(`start_server`, stream readers/writers, `sleep`, `Event`, `run`).
+"""
+from asyncio import *  # noqa: F401,F403
@@ -1,20 +1,27 @@
 import hashlib
-import socket
 import time
-import _thread
 import struct
 import binascii
 
 import camera
 import network
+import uasyncio as asyncio
 
 from machine import Pin, PWM, reset
+from frame_streamer import FrameStreamer
 from servo import Servo
-# from smooth_servo import SmoothServo
+from smooth_servo import SmoothServo
+from ticks import ticks_diff, ticks_ms
+from websocket_decoder import FrameDecoder
 
 
 SSID = "SmartCam"
 PASSWORD = "securepassword"
+MAX_CONNECTIONS = 8  # connections served at once, more are turned away instead of exhausting the heap
+MAX_REQUEST = 2048  # bytes of request headers read
+MOTION_PERIOD = 0.01  # seconds between two steps of the servo motion planners
+
+connections = 0  # connections being served
 
 
 # setup camera flash
@@ -37,6 +44,7 @@ else:
     print('Timeout')
     reset()
 camera.framesize(10)
+streamer = FrameStreamer(camera)  # one capture loop shared by every /camera client
 
 # setup access point
 ap = network.WLAN(network.AP_IF)
@@ -49,52 +57,17 @@ print('IP address: ', ap.ifconfig()[0])
 # setup servos
 pan_servo = Servo(14)
 tilt_servo = Servo(15)
-pan_servo.write(90)
-tilt_servo.write(90)
-# pan_smooth_servo = SmoothServo(pan_servo)
-# tilt_smooth_servo = SmoothServo(tilt_servo)
-# _thread.start_new_thread(pan_smooth_servo.run, ())
-# _thread.start_new_thread(tilt_smooth_servo.run, ())
-
-
-def unmask_payload(mask, payload):
-    return bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
-
-
-def handle_binary_frame(data):
-    fin = (data[0] & 0b10000000) != 0
-    opcode = data[0] & 0b00001111
-    masked = (data[1] & 0b10000000) != 0
-    payload_len = data[1] & 0b01111111
-    mask_offset = 2
-
-    if payload_len == 126:
-        payload_len = struct.unpack(">H", data[2:4])[0]
-        mask_offset = 4
-    elif payload_len == 127:
-        payload_len = struct.unpack(">Q", data[2:10])[0]
-        mask_offset = 10
-
-    if masked:
-        mask = data[mask_offset:mask_offset + 4]
-        mask_offset += 4
-        payload = data[mask_offset:mask_offset + payload_len]
-        payload = unmask_payload(mask, payload)
-    else:
-        payload = data[mask_offset:mask_offset + payload_len]
-
-    decoded_data = None
-    if opcode == 1:  # Text frame
-        decoded_data = payload.decode('utf-8')
-    return opcode, decoded_data
+pan_smooth_servo = SmoothServo(pan_servo, position=90)
+tilt_smooth_servo = SmoothServo(tilt_servo, position=90)
 
 
-def send_websocket_message(client, message):
-    encoded_data = message.encode('utf-8')
+async def send_websocket_message(writer, message, opcode=1):
+    # text messages are str (opcode 1), binary messages bytes (opcode 2)
+    encoded_data = message.encode('utf-8') if opcode == 1 else message
     message_len = len(encoded_data)
     header = bytearray()
 
-    header.append(0b10000001)  # FIN bit set and Opcode for text frame
+    header.append(0b10000000 | opcode)  # FIN bit set and Opcode
 
     if message_len < 126:
         header.append(message_len)
@@ -105,80 +78,242 @@ def send_websocket_message(client, message):
         header.append(127)
         header.extend(struct.pack('>Q', message_len))
 
-    client.send(header + encoded_data)
+    writer.write(header)
+    writer.write(encoded_data)
+    await writer.drain()
 
 
-def handle_websocket(client, addr):
-    print("Websocket established with " + str(addr))
+def set_flash(state):
+    cam_flash.value(1 if state else 0)
+
+
+def set_frame_size(frame_size_key):
+    # https://github.com/shariltumin/esp32-cam-micropython-2022/blob/main/firmwares-20230717/Note.md
+    if 1 <= frame_size_key <= 18:
+        camera.framesize(frame_size_key)
+        return True
+    return False
+
+
+def set_quality(quality):
+    # JPEG quality of the sensor, 10 (best) - 63 (smallest frames)
+    if 10 <= quality <= 63:
+        camera.quality(quality)
+        return True
+    return False
+
+
+def move(pan_value, tilt_value):
+    pan_smooth_servo.move_to(pan_value)
+    tilt_smooth_servo.move_to(tilt_value)
+
+
+def set_velocity(pan_velocity, tilt_velocity):
+    pan_smooth_servo.set_velocity(pan_velocity)
+    tilt_smooth_servo.set_velocity(tilt_velocity)
+
+
+def set_motion_limits(max_velocity, max_acceleration):
+    # max_velocity 0 turns the planners off (MOVE goes straight to the target)
+    if 0 <= max_velocity <= 1000 and 0 < max_acceleration <= 100000:
+        pan_smooth_servo.set_limits(max_velocity, max_acceleration)
+        tilt_smooth_servo.set_limits(max_velocity, max_acceleration)
+        return True
+    return False
+
+
+async def run_motion():
+    # step both motion planners every MOTION_PERIOD seconds
+    last = ticks_ms()
     while True:
-        try:
-            data = client.recv(1024)
-            if not data:
-                continue
-            opcode, decoded_data = handle_binary_frame(data)
-            if opcode == 8:
-                print(str(addr) + " disconnected")
-            elif opcode != 1:  # https://www.apollographql.com/docs/ios/v0-legacy/api/ApolloWebSocket/enums/WebSocket.OpCode/
-                print("Unknown websocket opcode: " + str(opcode))
-            if not decoded_data:
-                break
-            print("received: '" + decoded_data + "'")
-            parsed = decoded_data.split()
-            cmd = parsed[0].upper()
-            arg_count = len(parsed) - 1
-            msg = "success"
-
-            if cmd == "PING" and arg_count == 0:
-                msg = "PONG"
-
-            elif cmd == "FLASH" and arg_count == 1:
-                flash_toggle = parsed[1].lower()
-                if flash_toggle == "on":
-                    cam_flash.value(1)
-                elif flash_toggle == "off":
-                    cam_flash.value(0)
-                else:
-                    msg = "ERROR: Unknown Flash argument - " + flash_toggle
-
-            elif cmd == "FRAMESIZE" and arg_count == 1:
-                # https://github.com/shariltumin/esp32-cam-micropython-2022/blob/main/firmwares-20230717/Note.md
-                frame_size_key = int(parsed[1])
-                if 1 <= frame_size_key <= 18:
-                    camera.framesize(frame_size_key)
-                else:
-                    msg = "ERROR: Unknown Camera Frame Size - " + str(frame_size_key)
-
-            elif cmd == "MOVE" and arg_count == 2:
-                pan_value = float(parsed[1])
-                tilt_value = float(parsed[2])
-                pan_servo.write(pan_value)
-                tilt_servo.write(tilt_value)
-                # pan_smooth_servo.target = pan_value
-                # tilt_smooth_servo.target = tilt_value
-            else:
-                msg = "ERROR: Unknown Command - " + cmd + " (with " + str(arg_count) + " arguments)"
-            send_websocket_message(client, msg)
-
-        except OSError as e:
-            print("WebSocket OSError:", e)
-            break
-    client.close()
+        await asyncio.sleep(MOTION_PERIOD)
+        now = ticks_ms()
+        dt = ticks_diff(now, last) / 1000
+        last = now
+        pan_smooth_servo.update(dt)
+        tilt_smooth_servo.update(dt)
+
+
+def handle_command(decoded_data):
+    parsed = decoded_data.split()
+    cmd = parsed[0].upper()
+    arg_count = len(parsed) - 1
+    msg = "success"
+
+    if cmd == "PING" and arg_count == 0:
+        msg = "PONG"
+
+    elif cmd == "FLASH" and arg_count == 1:
+        flash_toggle = parsed[1].lower()
+        if flash_toggle == "on":
+            set_flash(True)
+        elif flash_toggle == "off":
+            set_flash(False)
+        else:
+            msg = "ERROR: Unknown Flash argument - " + flash_toggle
+
+    elif cmd == "FRAMESIZE" and arg_count == 1:
+        frame_size_key = int(parsed[1])
+        if not set_frame_size(frame_size_key):
+            msg = "ERROR: Unknown Camera Frame Size - " + str(frame_size_key)
+
+    elif cmd == "MOVE" and arg_count == 2:
+        move(float(parsed[1]), float(parsed[2]))
+
+    elif cmd == "VEL" and arg_count == 2:
+        set_velocity(float(parsed[1]), float(parsed[2]))
+
+    elif cmd == "MOTION" and arg_count == 2:
+        if not set_motion_limits(float(parsed[1]), float(parsed[2])):
+            msg = "ERROR: Invalid Motion Limits - " + parsed[1] + " " + parsed[2]
+
+    elif cmd == "POS" and arg_count == 0:
+        msg = "{:.2f} {:.2f}".format(pan_smooth_servo.position, tilt_smooth_servo.position)
+
+    elif cmd == "QUALITY" and arg_count == 1:
+        quality = int(parsed[1])
+        if not set_quality(quality):
+            msg = "ERROR: Invalid JPEG Quality - " + str(quality)
+
+    elif cmd == "FPS" and arg_count == 1:
+        fps = int(parsed[1])
+        if not streamer.set_target_fps(fps):
+            msg = "ERROR: Invalid Frame Rate - " + str(fps)
+
+    elif cmd == "PROTOCOL" and arg_count == 1:
+        # the dashboard asks whether binary commands are understood, text commands always are
+        if parsed[1].lower() not in ("binary", "text"):
+            msg = "ERROR: Unknown Protocol - " + parsed[1]
+    else:
+        msg = "ERROR: Unknown Command - " + cmd + " (with " + str(arg_count) + " arguments)"
+    return msg
+
+
+def handle_tagged_command(decoded_data):
+    # commands may start with a sequence ID ("#12 MOVE 90 90"), which is echoed in the reply ("#12 success")
+    # so the dashboard can have several commands in flight
+    tag = None
+    if decoded_data.startswith("#"):
+        tag, _, decoded_data = decoded_data.partition(" ")
+    try:
+        msg = handle_command(decoded_data)
+    except (ValueError, IndexError) as e:
+        msg = "ERROR: Invalid Command - " + str(e)
+    if tag is not None:
+        msg = tag + " " + msg
+    return msg
+
+
+# binary commands (websocket opcode 2), see dashboard-app/core/binary_protocol.py
+BINARY_REQUEST = ">BHHH"  # command, sequence ID, argument 1, argument 2
+BINARY_REQUEST_SIZE = 7
+BINARY_REPLY = ">BHB"  # command | 0x80, sequence ID, status
+CMD_PING = 0x01
+CMD_FLASH = 0x02
+CMD_FRAMESIZE = 0x03
+CMD_MOVE = 0x04
+CMD_QUALITY = 0x05
+CMD_FPS = 0x06
+CMD_VEL = 0x07
+STATUS_OK = 0
+STATUS_UNKNOWN_COMMAND = 1
+STATUS_INVALID_ARGUMENT = 2
+
+
+def to_signed(value):
+    # 16 bit two's complement
+    return value - 0x10000 if value & 0x8000 else value
+
+
+def handle_binary_command(payload):
+    if len(payload) != BINARY_REQUEST_SIZE:
+        return None
+    cmd, sequence_id, arg1, arg2 = struct.unpack(BINARY_REQUEST, payload)
+    status = STATUS_OK
+    if cmd == CMD_PING:
+        pass
+    elif cmd == CMD_FLASH:
+        set_flash(arg1)
+    elif cmd == CMD_FRAMESIZE:
+        if not set_frame_size(arg1):
+            status = STATUS_INVALID_ARGUMENT
+    elif cmd == CMD_MOVE:
+        if arg1 > 18000 or arg2 > 18000:
+            status = STATUS_INVALID_ARGUMENT
+        else:
+            move(arg1 / 100, arg2 / 100)  # centidegrees
+    elif cmd == CMD_QUALITY:
+        if not set_quality(arg1):
+            status = STATUS_INVALID_ARGUMENT
+    elif cmd == CMD_FPS:
+        if not streamer.set_target_fps(arg1):
+            status = STATUS_INVALID_ARGUMENT
+    elif cmd == CMD_VEL:
+        set_velocity(to_signed(arg1) / 10, to_signed(arg2) / 10)  # signed decidegrees per second
+    else:
+        status = STATUS_UNKNOWN_COMMAND
+    return struct.pack(BINARY_REPLY, cmd | 0x80, sequence_id, status)
+
+
+async def handle_websocket(reader, writer, addr):
+    print("Websocket established with " + str(addr))
+    decoder = FrameDecoder()  # copes with frames split over reads and several frames in one read
+    try:
+        while await decoder.receive(reader) > 0:
+            while True:
+                frame = decoder.next_frame()
+                if frame is None:
+                    break
+                opcode, payload = frame
+                if opcode == 2:
+                    reply = handle_binary_command(payload)
+                    if reply is not None:
+                        await send_websocket_message(writer, reply, opcode=2)
+                    continue
+                if opcode == 9:  # ping
+                    await send_websocket_message(writer, bytes(payload), opcode=10)
+                    continue
+                if opcode == 8:
+                    print(str(addr) + " disconnected")
+                    return
+                if opcode != 1:  # https://www.apollographql.com/docs/ios/v0-legacy/api/ApolloWebSocket/enums/WebSocket.OpCode/
+                    print("Unknown websocket opcode: " + str(opcode))
+                    return
+                decoded_data = str(payload, 'utf-8')
+                print("received: '" + decoded_data + "'")
+                await send_websocket_message(writer, handle_tagged_command(decoded_data))
+    except ValueError as e:  # a frame above the size limit
+        print("WebSocket Error:", e)
 
 
 def base64_encode(data):
     return binascii.b2a_base64(data, newline=False).decode('utf-8')
 
 
-def handle_request(client, addr):
+async def read_request(reader):
+    # the request line and headers, up to the empty line (at most MAX_REQUEST bytes of them)
+    request = b""
+    while True:
+        line = await reader.readline()
+        request += line
+        if line in (b"\r\n", b"\n", b"") or len(request) > MAX_REQUEST:
+            return request.decode('utf-8')
+
+
+async def handle_request(reader, writer):
+    global connections
+    addr = writer.get_extra_info('peername')
     print("New request from " + str(addr))
+    connections += 1
     try:
-        request = client.recv(1024)
-        request = request.decode('utf-8')
+        if connections > MAX_CONNECTIONS:
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\n\r\n")
+            await writer.drain()
+            return
+        request = await read_request(reader)
         if 'GET /camera' in request:
-            client.send(b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace;boundary=frame\r\n\r\n")
-            while True:
-                frame = camera.capture()
-                client.send(b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: multipart/x-mixed-replace;boundary=frame\r\n\r\n")
+            await streamer.stream(writer)
         elif 'Upgrade: websocket' in request:
             websocket_key = None
             for line in request.split('\r\n'):
@@ -194,28 +329,36 @@ def handle_request(client, addr):
                     "Sec-WebSocket-Accept: " + response_key + "\r\n"
                     "\r\n"
                 )
-                client.send(response.encode('utf-8'))
-                handle_websocket(client, addr)
+                writer.write(response.encode('utf-8'))
+                await writer.drain()
+                await handle_websocket(reader, writer, addr)
         else:
-            client.send("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<!doctype html><html><body><img src=\"/stream\"></body></html>")
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n<!doctype html><html><body><img src=\"/camera\"></body></html>")
+            await writer.drain()
     except OSError as e:
-        if e.args[0] == 104:
+        if e.args and e.args[0] == 104:
             print("Connection reset by peer")
         else:
             print("Unexpected OSError:" + str(e))
     except UnicodeError as e:
         print("Unicode Error: " + str(e))
-    client.close()
+    finally:
+        connections -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
 
 
-# Listen for connections
-addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-s = socket.socket()
-s.bind(addr)
-s.listen(5)
-print('Listening for connections on', addr)
-flash()
+async def serve(port=80):
+    # every connection is a coroutine on one event loop, only the camera capture has its own thread
+    asyncio.create_task(run_motion())
+    await asyncio.start_server(handle_request, '0.0.0.0', port, backlog=5)
+    print('Listening for connections on port', port)
+    flash()
+    await asyncio.Event().wait()  # serve forever
+
 
-while True:
-    client, addr = s.accept()
-    _thread.start_new_thread(handle_request, (client, addr))
+if __name__ == "__main__":
+    asyncio.run(serve())
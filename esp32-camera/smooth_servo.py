@@ -1,40 +1,92 @@
-import utime
 import math
 
+from ticks import ticks_diff, ticks_ms
 
-def ease_in_out_sine(x, start, end, duration):
-    return -(end - start) / 2 * (math.cos(math.pi * x / duration) - 1) + start
 
+class SmoothServo:
+    """
+    Motion planner for one servo axis, advanced by `update(dt)` from a periodic task.
 
-def float_range(start, end, num_steps):
-    step = (end - start) / (num_steps - 1)
-    return [ease_in_out_sine(i * step + start, start, end, num_steps * step) for i in range(num_steps)]
+    The axis either heads for an absolute target (`move_to`, the MOVE command) or turns at a commanded speed
+    (`set_velocity`, the VEL command). Either way its speed stays below `max_velocity` and changes by at most
+    `max_acceleration` per second, so every move eases in and out: it speeds up, cruises and brakes in time to stop on
+    the target. A velocity expires after VELOCITY_TIMEOUT, so the axis comes to a stop when the host goes quiet.
+    With `max_velocity` 0 the planner is off and a target is written to the servo right away.
+    """
 
+    VELOCITY_TIMEOUT = 500  # ms without a new velocity before the axis stops
+    SETTLE = 0.05  # degrees from the target that count as arrived
 
-class SmoothServo:
+    def __init__(self, servo, position=90.0, max_velocity=300.0, max_acceleration=2000.0, min_deg=0.0, max_deg=180.0):
+        self.servo = servo
+        self.min_deg = min_deg
+        self.max_deg = max_deg
+        self.max_velocity = max_velocity  # degrees per second
+        self.max_acceleration = max_acceleration  # degrees per second^2
+        self.position = position  # degrees, as last written to the servo
+        self.velocity = 0.0  # degrees per second
+        self.target = position
+        self.command_velocity = None  # degrees per second while following a VEL command, None while heading for target
+        self.velocity_time = 0  # ticks_ms of the last VEL command
+        self.servo.write(position)
 
-    NUMBER_OF_STEPS = 100
+    def _clamp(self, degree):
+        return min(max(degree, self.min_deg), self.max_deg)
 
-    def __init__(self, servo):
-        self.servo = servo
-        self.target = None
-
-    def _degree_2_rad(self, degree):
-        rad = math.radians(degree)
-        us = rad * self.servo._slope + self.servo._offset
-        return us
-
-    def run(self):
-        while True:
-            if not self.target:
-                utime.sleep_ms(100)
-                continue
-            target_us = self._degree_2_rad(self.target)
-            self.target = None
-            for us in float_range(self.servo.read_us(), target_us, self.NUMBER_OF_STEPS):
-                self.servo.write_us(us)
-                if self.target:
-                    break
-                utime.sleep_ms(1)
-            if not self.target:
-                self.servo.write_us(target_us)
+    def _write(self, position):
+        if position != self.position:
+            self.position = position
+            self.servo.write(position)
+
+    def move_to(self, target):
+        self.target = self._clamp(target)
+        self.command_velocity = None
+        if self.max_velocity <= 0:  # planner off
+            self.velocity = 0.0
+            self._write(self.target)
+
+    def set_velocity(self, velocity):
+        self.command_velocity = min(max(velocity, -self.max_velocity), self.max_velocity)
+        self.velocity_time = ticks_ms()
+
+    def _braking_velocity(self, distance, dt):
+        # the fastest speed from which the axis, slowing down by max_acceleration * dt per step, stops within distance
+        step = self.max_acceleration * dt
+        return min(step * (math.sqrt(2 * distance / (step * dt) + 0.25) - 0.5), self.max_velocity)
+
+    def set_limits(self, max_velocity, max_acceleration):
+        self.max_velocity = max_velocity
+        self.max_acceleration = max_acceleration
+
+    def update(self, dt):
+        # advance the axis by `dt` seconds
+        if dt <= 0:
+            return
+        if self.command_velocity is not None:
+            if self.command_velocity != 0 and ticks_diff(ticks_ms(), self.velocity_time) > self.VELOCITY_TIMEOUT:
+                self.command_velocity = 0.0
+            desired = self.command_velocity
+            if desired > 0:  # brake before the end stop
+                desired = min(desired, self._braking_velocity(self.max_deg - self.position, dt))
+            elif desired < 0:
+                desired = max(desired, -self._braking_velocity(self.position - self.min_deg, dt))
+        else:
+            error = self.target - self.position
+            if abs(error) < self.SETTLE and abs(self.velocity) <= self.max_acceleration * dt:
+                self.velocity = 0.0
+                self._write(self.target)
+                return
+            desired = self._braking_velocity(abs(error), dt)
+            if error < 0:
+                desired = -desired
+        max_change = self.max_acceleration * dt
+        self.velocity += min(max(desired - self.velocity, -max_change), max_change)
+        position = self.position + self.velocity * dt
+        if self.command_velocity is None and (self.target - position) * (self.target - self.position) < 0:
+            position, self.velocity = self.target, 0.0  # it would overshoot
+        if position != self._clamp(position):  # ran into the end stop
+            position, self.velocity = self._clamp(position), 0.0
+        if self.command_velocity == 0 and self.velocity == 0:  # stopped after a velocity command, hold here
+            self.command_velocity = None
+            self.target = position
+        self._write(position)
@@ -0,0 +1,14 @@
+# millisecond ticks of MicroPython's `time`, emulated on CPython (host harness)
+import time
+
+try:
+    from time import ticks_add, ticks_diff, ticks_ms
+except ImportError:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(ticks1, ticks2):
+        return ticks1 - ticks2
@@ -0,0 +1,111 @@
+import struct
+
+
+try:
+    import micropython
+
+    @micropython.viper
+    def unmask(buf, start: int, end: int, mask: ptr8):
+        # XOR buf[start:end] in place with the 4 byte mask, a word at a time where the buffer is word aligned
+        data = ptr8(buf)
+        words = ptr32(buf)
+        i = start
+        while i < end and (i & 3) != 0:
+            data[i] = data[i] ^ mask[(i - start) & 3]
+            i += 1
+        if i + 4 <= end:
+            k = i - start
+            word = mask[k & 3] | (mask[(k + 1) & 3] << 8) | (mask[(k + 2) & 3] << 16) | (mask[(k + 3) & 3] << 24)
+            while i + 4 <= end:
+                words[i >> 2] = words[i >> 2] ^ word
+                i += 4
+        while i < end:
+            data[i] = data[i] ^ mask[(i - start) & 3]
+            i += 1
+except ImportError:  # CPython (host harness)
+    def unmask(buf, start, end, mask):
+        # XOR buf[start:end] in place with the 4 byte mask, as one big integer
+        length = end - start
+        key = int.from_bytes((bytes(mask) * (length // 4 + 1))[:length], "little")
+        buf[start:end] = (int.from_bytes(buf[start:end], "little") ^ key).to_bytes(length, "little")
+
+
+class FrameDecoder:
+    """
+    Incremental websocket frame decoder on one preallocated receive buffer.
+
+    Reads may end in the middle of a frame or hold several frames: `receive(reader)` appends whatever arrived and
+    `next_frame()` returns the complete frames one by one. A frame larger than the buffer grows it, up to
+    `max_payload`. Payloads are unmasked in place and returned as memoryviews into the buffer, so they are only valid
+    until the next `receive()` or `next_frame()`.
+    """
+
+    def __init__(self, size=2048, max_payload=16384):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.max_payload = max_payload
+        self.start = 0  # first byte that isn't decoded yet
+        self.end = 0  # end of the received bytes
+
+    def _make_room(self, needed):
+        # move the undecoded bytes to the front (and grow the buffer) so `needed` bytes fit after them
+        pending = self.end - self.start
+        if self.start > 0 and (pending == 0 or len(self.buffer) - self.end < needed):
+            if pending > 0:
+                self.view[:pending] = bytes(self.view[self.start:self.end])
+            self.start, self.end = 0, pending
+        if len(self.buffer) < pending + needed:
+            buffer = bytearray(pending + needed)
+            buffer[:pending] = self.view[:pending]
+            self.buffer, self.view = buffer, memoryview(buffer)
+
+    async def receive(self, reader):
+        # read what the stream has into the buffer, returns the number of bytes (0 when the peer closed)
+        self._make_room(1)
+        free = self.view[self.end:]
+        if hasattr(reader, "readinto"):  # uasyncio streams read straight into the buffer
+            count = await reader.readinto(free)
+        else:
+            data = await reader.read(len(free))
+            count = len(data)
+            free[:count] = data
+        self.end += count
+        return count
+
+    def feed(self, data):
+        self._make_room(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def next_frame(self):
+        # the next complete frame as (opcode, payload), None until more bytes arrived
+        available = self.end - self.start
+        if available < 2:
+            return None
+        first, second = self.buffer[self.start], self.buffer[self.start + 1]
+        payload_len = second & 0x7F
+        header_len = 2
+        if payload_len == 126:
+            header_len = 4
+            if available < header_len:
+                return None
+            payload_len = struct.unpack_from(">H", self.buffer, self.start + 2)[0]
+        elif payload_len == 127:
+            header_len = 10
+            if available < header_len:
+                return None
+            payload_len = struct.unpack_from(">Q", self.buffer, self.start + 2)[0]
+        if payload_len > self.max_payload:
+            raise ValueError("websocket frame of " + str(payload_len) + " bytes is too large")
+        masked = second & 0x80
+        if masked:
+            header_len += 4
+        if available < header_len + payload_len:
+            self._make_room(header_len + payload_len - available)  # a large frame grows the buffer
+            return None
+        payload_start = self.start + header_len
+        payload_end = payload_start + payload_len
+        if masked:
+            unmask(self.buffer, payload_start, payload_end, self.view[payload_start - 4:payload_start])
+        self.start = payload_end
+        return first & 0x0F, self.view[payload_start:payload_end]